@@ -1,5 +1,16 @@
-from main.main import main
+import sys
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    if sys.argv[1:2] == ['bench']:
+        from main.bench import main
+        main(sys.argv[2:])
+    elif sys.argv[1:2] == ['bank']:
+        from main.bank import main
+        main(sys.argv[2:])
+    elif sys.argv[1:2] == ['serve']:
+        from main.serve import main
+        main(sys.argv[2:])
+    else:
+        from main.main import main
+        main()
@@ -0,0 +1,951 @@
+import dataclasses
+import datetime
+import functools
+import json
+import math
+import os
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+import threading
+from concurrent.futures import as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from main.constants import SOFTWARE_VER, SOFTWARE_NAME, TMP_DIR, OUTPUT_DIR, ALLOWED_EXTENSIONS, SAMPLE_RATE, PROBE_CACHE_PTH, TARGET_PEAK
+from main.gain import plan_volume, predict_levels
+from main.graph import build_filter_complex, loop_filter_complex
+from main.instrument import Instrument
+from main.pool import ProcessPool, RenderError
+from main.seed import layer_seeds, new_master_seed
+from main.utils import printer, validate_filename
+
+## NumPy (and the modules built on it) is imported where it's needed, so a plain `graph` render starts faster
+if TYPE_CHECKING:
+    import numpy as np
+
+
+COLORS = ('white', 'pink', 'brown', 'blue', 'violet', 'velvet')
+ENGINES = ('graph', 'files', 'numpy', 'bank')
+LAYOUTS = {  # ffmpeg channel layout -> channel names; any other number of channels is written `<n>c`
+    'mono': ('mono',),
+    'stereo': ('left', 'right'),
+    '2.1': ('FL', 'FR', 'LFE'),
+    'quad': ('FL', 'FR', 'BL', 'BR'),
+    '5.0': ('FL', 'FR', 'FC', 'BL', 'BR'),
+    '5.1': ('FL', 'FR', 'FC', 'LFE', 'BL', 'BR'),
+    '7.1': ('FL', 'FR', 'FC', 'LFE', 'BL', 'BR', 'SL', 'SR'),
+}
+MAX_CHANNELS = 64  # ffmpeg's limit for `amerge`
+PIPED_LAYERS = os.name == 'posix'  # ffmpeg can read extra pipes (`pass_fds`) only there; elsewhere the `files` engine layers go through scratch files
+
+
+def _patterns_valid(dyn_vol, nchannel: int) -> bool:
+    """Whether `dyn_vol` holds one volume pattern per channel (a `dict` each)."""
+    return isinstance(dyn_vol, (list, tuple)) and (len(dyn_vol) == nchannel) and all(isinstance(pat, dict) for pat in dyn_vol)
+
+
+@dataclass
+class NoiseSpec:
+    """
+    Everything needed to render one noise track; the fields mirror the command-line options.
+    Unset fields (`volume`, `target_peak`, `seed`, `jobs`, `output_name`) are filled in by `resolve`.
+
+    ---
+
+    ## Demo
+        >>> spec = NoiseSpec(duration=600, color='pink', nlayer=12, seed=42, output_ext='.flac')
+        >>> pth = generate(spec)
+        >>> spec = NoiseSpec(duration=600, output_ext=['.m4a', '.mp3:192', '.opus:128', '.flac'])  # the same audio in 4 files
+    """
+
+    ## Audio-related
+    duration: float = 60
+    color: str = 'brown'
+    nlayer: int = 7
+    highpass: int = 20
+    lowpass: int = 432
+    volume: Optional[float] = None  # default: planned for `target_lufs` or `target_peak` by `main.gain.plan_volume`
+    target_peak: Optional[float] = None  # dBFS, the sample peak the mix should stay below; default: `TARGET_PEAK` unless `target_lufs` is set
+    target_lufs: Optional[float] = None  # the integrated loudness (BS.1770) of the mix, instead of a peak
+    gain_probe: Optional[float] = None  # measure the level of the first seconds of the render (this many) for the plan
+    stereo: bool = True
+    channels: Optional[str] = None  # a channel layout of `LAYOUTS` or a number of channels, each with its own layers; default: from `stereo`
+    dyn_vol: Optional[List[dict]] = None  # one volume pattern per channel, see `main.envelope.pattern` (`points` are filled in by `resolve`)
+    normalize: bool = False
+    seed: Optional[int] = None  # default: random
+    tile: Optional[float] = None  # render a seamless loop this long (seconds) and repeat it up to `duration`; default: render every second
+    segment: Optional[float] = None  # `numpy`/`bank` engines: checkpoint the synthesis every this many seconds, see `main.checkpoint`
+    bitrate: int = 256
+
+    ## Output
+    output_dir: Optional[str] = None  # default: `OUTPUT_DIR`
+    output_name: Optional[str] = None  # default: derived from the parameters and the current time
+    output_ext: Union[str, Sequence[str]] = '.m4a'  # one or more extensions (a list, or separated by spaces), each with an optional `:<bitrate>`
+
+    ## Misc
+    engine: str = 'graph'
+    multirate: bool = False  # `numpy` engine: synthesize at the lowest sample rate the band allows, resampled once by ffmpeg
+    bank_dir: Optional[str] = None  # `bank` engine: the noise bank the layers are taken from, see `main.bank.NoiseBank`
+    jobs: Optional[int] = None  # default: number of CPUs
+    tmp_dir: Optional[str] = None  # where each run creates its private scratch folder, default: `TMP_DIR`
+    cache_dir: Optional[str] = None
+    cache_max_bytes: int = 10*1024**3
+    ffmpeg: str = 'ffmpeg'
+
+    @property
+    def layout(self) -> str:
+        """The ffmpeg channel layout of the output."""
+        if self.channels is None:
+            return 'stereo' if self.stereo else 'mono'
+        layout = str(self.channels).lower()
+        if layout.isdigit():
+            layout = {'1': 'mono', '2': 'stereo'}.get(layout, f'{layout}c')
+        return layout
+
+    @property
+    def nchannel(self) -> int:
+        if self.layout in LAYOUTS:
+            return len(LAYOUTS[self.layout])
+        return int(self.layout[:-1]) if self.layout[:-1].isdigit() else 0  # 0: invalid, see `validate`
+
+    @property
+    def channel_names(self) -> List[str]:
+        return list(LAYOUTS.get(self.layout, [f'ch{ch + 1}' for ch in range(self.nchannel)]))
+
+    @property
+    def tiled(self) -> bool:
+        return (self.tile is not None) and (self.tile < self.duration)
+
+    @property
+    def outputs(self) -> List[Tuple[str, int]]:
+        """The `(extension, bitrate)` of every output file, e.g. `'.m4a .mp3:192'` -> `[('.m4a', 256), ('.mp3', 192)]`."""
+        items = self.output_ext.replace(',', ' ').split() if isinstance(self.output_ext, str) else self.output_ext
+        outputs = []
+        for item in items:
+            ext, _, bitrate = item.strip().lower().partition(':')
+            if bitrate and not bitrate.isdigit():
+                raise ValueError(f'Invalid bitrate in output extension {repr(item)}, expected e.g. ".mp3:192".')
+            outputs.append((ext, int(bitrate) if bitrate else self.bitrate))
+        return outputs
+
+    @property
+    def output_pths(self) -> List[str]:
+        return [os.path.join(self.output_dir or OUTPUT_DIR, self.output_name + ext) for ext, _ in self.outputs]
+
+    @property
+    def output_pth(self) -> str:
+        """The first output file."""
+        return self.output_pths[0]
+
+    @property
+    def checkpoint_dir(self) -> str:
+        """The folder keeping the journal and the finished segments of a checkpointed render until it's complete."""
+        return os.path.join(self.tmp_dir or TMP_DIR, f'{SOFTWARE_NAME}-checkpoint-{self.output_name}')
+
+    def resolve(self) -> 'NoiseSpec':
+        """Returns a copy with every unset field filled in, so the copy always renders the same audio."""
+        seed = new_master_seed() if self.seed is None else self.seed
+        dyn_vol = self.dyn_vol
+        if _patterns_valid(dyn_vol, self.nchannel):  # otherwise `validate` reports it
+            from main.envelope import resolve_patterns
+            dyn_vol = resolve_patterns(self.duration, seed, dyn_vol)
+
+        ## the volume is planned from the statistics of the noise, so the target level needs no extra pass over the audio
+        volume = self.volume
+        target_peak = self.target_peak
+        if volume is None:
+            if (target_peak is None) and (self.target_lufs is None):
+                target_peak = TARGET_PEAK
+            planned = dataclasses.replace(self, seed=seed, dyn_vol=dyn_vol, target_peak=target_peak)
+            try:
+                planned.validate(output=False)  # the plan assumes a renderable spec
+            except ValueError:  # reported by `validate` on the resolved spec
+                volume = 1
+            else:
+                volume = plan_volume(planned)
+        output_name = self.output_name
+        if output_name is None:
+            ## what the user chose: the volume, or the level a planned volume aims for (the gain itself goes in the metadata)
+            if self.volume is not None:
+                level = f'{volume}x'
+            elif self.target_lufs is not None:
+                level = f'{self.target_lufs:g}LUFS'
+            else:
+                level = f'{target_peak:g}dBFS'
+            output_name = (
+                f'noise-{self.color.lower()} ({self.nlayer}-layer {self.highpass}-{self.lowpass}hz {level}) '
+                + datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+            )
+        else:
+            output_name = validate_filename(output_name)
+        return dataclasses.replace(
+            self,
+            color=self.color.lower(),
+            volume=volume,
+            target_peak=target_peak,
+            dyn_vol=dyn_vol,
+            seed=seed,
+            jobs=(os.cpu_count() or 1) if self.jobs is None else self.jobs,
+            output_name=output_name,
+            output_ext=(self.output_ext.lower() if isinstance(self.output_ext, str) else [ext.lower() for ext in self.output_ext]),
+        )
+
+    def validate(self, output: bool = True) -> List[str]:
+        """
+        Checks the spec, raising `ValueError` if it can't be rendered.
+
+        ---
+
+        ## Params
+            - `output`: also check the output path (not needed for `generate_pcm`)
+
+        ## Returns
+            - `List[str]`: warnings about settings that work but are probably unintended
+        """
+        warnings = []
+
+        if self.duration <= 0:
+            raise ValueError('Duration should be greater than 0.')
+        elif (self.duration > 3600) and (self.engine == 'files'):
+            warnings.append('Duration longer than 1 hour may increase processing time and require significant storage space.')
+
+        if self.tile is not None:
+            if self.tile < 1:
+                raise ValueError('Tile length must be at least 1 second.')
+            elif self.tile >= self.duration:
+                warnings.append('The tile is not shorter than the track, so the whole track is rendered.')
+
+        if self.segment is not None:
+            if self.segment < 1:
+                raise ValueError('Segment length must be at least 1 second.')
+            if self.engine not in ('numpy', 'bank'):
+                raise ValueError('Checkpointed segments need the numpy or bank engine.')
+            if self.tiled:
+                raise ValueError('Checkpointed segments and a looped tile can\'t be combined.')
+
+        if self.color.lower() not in COLORS:
+            raise ValueError(f'Invalid color "{self.color}". Available options are: {", ".join(COLORS)}.')
+
+        if self.nlayer < 2:
+            raise ValueError('Number of layers must be at least 2.')
+        elif self.nlayer > 20:
+            warnings.append('The specified number of layers is quite large and may result in longer processing time.')
+
+        if self.highpass < 20:
+            raise ValueError('Highpass frequency must be greater than or equal to 20 Hz.')
+        if self.lowpass > 20000:
+            raise ValueError('Lowpass frequency must be less than or equal to 20,000 Hz.')
+        if self.highpass >= self.lowpass:
+            raise ValueError('Highpass frequency must be less than lowpass frequency.')
+
+        if (self.volume is not None) and (self.volume <= 0):
+            raise ValueError('Volume must be greater than 0.')
+        if (self.target_peak is not None) and (self.target_peak > 0):
+            raise ValueError('Target peak must be at most 0 dBFS.')
+        if (self.target_lufs is not None) and (self.target_lufs >= 0):
+            raise ValueError('Target loudness must be below 0 LUFS.')
+        if (self.gain_probe is not None) and (self.gain_probe < 1):
+            raise ValueError('Gain probe must be at least 1 second.')
+
+        if not (self.layout in LAYOUTS or (self.layout[:-1].isdigit() and self.layout.endswith('c'))):
+            raise ValueError(f'Invalid channels {repr(self.channels)}. Use a number or one of: {", ".join(LAYOUTS)}.')
+        if not (1 <= self.nchannel <= MAX_CHANNELS):
+            raise ValueError(f'Number of channels must be between 1 and {MAX_CHANNELS}.')
+        if (self.nchannel > 2) and any(ext == '.mp3' for ext, _ in self.outputs):
+            warnings.append('MP3 holds at most 2 channels; ffmpeg will downmix the output.')
+
+        if self.dyn_vol is not None:
+            if not (isinstance(self.dyn_vol, (list, tuple)) and all(isinstance(pat, dict) for pat in self.dyn_vol)):
+                raise ValueError('Dynamic volume must be a list of patterns, one per channel.')
+            if len(self.dyn_vol) != self.nchannel:
+                raise ValueError(f'Expected {self.nchannel} dynamic volume patterns, got {len(self.dyn_vol)}.')
+
+        outputs = self.outputs
+        if len(outputs) == 0:
+            raise ValueError('At least one output extension is needed.')
+        if len({ext for ext, _ in outputs}) != len(outputs):
+            raise ValueError('Each output extension can only be listed once.')
+        for bitrate in {self.bitrate} | {bitrate for _, bitrate in outputs}:
+            if bitrate < 32:
+                raise ValueError('Bitrate is too low.')
+            elif bitrate > 320:
+                warnings.append('Bitrate is too high.')
+
+        if self.engine not in ENGINES:
+            raise ValueError(f'Invalid engine {repr(self.engine)}. Available options are: {", ".join(ENGINES)}.')
+        if self.multirate and (self.engine != 'numpy'):
+            raise ValueError('Multirate synthesis needs the numpy engine.')
+        if self.engine == 'bank':
+            if (self.bank_dir is None) or (not os.path.isdir(os.path.expanduser(self.bank_dir))):
+                raise ValueError(f'The bank engine needs an existing noise bank folder, got: {self.bank_dir}')
+            from main.bank import NoiseBank
+            from main.tile import crossfade_duration
+
+            seconds = (self.tile + crossfade_duration(self.tile)) if self.tiled else self.duration
+            needed = self.nchannel*self.nlayer
+            if NoiseBank(self.bank_dir).capacity(self.color.lower(), round(seconds*SAMPLE_RATE)) < needed:
+                raise ValueError(
+                    f'The noise bank holds too little {self.color.lower()} noise for {needed} separate {seconds:g}-second layers; '
+                    'add more with `bank build`.'
+                )
+        if self.volume is not None:
+            peak = predict_levels(self)['peak']
+            if peak > 0:
+                warnings.append(f'The specified volume may cause clipping (expected peak: {peak:+.1f} dBFS).')
+        if (self.jobs is not None) and (self.jobs < 1):
+            raise ValueError('Number of jobs must be at least 1.')
+        if self.cache_max_bytes < 0:
+            raise ValueError('Cache size budget must not be negative.')
+        if (self.tmp_dir is not None) and (not os.path.isdir(self.tmp_dir)):
+            raise ValueError(f'The specified scratch directory path is not valid: {self.tmp_dir}')
+
+        if output:
+            if (self.output_dir is not None) and (not os.path.isdir(self.output_dir)):
+                raise ValueError(f'The specified directory path is not valid: {self.output_dir}')
+            for ext, _ in outputs:
+                if ext not in ALLOWED_EXTENSIONS:
+                    raise ValueError(f'Invalid output extension: {repr(ext)}')
+            if self.output_name is not None:
+                for pth in self.output_pths:
+                    if os.path.exists(pth):
+                        raise ValueError(f'Output file conflict. Please try a different filename or file extension: {repr(pth)}')
+
+        return warnings
+
+
+REQUIRED_FILTERS = ('anoisesrc', 'amix', 'highpass', 'lowpass', 'volume')  # every render uses these
+
+
+@functools.lru_cache(maxsize=None)
+def probe_ffmpeg(ffmpeg: str, cache_pth: Optional[str] = PROBE_CACHE_PTH) -> dict:
+    """
+    Checks, once per process and binary, that `ffmpeg` can be run and has the filters a render needs.
+    What's learned is kept in `cache_pth` (`None` to skip it), keyed by the binary's resolved path, mtime and size,
+    so later runs don't spawn ffmpeg at all until the binary changes.
+    Raises `ValueError` for an invalid path or a build without a required filter,
+    and `FileNotFoundError` if the command can't be found.
+
+    ---
+
+    ## Returns
+        - `dict`: `path` (resolved), `version` (the first line of `ffmpeg -version`) and `filters` (names)
+    """
+    if ffmpeg != 'ffmpeg':
+        executable = os.access(ffmpeg, os.X_OK) or os.path.splitext(ffmpeg.lower())[1] == '.exe'
+        if not (os.path.isfile(ffmpeg) and executable):
+            raise ValueError('FFMPEG path is invalid or does not point to an ffmpeg executable.')
+    found = shutil.which(ffmpeg)
+    if found is None:
+        raise FileNotFoundError(f'ffmpeg not found or not a recognized command ({ffmpeg})')
+    real = os.path.realpath(found)
+    stat = os.stat(real)
+    key = f'{real}|{stat.st_mtime_ns}|{stat.st_size}'
+
+    entries = {}
+    if cache_pth is not None:
+        try:
+            with open(cache_pth) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+    info = entries.get(key) if isinstance(entries, dict) else None
+
+    if info is None:
+        try:
+            version = sp.run([found, '-version'], capture_output=True, text=True, errors='replace')
+            listing = sp.run([found, '-hide_banner', '-filters'], capture_output=True, text=True, errors='replace')
+        except OSError:
+            raise FileNotFoundError(f'ffmpeg not found or not a recognized command ({ffmpeg})')
+        ## e.g. ` ... anoisesrc         |->A       Generate a noise audio signal.`
+        filters = sorted(
+            fields[1] for fields in (line.split() for line in listing.stdout.splitlines())
+            if len(fields) >= 3 and '->' in fields[2]
+        )
+        info = {'path': real, 'version': (version.stdout.splitlines() or [''])[0], 'filters': filters}
+
+        if cache_pth is not None:
+            entries = {k: v for k, v in entries.items() if not k.startswith(real + '|')} if isinstance(entries, dict) else {}
+            entries[key] = info
+            try:
+                os.makedirs(os.path.dirname(cache_pth), exist_ok=True)
+                tmp_pth = f'{cache_pth}.{os.getpid()}.tmp'
+                with open(tmp_pth, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_pth, cache_pth)
+            except OSError:
+                pass  # the cache is only a shortcut
+
+    missing = [name for name in REQUIRED_FILTERS if name not in info['filters']]
+    if missing:
+        raise ValueError(f'{ffmpeg} lacks the required filters: {", ".join(missing)} ({info["version"]}).')
+    return info
+
+
+def _run_final(
+    cmd: List[str],
+    blocks: Optional[Iterable['np.ndarray']] = None,
+    capture: bool = False,
+    instrument: Optional[Instrument] = None,
+    stage: str = 'encode',
+    capture_bytes: int = 0,
+    pass_fds: Sequence[int] = (),
+) -> Optional[bytearray]:
+    """
+    Runs the last ffmpeg process of a pipeline, optionally feeding `blocks` of raw PCM to its stdin
+    and returning its stdout (read into a buffer of `capture_bytes`, grown if needed). Raises `RenderError` if it fails.
+    With an `instrument` that has sinks, ffmpeg's stats line is replaced by `-progress` reports of `stage`.
+    `pass_fds` (e.g. the read ends of pipes the command reads as `pipe:<fd>`) are handed to ffmpeg and closed here.
+    """
+    progress = (instrument is not None) and instrument.wants_progress
+    if progress:
+        cmd = [cmd[0], '-nostats', '-progress', 'pipe:2'] + [arg for arg in cmd[1:] if arg != '-stats']
+    try:
+        proc = sp.Popen(
+            cmd,
+            stdin=(sp.PIPE if blocks is not None else None),
+            stdout=(sp.PIPE if capture else None),
+            stderr=(sp.PIPE if progress else None),
+            pass_fds=pass_fds,
+        )
+    finally:
+        for fd in pass_fds:
+            os.close(fd)
+    feed_error = []
+
+    def feed():
+        try:
+            for block in blocks:
+                proc.stdin.write(block.data)
+        except BrokenPipeError:
+            pass  # reported via the exit status
+        except BaseException as e:
+            feed_error.append(e)
+            proc.kill()
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    out = None
+    feeder = None
+    reader = None
+    try:
+        if progress:  # the error messages are passed through
+            reader = threading.Thread(
+                target=instrument.read_progress, args=(stage, proc.stderr, lambda line: print(line, file=sys.stderr)), daemon=True
+            )
+            reader.start()
+        if blocks is not None:
+            if capture:  # both ends are pipes, so feeding runs alongside reading
+                feeder = threading.Thread(target=feed, daemon=True)
+                feeder.start()
+            else:
+                feed()
+        if capture:
+            out = _read_all(proc.stdout, capture_bytes)
+        proc.wait()
+    except BaseException:  # e.g. KeyboardInterrupt or SystemExit from a signal: don't leave the child behind
+        proc.kill()
+        proc.wait()
+        raise
+    if feeder is not None:
+        feeder.join()
+    if reader is not None:
+        reader.join()
+    if feed_error:
+        raise feed_error[0]
+    if proc.returncode != 0:
+        raise RenderError(f'ffmpeg exit status {proc.returncode}')
+    return out
+
+
+def _read_all(stream: BinaryIO, nbytes: int) -> bytearray:
+    """Reads `stream` until it closes, straight into one buffer of about `nbytes` (grown if too small), without a copy per read."""
+    buf = bytearray(max(nbytes, 2**16))
+    n = 0
+    while True:
+        if n == len(buf):
+            buf.extend(bytes(len(buf)//2))
+        with memoryview(buf) as view:
+            k = stream.readinto(view[n:])
+        if not k:
+            break
+        n += k
+    del buf[n:]
+    return buf
+
+
+def _dir_size(pth: str) -> int:
+    total = 0
+    for dirpth, _, filenames in os.walk(pth):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpth, filename))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _render(
+    spec: NoiseSpec,
+    outs: List[List[str]],
+    capture: bool,
+    log: Callable[[str], None],
+    instrument: Instrument,
+) -> Optional[bytes]:
+    """
+    Renders a resolved spec into the ffmpeg outputs described by `outs` (the arguments of each output),
+    all encoded from the same mix by the last ffmpeg process, timing its stages with `instrument`.
+    """
+
+    ffmpeg = spec.ffmpeg
+    nchannel = spec.nchannel
+    nlayer = spec.nlayer
+    capture_bytes = round(spec.duration*SAMPLE_RATE)*nchannel*4 if capture else 0  # as float32
+    seeds = layer_seeds(spec.seed, nchannel, nlayer)
+    norm_filter = ',dynaudnorm' if spec.normalize else ''
+
+    ## the dynamic volume is a gain curve multiplied into each channel, so `nchanges` has no upper limit
+    envelopes = [None] * nchannel
+    if spec.dyn_vol is not None:
+        envelopes = [pattern['points'] for pattern in spec.dyn_vol]
+
+    cache = None
+    if spec.cache_dir is not None:
+        from main.cache import Cache  # hashing is only needed with a cache
+
+        cache = Cache(spec.cache_dir, spec.cache_max_bytes)
+    if spec.engine == 'bank':
+        from main.bank import BankMix, NoiseBank
+
+    intermediate_file_pths = []
+    partial_pths = []  # cache entries being rendered
+
+    def output_cmd(graph: str, master_pth: Optional[str]) -> list:
+        """Output arguments for a filtergraph ending in `[out]`, split into every output, plus a lossless copy into `master_pth` if given."""
+        branches = [*outs] if master_pth is None else [*outs, ['-c:a', 'pcm_f32le', master_pth]]
+        if len(branches) == 1:
+            return ['-filter_complex', graph, '-map', '[out]', *branches[0]]
+        labels = [f'[o{i}]' for i in range(len(branches))]
+        cmd = ['-filter_complex', graph + f';[out]asplit={len(branches)}' + ''.join(labels)]
+        for label, branch in zip(labels, branches):
+            cmd += ['-map', label, *branch]
+        return cmd
+
+    ## the final mix (before encoding) is cached, so a re-encode with another extension or bitrate skips synthesis
+    master_key = None
+    master_tmp_pth = None
+    master_pth = None
+    if cache is not None:
+        master_key = Cache.key(
+            kind='master', version=SOFTWARE_VER, engine=spec.engine, duration=spec.duration, color=spec.color,
+            layout=spec.layout, seeds=seeds, highpass=spec.highpass, lowpass=spec.lowpass, volume=spec.volume,
+            dyn_vol=envelopes, normalize=spec.normalize, tile=(spec.tile if spec.tiled else None), multirate=spec.multirate,
+            bank=(NoiseBank(spec.bank_dir).digest(spec.color) if spec.engine == 'bank' else None)
+        )
+        master_pth = cache.get(master_key, '.wav')
+        if master_pth is None:
+            master_tmp_pth = cache.reserve(master_key, '.wav')
+            partial_pths.append(master_tmp_pth)
+
+    out = None
+    tmp_dir = None
+    try:
+
+        ## a private scratch folder per run, so concurrent runs never see each other's intermediate files
+        if (master_pth is None) and (spec.tiled or spec.engine == 'files' or (spec.engine == 'graph' and spec.dyn_vol is not None)):
+            tmp_dir = tempfile.mkdtemp(prefix=f'{SOFTWARE_NAME}-', dir=(spec.tmp_dir or TMP_DIR))
+
+        ## the gain curves are written once per distinct pattern, at a control rate (small even for hours)
+        envelope_pths = [None] * nchannel
+        if (tmp_dir is not None) and (spec.dyn_vol is not None):
+            from main.envelope import dedup, envelope_input, write_envelope
+            for ch, first in enumerate(dedup(spec.dyn_vol)):
+                if first == ch:
+                    envelope_pths[ch] = os.path.join(tmp_dir, f'envelope_{ch}.f32')
+                    write_envelope(envelope_pths[ch], envelopes[ch], spec.duration)
+                else:
+                    envelope_pths[ch] = envelope_pths[first]
+            instrument.lap('envelope')
+
+        def envelope_args(first: int) -> Tuple[List[str], List[Optional[int]]]:
+            """ffmpeg input arguments of the distinct gain curves, numbered from `first`, and the input index of each channel's curve."""
+            input_cmd = []
+            inputs = [None] * nchannel
+            for ch, pth in enumerate(envelope_pths):
+                if pth is None:
+                    continue
+                if pth in envelope_pths[:ch]:  # shared pattern
+                    inputs[ch] = inputs[envelope_pths.index(pth)]
+                else:
+                    inputs[ch] = first + len(set(envelope_pths[:ch]) - {None})
+                    input_cmd += envelope_input(pth)
+            return input_cmd, inputs
+
+        if master_pth is not None:
+
+            log(f'INFO: Encoding the cached mix: {master_pth}')
+            out = _run_final(
+                [ffmpeg, '-v', 'error', '-stats', '-i', master_pth, *[arg for out in outs for arg in ['-map', '0:a', *out]]],
+                capture=capture, capture_bytes=capture_bytes, instrument=instrument
+            )
+            instrument.lap('encode')
+
+        elif spec.tiled:
+
+            ## only the tile is synthesized (by the chosen engine); the gain curves and the normalization
+            ## still run over the whole track, so the repetition is hard to hear
+            from main.tile import crossfade_duration, make_seamless
+
+            tile_pth = os.path.join(tmp_dir, 'tile.f32')
+            tile_frames = round(spec.tile*SAMPLE_RATE)
+            tile_spec = dataclasses.replace(
+                spec, duration=spec.tile + crossfade_duration(spec.tile), dyn_vol=None, normalize=False, tile=None, tmp_dir=tmp_dir
+            )
+            log(f'INFO: Rendering a {spec.tile}-second loop...')
+            tile_instrument = Instrument(instrument.sinks, instrument.labels)
+            tile_instrument.start(tile_spec.duration)
+            _render(tile_spec, [['-f', 'f32le', tile_pth]], capture=False, log=log, instrument=tile_instrument)
+            make_seamless(tile_pth, nchannel, tile_frames)
+            instrument.lap('tile')
+
+            ## the tile stays uncompressed: a lossy codec's priming and padding would click at every repeat
+            input_cmd, envelope_inputs = envelope_args(1)
+            log(f'INFO: Looping it up to {spec.duration} seconds...')
+            out = _run_final([
+                ffmpeg, '-v', 'error', '-stats',
+                '-stream_loop', '-1', '-t', str(spec.duration),
+                '-f', 'f32le', '-ar', str(SAMPLE_RATE), '-ch_layout', spec.layout, '-i', tile_pth,
+                *input_cmd,
+                *output_cmd(loop_filter_complex(nchannel, spec.layout, envelope_inputs, norm_filter), master_tmp_pth)
+            ], capture=capture, capture_bytes=capture_bytes, instrument=instrument, stage='loop')
+            instrument.lap('loop')
+
+        elif spec.engine == 'graph':
+
+            input_cmd, envelope_inputs = envelope_args(0)
+
+            log(f'INFO: Rendering {nchannel}x{nlayer} base noises in a single pass...')
+            out = _run_final([
+                ffmpeg, '-v', 'error', '-stats',
+                *input_cmd,
+                *output_cmd(
+                    build_filter_complex(
+                        spec.duration, spec.color, seeds, spec.highpass, spec.lowpass, spec.volume,
+                        envelope_inputs, norm_filter, spec.layout
+                    ),
+                    master_tmp_pth
+                )
+            ], capture=capture, capture_bytes=capture_bytes, instrument=instrument, stage='render')
+            instrument.lap('render')  # synthesis, mixing, and encoding all run in the same process
+
+        elif spec.engine in ('numpy', 'bank'):
+
+            from main.synth import Synth, multirate_sample_rate
+
+            ## with `multirate`, only the band below the lowpass is synthesized, at a fraction of the samples
+            rate = multirate_sample_rate(spec.color, spec.lowpass) if spec.multirate else SAMPLE_RATE
+            if spec.engine == 'bank':
+                log(f'INFO: Mixing {nchannel}x{nlayer} base noises from the noise bank: {spec.bank_dir}')
+                segments = NoiseBank(spec.bank_dir).pick(spec.color, nchannel, nlayer, round(spec.duration*SAMPLE_RATE), spec.seed)
+                synth = BankMix(segments, spec.highpass, spec.lowpass, spec.volume, envelopes)
+            else:
+                log(
+                    f'INFO: Synthesizing {nchannel}x{nlayer} base noises in-process'
+                    + (f' at {rate} Hz...' if rate != SAMPLE_RATE else '...')
+                )
+                synth = Synth(spec.color, seeds, spec.highpass, spec.lowpass, spec.volume, envelopes, sample_rate=rate)
+            resample = f'aresample={SAMPLE_RATE},' if rate != SAMPLE_RATE else ''
+            blocks = synth.blocks(round(spec.duration*rate))
+
+            ## with `segment`, the synthesized audio is also kept in a checkpoint folder, segment by segment, so a failed
+            ## render continues after the last finished one; resampling, normalization, and encoding run over the whole track
+            checkpoint = None
+            if spec.segment is not None:
+                from main.checkpoint import Checkpoint
+
+                checkpoint = Checkpoint(spec.checkpoint_dir)
+                bank = NoiseBank(spec.bank_dir).digest(spec.color) if spec.engine == 'bank' else None
+                ndone = checkpoint.open(spec, seeds, rate, bank)
+                if ndone > 0:
+                    log(f'INFO: Resuming after {ndone} finished segment(s): {checkpoint.root}')
+                else:
+                    seconds = checkpoint.journal['segment_frames']/rate  # whole synthesis blocks
+                    log(f'INFO: Checkpointing every {seconds:.1f} seconds into: {checkpoint.root}')
+                blocks = checkpoint.blocks(synth, round(spec.duration*rate), log=log, instrument=instrument)
+
+            ## blocks are encoded as soon as they are synthesized, so memory use stays flat for any duration
+            try:
+                out = _run_final([
+                    ffmpeg, '-v', 'error', '-stats',
+                    '-f', 'f32le', '-ar', str(rate), '-ch_layout', spec.layout, '-i', 'pipe:0',
+                    *output_cmd(f'[0:a]{(resample + norm_filter[1:]).strip(",") or "anull"}[out]', master_tmp_pth)
+                ], blocks, capture=capture, capture_bytes=capture_bytes, instrument=instrument, stage='render')
+            except BaseException:
+                if checkpoint is not None:
+                    log(f'INFO: The finished segments are kept; continue the render with: --resume "{checkpoint.root}"')
+                raise
+            instrument.lap('render')  # synthesis and encoding overlap
+            if checkpoint is not None:
+                checkpoint.remove()
+
+        else:  # files engine
+
+            ## the layers are raw float32, neither encoded nor muxed; without a cache they don't even touch the disk:
+            ## every layer process writes into a pipe read by the mixing process, so they all run at once,
+            ## which is only done when they fit in `spec.jobs` (otherwise they go through scratch files, `jobs` at a time)
+            piped = (cache is None) and PIPED_LAYERS and (nchannel*nlayer <= spec.jobs)
+            names = spec.channel_names
+            base_srcs = [[None]*nlayer for _ in range(nchannel)]  # file path or `pipe:<fd>` of each layer
+            commits = {}  # partial path -> cache key of cache entries to publish once rendered
+            read_fds = []
+
+            with ProcessPool(spec.jobs) as pool:
+                try:
+
+                    ## base noises of every channel are rendered concurrently
+                    if piped:
+                        log(f'INFO: Streaming {nchannel}x{nlayer} base noises into the mix...')
+                    else:
+                        log(f'INFO: Creating {nchannel}x{nlayer} base noises using {spec.jobs} jobs.')
+                    layer_futs = {}
+                    for ch in range(nchannel):
+                        for i in range(nlayer):
+                            layer_cmd = [
+                                ffmpeg, '-v', 'error',
+                                '-f', 'lavfi', '-i', f'anoisesrc=d={spec.duration}:c={spec.color}:s={seeds[ch][i]}',
+                                '-f', 'f32le'
+                            ]
+                            if piped:
+                                read_fd, write_fd = os.pipe()
+                                read_fds.append(read_fd)
+                                base_srcs[ch][i] = f'pipe:{read_fd}'
+                                fut = pool.submit(layer_cmd + ['pipe:1'], f'{names[ch]} layer {i + 1}', stdout=write_fd)
+                                layer_futs[fut] = (ch, i)
+                                continue
+                            if cache is not None:
+                                key = Cache.key(kind='layer', color=spec.color, seed=seeds[ch][i], duration=spec.duration)
+                                pth = cache.get(key, '.f32')
+                                if pth is not None:
+                                    log(f'INFO: Reusing the cached base noise: {pth}')
+                                    base_srcs[ch][i] = pth
+                                    continue
+                                pth = cache.reserve(key, '.f32')
+                                partial_pths.append(pth)
+                                commits[pth] = key
+                            else:
+                                pth = os.path.join(tmp_dir, f'base_{names[ch]}_{str(i).zfill(3)}.f32')
+                                intermediate_file_pths.append(pth)
+                            fut = pool.submit(layer_cmd + [pth], pth)
+                            layer_futs[fut] = (ch, i)
+
+                    if not piped:
+                        for n, fut in enumerate(as_completed(layer_futs), 1):
+                            pth = fut.result()
+                            ch, i = layer_futs[fut]
+                            if pth in commits:
+                                pth = cache.commit(pth, commits[pth], '.f32')
+                            base_srcs[ch][i] = pth
+                            log(f'INFO: Created ({n}/{len(layer_futs)}): {pth}')
+                            instrument.count('layers', n, len(layer_futs))
+                        instrument.lap('layers')
+
+                    ## every channel chain runs side by side in one process, joined straight into the encoder,
+                    ## so the audio isn't written and decoded again per channel
+                    input_cmd = []
+                    for row in base_srcs:
+                        for src in row:
+                            input_cmd += ['-f', 'f32le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', src]
+                    env_cmd, envelope_inputs = envelope_args(nchannel*nlayer)
+                    stage = 'render' if piped else 'mix'
+                    log(f'INFO: Mixing {nchannel} channel(s)...')
+                    fds, read_fds = read_fds, []  # closed by `_run_final`
+                    out = _run_final([
+                        ffmpeg, '-v', 'error', '-stats',
+                        *input_cmd,
+                        *env_cmd,
+                        *output_cmd(
+                            build_filter_complex(
+                                spec.duration, spec.color, seeds, spec.highpass, spec.lowpass, spec.volume,
+                                envelope_inputs, norm_filter, spec.layout,
+                                layer_inputs=[[ch*nlayer + i for i in range(nlayer)] for ch in range(nchannel)]
+                            ),
+                            master_tmp_pth
+                        )
+                    ], capture=capture, capture_bytes=capture_bytes, instrument=instrument, stage=stage, pass_fds=fds)
+                    for fut in layer_futs:  # a piped layer failing midway only cuts the mix short
+                        fut.result()
+                    instrument.lap(stage)  # mixing, joining, and encoding run in the same process (and the piped layers alongside)
+
+                except RenderError:
+                    if not pool.errors:  # the mix itself failed
+                        raise
+                    raise RenderError('Rendering failed:\n' + '\n'.join(pool.errors))
+                finally:
+                    for fd in read_fds:
+                        os.close(fd)
+
+        if master_tmp_pth is not None:
+            cache.commit(master_tmp_pth, master_key, '.wav')
+
+    except BaseException:
+        instrument.skip()  # the failed stage isn't cleanup
+        for pth in partial_pths:
+            cache.discard(pth)
+        raise
+
+    finally:
+        instrument.scratch_bytes = 0 if tmp_dir is None else _dir_size(tmp_dir)
+
+        ## deleting the intermediate files (base noises)
+        for pth in intermediate_file_pths:
+            if os.path.exists(pth):
+                log(f'INFO: Deleting {repr(pth)}...')
+                os.remove(pth)
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        instrument.lap('cleanup')
+
+    return out
+
+
+def generate(spec: NoiseSpec, log: Callable[[str], None] = printer, instrument: Optional[Instrument] = None) -> Path:
+    """
+    Renders `spec` into an audio file.
+
+    ---
+
+    ## Params
+        - `spec`: what to render
+        - `log`: receives the progress messages
+        - `instrument`: receives the stage timings and progress events, see `main.instrument.Instrument`
+
+    ## Returns
+        - `Path`: the output file (the first one if `spec.output_ext` lists several, see `NoiseSpec.output_pths`)
+
+    ## Raises
+        - `ValueError`: invalid spec or output path
+        - `FileNotFoundError`: ffmpeg can't be found
+        - `RenderError`: an ffmpeg process failed
+    """
+    spec = spec.resolve()
+    spec.validate()
+    probe_ffmpeg(spec.ffmpeg)
+
+    out_pths = spec.output_pths
+    instrument = instrument or Instrument()
+    instrument.start(spec.duration)
+    try:
+        outs = [['-b:a', f'{bitrate}k', pth] for (_, bitrate), pth in zip(spec.outputs, out_pths)]
+        _render(spec, outs, capture=False, log=log, instrument=instrument)
+    except BaseException:
+        for pth in out_pths:
+            if os.path.exists(pth):
+                os.remove(pth)
+        instrument.end(ok=False)
+        raise
+    instrument.end(ok=True)
+    for pth in out_pths:
+        log(f'INFO: The output successfully created at: {pth}')
+    return Path(out_pths[0])
+
+
+def generate_pcm(spec: NoiseSpec, log: Callable[[str], None] = printer, instrument: Optional[Instrument] = None) -> 'np.ndarray':
+    """
+    Renders `spec` in memory, without encoding it into a file.
+
+    ---
+
+    ## Params
+        - `spec`: what to render; its output fields are ignored
+        - `log`: receives the progress messages
+        - `instrument`: see `generate`
+
+    ## Returns
+        - `np.ndarray`: float32 samples at `SAMPLE_RATE`, shape `(frames, channels)`
+    """
+    spec = spec.resolve()
+    spec.validate(output=False)
+    probe_ffmpeg(spec.ffmpeg)
+
+    instrument = instrument or Instrument()
+    instrument.start(spec.duration)
+    try:
+        out = _render(spec, [['-f', 'f32le', '-c:a', 'pcm_f32le', 'pipe:1']], capture=True, log=log, instrument=instrument)
+    except BaseException:
+        instrument.end(ok=False)
+        raise
+    instrument.end(ok=True)
+    import numpy as np
+    return np.frombuffer(out, np.float32).reshape(-1, spec.nchannel)
+
+
+def metadata(spec: NoiseSpec, stages: Optional[Dict[str, float]] = None) -> str:
+    """The human-readable summary of a resolved spec, printed after rendering, with the stage timings if given."""
+    dyn_vol = spec.dyn_vol
+    dual = (dyn_vol is not None) and any(pattern != dyn_vol[0] for pattern in dyn_vol)  # a pattern per channel
+    seeds = layer_seeds(spec.seed, spec.nchannel, spec.nlayer)
+    names = spec.channel_names
+    levels = predict_levels(spec)
+    target = (
+        f'{spec.target_lufs} LUFS' if spec.target_lufs is not None
+        else f'{spec.target_peak} dBFS peak' if spec.target_peak is not None else None
+    )
+
+    md = (
+        '\n'
+        '===================================================='
+        '\n'
+        'Audio metadata:\n'
+        f'- Software version: {SOFTWARE_VER}\n'
+        f'- Created on: {datetime.datetime.now().strftime("%b %#d, %Y (%#I:%M %p)")}\n'
+        f'- Duration: {spec.duration} secs\n'
+        f'- Color: {spec.color}\n'
+        f'- Number of layers: {spec.nlayer}\n'
+        f'- Highpass: {spec.highpass} hz\n'
+        f'- Lowpass: {spec.lowpass} hz\n'
+        f'- Volume: {spec.volume}x ({20*math.log10(spec.volume):+.2f} dB' + (f', planned for {target})\n' if target else ')\n')
+        + f'- Expected levels: peak below {levels["peak"]} dBFS, {levels["lufs"]} LUFS'
+        + (' (before dynaudnorm)\n' if spec.normalize else '\n') +
+        f'- Channels: {spec.layout}\n'
+        f'- Engine: {spec.engine}' + (' (multirate)' if spec.multirate else '') + '\n'
+        + (f'- Looped tile: {spec.tile} secs\n' if spec.tiled else '')
+        + (f'- Checkpointed segments: {spec.segment} secs\n' if spec.segment is not None else '') +
+        f'- Normalized: {spec.normalize}\n'
+        f'- Seed: {spec.seed}\n'
+        + (f'- Noise bank: {spec.bank_dir}\n' if spec.engine == 'bank' else ''.join(
+            f'  - Layer seeds{"" if spec.nchannel == 1 else f" ({side})"}: {", ".join(map(str, seeds[ch]))}\n'
+            for ch, side in enumerate(names)
+        )) + (
+            f'- Bitrate: {spec.outputs[0][1]} kbps\n' if len(spec.outputs) == 1
+            else '- Outputs: ' + ', '.join(f'{ext} ({bitrate} kbps)' for ext, bitrate in spec.outputs) + '\n'
+        ) +
+        f'- Using dynamic volume: {dyn_vol is not None}' + ((' (dual)' if dual else ' (single)') if dyn_vol is not None else '')
+    )
+    if dyn_vol is not None:
+        for ch, side in enumerate(names if dual else names[:1]):
+            pattern = dyn_vol[ch]
+            md += (
+                '\n' + (f'  *{side} channel*\n' if dual else '') +
+                f'  - Number of changes: {pattern["nchanges"]} transitions\n'
+                f'  - Min volume: {pattern["vol_min"]}x\n'
+                f'  - Max volume: {pattern["vol_max"]}x\n'
+                f'  - Perlin noise persistence: {pattern["persistence"]}\n'
+                f'  - Perlin noise octaves: {pattern["octaves"]}\n'
+                f'  - Perlin noise frequency: {pattern["frequency"]}\n'
+                f'  - Perlin noise seed: {pattern["seed"]}'
+            )
+    if stages:
+        md += '\n- Stage timings: ' + ', '.join(f'{stage} {seconds:.2f} secs' for stage, seconds in stages.items())
+    md += (
+        '\n\n'
+        'Software source code:\n'
+        'https://github.com/nvfp/Multilayered-Noise-Generator'
+        '\n'
+        '===================================================='
+    )
+    return md
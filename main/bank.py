@@ -0,0 +1,323 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import as_completed
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from main.constants import SOFTWARE_VER, SOFTWARE_NAME, SAMPLE_RATE
+from main.pool import ProcessPool, RenderError
+from main.seed import derive_seed, layer_seeds, new_master_seed
+from main.synth import Synth
+from main.utils import parse_size, printer
+
+
+BANK_FORMAT = 1  # version of the manifest layout
+BANK_MANIFEST = 'bank.json'
+BANK_MAX_BYTES = 10*1024**3  # default size budget of a bank folder
+
+
+def _sha256(pth: str, block_bytes: int = 2**20) -> str:
+    h = hashlib.sha256()
+    with open(pth, 'rb') as f:
+        for block in iter(lambda: f.read(block_bytes), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class NoiseBank:
+    """
+    A folder of long base noises, rendered once by `anoisesrc` as raw float32 at `SAMPLE_RATE` and reused by every track
+    of the `bank` engine: each layer of a track is a segment of a banked noise, at a random offset and with a random polarity,
+    and no two segments of a track overlap, so they stay uncorrelated. `bank.json` lists every noise with its seed,
+    length, and SHA-256, so a damaged or truncated file is caught (see `verify`).
+
+    ---
+
+    ## Params
+        - `root`: the bank folder (created if missing)
+
+    ## Demo
+        >>> bank = NoiseBank('~/noise_bank')
+        >>> bank.build('brown', nlayer=16, duration=600)  # 16 ten-minute layers, about 1.8 GB
+        >>> generate(NoiseSpec(duration=60, engine='bank', bank_dir='~/noise_bank'))
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(os.path.expanduser(root))
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest = self._load()
+
+    def _load(self) -> dict:
+        pth = os.path.join(self.root, BANK_MANIFEST)
+        if not os.path.exists(pth):
+            return {'format': BANK_FORMAT, 'sample_rate': SAMPLE_RATE, 'layers': []}
+        with open(pth) as f:
+            manifest = json.load(f)
+        if (manifest.get('format') != BANK_FORMAT) or (manifest.get('sample_rate') != SAMPLE_RATE):
+            raise ValueError(f'Unsupported noise bank (format {manifest.get("format")}, {manifest.get("sample_rate")} Hz): {self.root}')
+        return manifest
+
+    def _save(self) -> None:
+        pth = os.path.join(self.root, BANK_MANIFEST)
+        tmp_pth = f'{pth}.{os.getpid()}.tmp'
+        with open(tmp_pth, 'w') as f:
+            json.dump({**self.manifest, 'software_version': SOFTWARE_VER}, f, indent=2)
+        os.replace(tmp_pth, pth)
+
+    def layers(self, color: str) -> List[dict]:
+        """The manifest entries of the banked noises of `color`: `file` (relative path), `color`, `seed`, `frames`, and `sha256`."""
+        return [entry for entry in self.manifest['layers'] if entry['color'] == color]
+
+    def size(self) -> int:
+        """Total size of the banked noises in bytes."""
+        return sum(entry['frames']*4 for entry in self.manifest['layers'])
+
+    def digest(self, color: str) -> str:
+        """Identifies the banked noises of `color`, e.g. in a cache key: it changes whenever one is added."""
+        return hashlib.sha256(','.join(entry['sha256'] for entry in self.layers(color)).encode()).hexdigest()
+
+    def capacity(self, color: str, nframes: int) -> int:
+        """How many non-overlapping `nframes`-long segments the banked noises of `color` hold."""
+        return sum(entry['frames'] // nframes for entry in self.layers(color))
+
+    def build(
+        self,
+        color: str,
+        nlayer: int,
+        duration: float,
+        max_bytes: int = BANK_MAX_BYTES,
+        ffmpeg: str = 'ffmpeg',
+        jobs: Optional[int] = None,
+        log: Callable[[str], None] = printer,
+    ) -> List[dict]:
+        """
+        Renders `nlayer` new noises of `color` into the bank, in parallel. Each one is listed in the manifest as soon as
+        it's written, so an interrupted build keeps the finished ones.
+
+        ---
+
+        ## Params
+            - `color`: the `anoisesrc` noise color
+            - `nlayer`: number of noises to add
+            - `duration`: length of each noise in seconds; a track of the `bank` engine needs `nchannel*nlayer` of its length in total
+            - `max_bytes`: size budget of the bank folder; raises `ValueError` if the new noises don't fit
+            - `ffmpeg`: the ffmpeg command
+            - `jobs`: number of ffmpeg processes run concurrently (default: number of CPUs)
+            - `log`: receives the progress messages
+
+        ## Returns
+            - `List[dict]`: the manifest entries of the new noises
+        """
+        nframes = round(duration*SAMPLE_RATE)
+        new_bytes = nlayer*nframes*4
+        if self.size() + new_bytes > max_bytes:
+            raise ValueError(
+                f'{nlayer} layers of {duration} seconds ({new_bytes/1024**3:.2f} GiB) exceed the bank size budget '
+                f'({self.size()/1024**3:.2f} of {max_bytes/1024**3:.2f} GiB used).'
+            )
+
+        taken = {entry['seed'] for entry in self.layers(color)}
+        seeds = []
+        while len(seeds) < nlayer:
+            seeds += [seed for seed in layer_seeds(new_master_seed(), 1, nlayer)[0] if seed not in taken][:nlayer - len(seeds)]
+        os.makedirs(os.path.join(self.root, color), exist_ok=True)
+
+        added = []
+        futs = {}  # future -> (partial path, seed)
+        try:
+            with ProcessPool(jobs or os.cpu_count() or 1) as pool:
+                log(f'INFO: Rendering {nlayer} {color} noises of {duration} seconds into {self.root}...')
+                for seed in seeds:
+                    pth = os.path.join(self.root, color, f'.{seed}.partial.f32')
+                    fut = pool.submit([
+                        ffmpeg, '-v', 'error', '-y',
+                        '-f', 'lavfi', '-i', f'anoisesrc=d={duration}:c={color}:s={seed}',
+                        '-f', 'f32le', pth
+                    ], f'{color} noise {seed}')
+                    futs[fut] = (pth, seed)
+
+                try:
+                    for n, fut in enumerate(as_completed(futs), 1):
+                        fut.result()
+                        pth, seed = futs[fut]
+                        entry = {
+                            'file': f'{color}/{seed}.f32', 'color': color, 'seed': seed,
+                            'frames': os.path.getsize(pth) // 4, 'sha256': _sha256(pth),
+                        }
+                        os.replace(pth, os.path.join(self.root, entry['file']))
+                        self.manifest['layers'].append(entry)
+                        self._save()
+                        added.append(entry)
+                        log(f'INFO: Banked ({n}/{nlayer}): {entry["file"]}')
+                except RenderError:
+                    if not pool.errors:
+                        raise
+                    raise RenderError('Building the bank failed:\n' + '\n'.join(pool.errors))
+        finally:
+            for pth, _ in futs.values():
+                if os.path.exists(pth):
+                    os.remove(pth)
+        return added
+
+    def verify(self, log: Callable[[str], None] = printer) -> List[str]:
+        """Checks the length and the SHA-256 of every banked noise; returns the problems found (none if the bank is intact)."""
+        problems = []
+        for n, entry in enumerate(self.manifest['layers'], 1):
+            pth = os.path.join(self.root, entry['file'])
+            if not os.path.isfile(pth):
+                problems.append(f'{entry["file"]}: missing')
+            elif os.path.getsize(pth) != entry['frames']*4:
+                problems.append(f'{entry["file"]}: {os.path.getsize(pth)} bytes, expected {entry["frames"]*4}')
+            elif _sha256(pth) != entry['sha256']:
+                problems.append(f'{entry["file"]}: checksum mismatch')
+            else:
+                log(f'INFO: OK ({n}/{len(self.manifest["layers"])}): {entry["file"]}')
+        for problem in problems:
+            log(f'ERROR: {problem}')
+        return problems
+
+    def pick(self, color: str, nchannel: int, nlayer: int, nframes: int, seed: int) -> List[List[Tuple[str, int, float]]]:
+        """
+        Picks the segments of a track: `nlayer` per channel, each `nframes` long, from random banked noises of `color`,
+        at random offsets that never overlap, with random polarity. The choice only depends on the bank and `seed`.
+
+        ---
+
+        ## Returns
+            - `List[List[Tuple[str, int, float]]]`: per channel and layer, `(path, first frame, polarity)`
+        """
+        entries = self.layers(color)
+        needed = nchannel*nlayer
+        if self.capacity(color, nframes) < needed:
+            raise ValueError(
+                f'The noise bank holds too little {color} noise for {needed} separate {nframes/SAMPLE_RATE:g}-second layers '
+                f'({len(entries)} banked); add more with `bank build`.'
+            )
+        for entry in entries:  # cheap integrity check; `verify` compares the checksums
+            pth = os.path.join(self.root, entry['file'])
+            if (not os.path.isfile(pth)) or (os.path.getsize(pth) != entry['frames']*4):
+                raise ValueError(f'Damaged noise bank, run `bank verify`: {pth}')
+
+        rng = np.random.default_rng(derive_seed(seed, 'bank'))
+        slots = [entry['frames'] // nframes for entry in entries]
+        owners = rng.choice(np.repeat(np.arange(len(entries)), slots), needed, replace=False)  # the noise of each segment
+
+        ## `m` segments of a noise start at sorted random points of its slack, each shifted past the previous ones
+        offsets = np.empty(needed, np.int64)
+        for k in np.unique(owners):
+            idx = np.flatnonzero(owners == k)
+            slack = entries[k]['frames'] - len(idx)*nframes
+            offsets[idx] = np.sort(rng.integers(0, slack + 1, len(idx))) + np.arange(len(idx))*nframes
+        polarities = rng.choice([-1.0, 1.0], needed)
+
+        segments = [
+            (os.path.join(self.root, entries[k]['file']), int(offset), float(polarity))
+            for k, offset, polarity in zip(owners, offsets, polarities)
+        ]
+        return [segments[ch*nlayer:(ch + 1)*nlayer] for ch in range(nchannel)]
+
+
+class BankMix(Synth):
+    """
+    `Synth` whose layers are segments of banked noises (see `NoiseBank.pick`) instead of synthesized ones.
+    The segments are read straight from the page cache through `np.memmap`, so a track costs only the mix,
+    the band filters, and the encoding. The color is already in the noises; the base class only contributes
+    the band filters, the volume, and the dynamic volume.
+
+    ## Demo
+        >>> mix = BankMix(bank.pick('brown', 2, 7, 48000*60, seed=1), 20, 432, 4)
+        >>> for block in mix.blocks(48000*60):
+        ...     encoder.stdin.write(block.data)
+    """
+
+    def __init__(
+        self,
+        segments: Sequence[Sequence[Tuple[str, int, float]]],
+        highpass: float,
+        lowpass: float,
+        volume: float,
+        envelopes: Optional[Sequence] = None,
+    ) -> None:
+        super().__init__('white', [[0]*len(row) for row in segments], highpass, lowpass, volume, envelopes)
+        maps: Dict[str, np.memmap] = {}
+        for row in segments:
+            for pth, _, _ in row:
+                if pth not in maps:
+                    maps[pth] = np.memmap(pth, np.float32, mode='r')
+        self._segments = [[(maps[pth], offset, polarity) for pth, offset, polarity in row] for row in segments]
+
+    def _mix(self, n: int) -> np.ndarray:
+        y = np.zeros((self.nchannel, n))
+        for ch, row in enumerate(self._segments):
+            for data, offset, polarity in row:
+                segment = data[offset + self.pos:offset + self.pos + n]
+                if polarity > 0:
+                    y[ch] += segment
+                else:
+                    y[ch] -= segment
+        y /= self.nlayer  # like `amix`
+        return y
+
+
+## <parser>
+parser = argparse.ArgumentParser(prog=f'{SOFTWARE_NAME} bank', description='Manage a noise bank for the `bank` engine')
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+build_parser = subparsers.add_parser('build', help='Render new noises into the bank')
+build_parser.add_argument('bank_dir', help='The bank folder')
+build_parser.add_argument('-c', '--colors', nargs='+', default=['brown'], help='Noise colors (default: brown)')
+build_parser.add_argument('-n', '--nlayer', default=16, type=int, help='Number of noises to add per color (default: 16)')
+build_parser.add_argument('-d', '--duration', default=600, type=float, help='Length of each noise in seconds (default: 600)')
+build_parser.add_argument(
+    '-mb', '--max_bytes', default=BANK_MAX_BYTES, type=parse_size,
+    help='Size budget of the bank folder, e.g. 500M, 20G (default: 10G)'
+)
+build_parser.add_argument('-j', '--jobs', type=int, help='Number of ffmpeg processes run concurrently (default: number of CPUs)')
+build_parser.add_argument('-ff', '--ffmpeg', default='ffmpeg', help='FFmpeg binary file path or command (default: ffmpeg)')
+
+verify_parser = subparsers.add_parser('verify', help='Check the length and checksum of every banked noise')
+verify_parser.add_argument('bank_dir', help='The bank folder')
+
+info_parser = subparsers.add_parser('info', help='Summarize the banked noises')
+info_parser.add_argument('bank_dir', help='The bank folder')
+
+## </parser>
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parser.parse_args(argv)
+
+    try:
+        bank = NoiseBank(args.bank_dir)
+        if args.command == 'build':
+            from main.api import COLORS, probe_ffmpeg
+
+            for color in args.colors:
+                if color not in COLORS:
+                    raise ValueError(f'Invalid color "{color}". Available options are: {", ".join(COLORS)}.')
+            if args.nlayer < 1:
+                raise ValueError('Number of layers must be at least 1.')
+            if args.duration <= 0:
+                raise ValueError('Duration should be greater than 0.')
+            probe_ffmpeg(args.ffmpeg)
+            for color in args.colors:
+                bank.build(color, args.nlayer, args.duration, args.max_bytes, args.ffmpeg, args.jobs)
+        elif args.command == 'verify':
+            if bank.verify():
+                sys.exit(1)
+            printer(f'INFO: All {len(bank.manifest["layers"])} banked noises are intact.')
+            return
+    except (OSError, ValueError, RenderError) as e:
+        printer(f'ERROR: {e}')
+        sys.exit(1)
+
+    colors = sorted({entry['color'] for entry in bank.manifest['layers']})
+    for color in colors:
+        entries = bank.layers(color)
+        seconds = sum(entry['frames'] for entry in entries)/SAMPLE_RATE
+        printer(f'INFO: {color}: {len(entries)} noises, {seconds/60:.1f} minutes in total')
+    printer(f'INFO: {bank.root}: {bank.size()/1024**3:.2f} GiB')
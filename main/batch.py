@@ -0,0 +1,206 @@
+import csv
+import dataclasses
+import json
+import os
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Sequence
+
+from main.api import NoiseSpec, generate
+from main.instrument import Instrument, Sink
+from main.utils import parse_size, printer, validate_filename
+
+
+_FIELDS = {f.name: f for f in dataclasses.fields(NoiseSpec)}
+SIZE_FIELDS = ('cache_max_bytes',)  # byte sizes, which may also be written like `10G`
+
+
+def _coerce(name: str, value):
+    """
+    Converts a manifest value (CSV cells are always strings) to the type of the `NoiseSpec` field.
+    Raises `ValueError` for a string that doesn't fit it, e.g. a field holding a list of patterns.
+    """
+    if not isinstance(value, str):
+        return value
+    types = typing.get_args(_FIELDS[name].type) or (_FIELDS[name].type,)
+    if value == '' and type(None) in types:
+        return None
+    if name in SIZE_FIELDS:
+        try:
+            return parse_size(value)
+        except ValueError:
+            raise ValueError(f'Invalid size {repr(value)}, expected e.g. 10G')
+    if bool in types:
+        if value.lower() in ('1', 'true', 'yes', 'y'):
+            return True
+        if value.lower() in ('0', 'false', 'no', 'n'):
+            return False
+        raise ValueError(f'Invalid boolean for {repr(name)}: {repr(value)}')
+    if int in types:
+        return int(value)
+    if float in types:
+        return float(value)
+    if str in types:
+        if value.lstrip().startswith('[') and any(t not in (str, type(None)) for t in types):  # e.g. `output_ext`
+            raise ValueError(f'Invalid value {repr(value)}: a list is written as space-separated values, e.g. ".m4a .mp3:192".')
+        return value
+    raise ValueError('This field can\'t be written as text; use a .jsonl or .toml manifest.')
+
+
+def load_manifest(pth: str) -> List[dict]:
+    """
+    Reads a batch manifest: one job per line (`.jsonl`), per row (`.csv`, with a header),
+    or per `[[job]]` table (`.toml`). Keys are `NoiseSpec` field names, plus an optional `id`.
+
+    ---
+
+    ## Params
+        - `pth`: the manifest file
+
+    ## Returns
+        - `List[dict]`: the jobs, each with an `id` (defaults to its position)
+
+    ## Demo
+        manifest.jsonl:
+            {"id": "deep-brown", "duration": 3600, "color": "brown", "lowpass": 200}
+            {"id": "pink-flac", "color": "pink", "output_ext": ".flac"}
+    """
+    ext = os.path.splitext(pth)[1].lower()
+    with open(pth, 'rb') as f:
+        raw = f.read()
+
+    if ext in ('.jsonl', '.ndjson'):
+        entries = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+    elif ext == '.csv':
+        ## a blank cell means the default (of the command line, or of `NoiseSpec`)
+        entries = [
+            {name: value for name, value in row.items() if not (isinstance(value, str) and value.strip() == '')}
+            for row in csv.DictReader(raw.decode().splitlines())
+        ]
+    elif ext == '.toml':
+        import tomllib  # Python 3.11+
+        entries = tomllib.loads(raw.decode()).get('job', [])
+    else:
+        raise ValueError(f'Unsupported manifest format {repr(ext)}, expected .jsonl, .csv, or .toml')
+
+    jobs = []
+    for i, entry in enumerate(entries):
+        try:
+            jobs.append(parse_job(entry, str(i)))
+        except ValueError as e:
+            raise ValueError(f'Row {i + 2} of {pth}: {e}' if ext == '.csv' else str(e))  # row 1 is the header
+
+    ids = [job['id'] for job in jobs]
+    if len(set(ids)) != len(ids):
+        raise ValueError('Job ids must be unique.')
+    return jobs
+
+
+def parse_job(entry: dict, default_id: str) -> dict:
+    """A job from its manifest entry (or a `serve` request): `NoiseSpec` fields of the right types, plus its `id`."""
+    entry = dict(entry)
+    job = {'id': str(entry.pop('id', None) or default_id)}
+    for name, value in entry.items():
+        if name not in _FIELDS:
+            raise ValueError(f'Job {repr(job["id"])}: unknown field {repr(name)}')
+        try:
+            job[name] = _coerce(name, value)
+        except ValueError as e:
+            raise ValueError(f'Job {repr(job["id"])}, field {repr(name)}: {e}')
+    return job
+
+
+def run_job(
+    base: NoiseSpec,
+    job: dict,
+    log: Callable[[str], None] = printer,
+    sinks: Sequence[Sink] = (),
+    dyn_vol: Optional[Callable[[int], Optional[List[dict]]]] = None,
+) -> dict:
+    """
+    Renders one job (see `parse_job`): `base` with the job's fields replaced. Never raises on a failed render;
+    the result tells: `id`, `status` (`ok` or `error`), `output`, `outputs`, `error`, `seed`, `started`, `wall_time`, and `stages`.
+    `dyn_vol` makes the default dynamic-volume patterns for a number of channels, for a job that doesn't set its own.
+    """
+    job = dict(job)
+    job_id = job.pop('id')
+    result = {'id': job_id, 'status': 'ok', 'output': None, 'error': None}
+    instrument = Instrument(sinks, labels={'job_id': job_id})
+    t0 = time.time()
+    try:
+        spec = dataclasses.replace(base, **job)
+        if (dyn_vol is not None) and ('dyn_vol' not in job):  # one pattern per channel of this job, which may change the layout
+            spec = dataclasses.replace(spec, dyn_vol=dyn_vol(spec.nchannel))
+        spec = spec.resolve()
+        if 'output_name' not in job:  # two jobs with the same parameters would get the same default name
+            spec = dataclasses.replace(spec, output_name=validate_filename(f'{spec.output_name} {job_id}'))
+        result['seed'] = spec.seed
+        for msg in spec.validate():
+            log(f'WARNING: {msg}')
+        result['output'] = str(generate(spec, log=log, instrument=instrument))
+        result['outputs'] = spec.output_pths
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+        log(f'ERROR: {e}')
+    result['started'] = t0
+    result['wall_time'] = round(time.time() - t0, 3)
+    result['stages'] = {stage: round(seconds, 3) for stage, seconds in instrument.stages.items()}
+    return result
+
+
+def run_batch(
+    base: NoiseSpec,
+    jobs: List[dict],
+    workers: int,
+    results_pth: str,
+    log: Callable[[str], None] = printer,
+    sinks: Sequence[Sink] = (),
+    dyn_vol: Optional[Callable[[int], Optional[List[dict]]]] = None,
+) -> List[dict]:
+    """
+    Renders many jobs on a pool of `workers` threads. Each job is `base` with the job's fields replaced,
+    and, like every render, uses a private scratch folder, so jobs can't interfere with each other.
+    A failing job doesn't stop the others.
+
+    ---
+
+    ## Params
+        - `base`: the defaults of every job (e.g. from the command-line options)
+        - `jobs`: as returned by `load_manifest`
+        - `workers`: number of jobs rendered concurrently
+        - `results_pth`: JSON-lines file receiving one result per job as soon as it finishes
+        - `log`: receives the progress messages, prefixed by the job id
+        - `sinks`: receive the stage timings and progress events of every job, labeled with its `job_id`
+        - `dyn_vol`: the default dynamic-volume patterns for a number of channels (see `run_job`)
+
+    ## Returns
+        - `List[dict]`: the results, in manifest order
+    """
+    lock = threading.Lock()
+    results: Dict[str, dict] = {}
+
+    def run(job: dict) -> dict:
+        result = run_job(base, job, lambda msg: log(f'[{job["id"]}] {msg}'), sinks, dyn_vol)
+        with lock:
+            with open(results_pth, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+        return result
+
+    log(f'INFO: Rendering {len(jobs)} jobs with {workers} workers; results go to {results_pth}')
+    open(results_pth, 'w').close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futs = [executor.submit(run, job) for job in jobs]
+        try:
+            for n, fut in enumerate(as_completed(futs), 1):
+                result = fut.result()
+                results[result['id']] = result
+                log(f'INFO: Finished ({n}/{len(jobs)}): {result["id"]} [{result["status"]}]')
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    return [results[job['id']] for job in jobs]
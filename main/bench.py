@@ -0,0 +1,550 @@
+import argparse
+import datetime
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess as sp
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from main.constants import SOFTWARE_VER, SOFTWARE_DIR, SOFTWARE_NAME, TMP_DIR, OUTPUT_DIR
+from main.envelope import envelope_input, pattern, write_envelope
+from main.graph import envelope_chain
+from main.seed import layer_seeds
+from main.utils import printer
+
+
+DYN_VOL_MECHANISMS = ('none', 'expression', 'stream')
+STUB_FFMPEG = os.path.join(SOFTWARE_DIR, 'main', 'stub_ffmpeg.py')
+SUITE_AXES = ('duration', 'nlayer', 'color', 'channels', 'dyn_vol', 'codec', 'engine')
+STARTUP_COMMANDS = {  # what a short render pays before any audio work, each run in a fresh interpreter
+    'interpreter': ['-c', 'pass'],  # the baseline the budget is measured from
+    'import': ['-c', 'import main.main'],
+    'version': ['.', '--version'],
+}
+HEAVY_MODULES = ('numpy', 'tkinter', 'carbon.gui')  # must only be imported by the code paths that use them
+STARTUP_BUDGET_MS = 300  # the most `import main.main` may add to a bare interpreter's startup, see `bench startup`
+
+
+def volume_expression(points: Sequence[Tuple[float, float]]) -> str:
+    """
+    The dynamic volume as a single piecewise-linear `volume=` expression, evaluated by ffmpeg for every frame.
+    This is how the dynamic volume used to be applied; it is kept here as the benchmark baseline.
+    """
+    terms = []
+    for (t0, v0), (t1, v1) in zip(points, points[1:]):
+        terms.append(f'between(t,{t0:.6f},{t1:.6f})*({v0:.6f}+{(v1 - v0)/(t1 - t0):.9f}*(t-{t0:.6f}))')
+    return "volume=eval=frame:volume='" + '+'.join(terms) + "'"
+
+
+def bench_dyn_vol(
+    nchanges: Sequence[int],
+    duration: float = 60,
+    nlayer: int = 7,
+    mechanisms: Sequence[str] = DYN_VOL_MECHANISMS,
+    ffmpeg: str = 'ffmpeg',
+    log: Callable[[str], None] = printer,
+) -> List[dict]:
+    """
+    Measures the mix step (the `files` engine's per-channel `amix` -> band -> volume -> dynamic volume run)
+    of a stereo track with dual patterns, for each dynamic-volume mechanism and number of changes.
+
+    ---
+
+    ## Params
+        - `nchanges`: the numbers of changes to sweep
+        - `duration`: track length in seconds
+        - `nlayer`: number of layers per channel
+        - `mechanisms`: any of `DYN_VOL_MECHANISMS`: no dynamic volume, the legacy `volume=` expression, or the gain curve stream
+        - `ffmpeg`: the ffmpeg command
+        - `log`: receives the progress messages
+
+    ## Returns
+        - `List[dict]`: one result per run, with the wall time and the real-time factor (audio seconds mixed per second)
+
+    ## Demo
+        >>> for r in bench_dyn_vol([10, 1000], duration=30):
+        ...     print(r['mechanism'], r['nchanges'], r['realtime_factor'])
+    """
+    tmp_dir = tempfile.mkdtemp(prefix=f'{SOFTWARE_NAME}-bench-', dir=TMP_DIR)
+    try:
+        log(f'INFO: Rendering 2x{nlayer} base noises of {duration} secs...')
+        seeds = layer_seeds(0, 2, nlayer)
+        base_pths = [[os.path.join(tmp_dir, f'base_{ch}_{i}.wav') for i in range(nlayer)] for ch in range(2)]
+        for ch in range(2):
+            for i in range(nlayer):
+                sp.run([
+                    ffmpeg, '-v', 'error', '-f', 'lavfi', '-i', f'anoisesrc=d={duration}:c=brown:s={seeds[ch][i]}',
+                    '-c:a', 'pcm_f32le', base_pths[ch][i]
+                ], check=True)
+
+        results = []
+        for n in nchanges:
+            patterns = [pattern(duration, seed=ch, nchanges=n) for ch in range(2)]
+            for mechanism in mechanisms:
+                if (mechanism == 'none') and (n != nchanges[0]):  # doesn't depend on `nchanges`
+                    continue
+
+                t0 = time.perf_counter()
+                for ch in range(2):
+                    input_cmd = []
+                    for pth in base_pths[ch]:
+                        input_cmd += ['-i', pth]
+                    chain = ''.join(f'[{i}:a]' for i in range(nlayer)) + f'amix=inputs={nlayer},highpass=f=20,lowpass=f=432,volume=4'
+                    if mechanism == 'expression':
+                        chain += ',' + volume_expression(patterns[ch]['points'])
+                    elif mechanism == 'stream':
+                        env_pth = os.path.join(tmp_dir, f'envelope_{ch}.f32')
+                        write_envelope(env_pth, patterns[ch]['points'], duration)  # part of the cost
+                        input_cmd += envelope_input(env_pth)
+                        chain += '[mix];' + envelope_chain('[mix]', nlayer, '')
+                    ## from a file: a long expression doesn't fit in a command line
+                    graph_pth = os.path.join(tmp_dir, f'graph_{ch}.txt')
+                    with open(graph_pth, 'w') as f:
+                        f.write(chain)
+                    sp.run([ffmpeg, '-v', 'error', *input_cmd, '-filter_complex_script', graph_pth, '-f', 'null', '-'], check=True)
+                seconds = time.perf_counter() - t0
+
+                results.append({
+                    'mechanism': mechanism,
+                    'nchanges': n if mechanism != 'none' else 0,
+                    'duration': duration,
+                    'nlayer': nlayer,
+                    'seconds': round(seconds, 3),
+                    'realtime_factor': round(2*duration/seconds, 1),  # both channels
+                })
+                log(f'INFO: {mechanism:>10} nchanges={results[-1]["nchanges"]:<6} {results[-1]["realtime_factor"]}x real time')
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _run_case(case: dict, tmp_dir: str, ffmpeg: str) -> dict:
+    """Renders one suite case; runs in a fresh process (see `bench_suite`), so its peak RSS is its own."""
+    from main.api import NoiseSpec, generate
+    from main.instrument import Instrument
+
+    spec = NoiseSpec(
+        duration=case['duration'],
+        color=case['color'],
+        nlayer=case['nlayer'],
+        channels=case['channels'],
+        seed=0,
+        output_dir=tmp_dir,
+        output_name='out',
+        output_ext=case['codec'],
+        engine=case['engine'],
+        tmp_dir=tmp_dir,
+        ffmpeg=ffmpeg,
+    )
+    if case['dyn_vol'] == 'on':
+        ## one volume change per second, a separate pattern per channel
+        spec.dyn_vol = [{'nchanges': max(2, int(case['duration']))} for _ in range(spec.nchannel)]
+    instrument = Instrument()
+    t0 = time.perf_counter()
+    pth = generate(spec, log=lambda msg: None, instrument=instrument)
+    wall_time = time.perf_counter() - t0
+    output_bytes = os.path.getsize(pth)
+    os.remove(pth)
+
+    peak_rss = None
+    try:
+        import resource  # POSIX only
+
+        ## the largest of this process and its (waited-for) ffmpeg children; kilobytes on Linux, bytes on macOS
+        unit = 1 if sys.platform == 'darwin' else 1024
+        peak_rss = unit*max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        )
+    except ImportError:
+        pass
+
+    return {
+        'wall_time': round(wall_time, 4),
+        'stages': {stage: round(seconds, 4) for stage, seconds in instrument.stages.items()},
+        'peak_rss_bytes': peak_rss,
+        'scratch_bytes': instrument.scratch_bytes,
+        'output_bytes': output_bytes,
+        'realtime_factor': round(case['duration']/wall_time, 2),
+    }
+
+
+def bench_suite(
+    durations: Sequence[float] = (10,),
+    nlayers: Sequence[int] = (7,),
+    colors: Sequence[str] = ('brown',),
+    channels: Sequence[str] = ('stereo', 'mono'),
+    dyn_vol: Sequence[str] = ('off', 'on'),
+    codecs: Sequence[str] = ('.m4a', '.flac'),
+    engines: Sequence[str] = ('graph', 'files', 'numpy'),
+    ffmpeg: str = 'ffmpeg',
+    log: Callable[[str], None] = printer,
+) -> List[dict]:
+    """
+    Renders every combination of the given values, each in a fresh Python process, and measures it.
+
+    ---
+
+    ## Params
+        - `durations`, `nlayers`, `colors`: the values to sweep
+        - `channels`: channel layouts or counts, see `NoiseSpec.channels`
+        - `dyn_vol`: `off` and/or `on` (one change per second, a pattern per channel)
+        - `codecs`: output extensions
+        - `engines`: rendering pipelines
+        - `ffmpeg`: the ffmpeg command, or `STUB_FFMPEG` to measure the pipeline's own overhead
+        - `log`: receives the progress messages
+
+    ## Returns
+        - `List[dict]`: one result per case: its parameters, `status`, `wall_time`, `stages` (seconds per stage),
+          `peak_rss_bytes` (the largest process), `scratch_bytes`, `output_bytes`, and `realtime_factor`
+    """
+    cases = [dict(zip(SUITE_AXES, values)) for values in itertools.product(durations, nlayers, colors, channels, dyn_vol, codecs, engines)]
+    results = []
+    for n, case in enumerate(cases, 1):
+        tmp_dir = tempfile.mkdtemp(prefix=f'{SOFTWARE_NAME}-bench-', dir=TMP_DIR)
+        try:
+            proc = sp.run([
+                sys.executable, '-c',
+                'import json, sys; from main.bench import _run_case; print(json.dumps(_run_case(json.loads(sys.argv[1]), *sys.argv[2:])))',
+                json.dumps(case), tmp_dir, ffmpeg
+            ], cwd=SOFTWARE_DIR, capture_output=True, text=True)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        if proc.returncode == 0:
+            result = {**case, 'status': 'ok', **json.loads(proc.stdout.splitlines()[-1])}
+            log(f'INFO: ({n}/{len(cases)}) {case}: {result["wall_time"]} secs, {result["realtime_factor"]}x real time')
+        else:
+            result = {**case, 'status': 'error', 'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ''}
+            log(f'ERROR: ({n}/{len(cases)}) {case}: {result["error"]}')
+        results.append(result)
+    return results
+
+
+def bench_startup(repeat: int = 10, ffmpeg: Optional[str] = 'ffmpeg', log: Callable[[str], None] = printer) -> dict:
+    """
+    Measures the startup cost of the command line: the wall time of fresh interpreters running `STARTUP_COMMANDS`,
+    which `HEAVY_MODULES` importing `main.main` pulls in, and `probe_ffmpeg` with a cold and a warm probe cache.
+
+    ---
+
+    ## Params
+        - `repeat`: runs per command; the median is kept
+        - `ffmpeg`: the ffmpeg command to probe, or `None` to skip the probe (e.g. in `tests/test_startup.py`)
+        - `log`: receives the progress messages
+
+    ## Returns
+        - `dict`: `<command>_ms` (median milliseconds) per command, `import_cost_ms` (`import_ms` over `interpreter_ms`),
+          `heavy_modules` (the ones imported), `probe_cold_ms` and `probe_warm_ms` (unless `ffmpeg` is `None`)
+    """
+    result = {}
+    for name, args in STARTUP_COMMANDS.items():
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            sp.run([sys.executable, *args], cwd=SOFTWARE_DIR, stdout=sp.DEVNULL, stderr=sp.DEVNULL, check=True)
+            times.append(time.perf_counter() - t0)
+        result[f'{name}_ms'] = round(statistics.median(times)*1000, 1)
+        log(f'INFO: {name}: {result[f"{name}_ms"]} ms (median of {repeat})')
+    result['import_cost_ms'] = round(result['import_ms'] - result['interpreter_ms'], 1)
+
+    proc = sp.run([
+        sys.executable, '-c',
+        'import json, sys; import main.main; print(json.dumps([m for m in sys.argv[1:] if m in sys.modules]))',
+        *HEAVY_MODULES
+    ], cwd=SOFTWARE_DIR, capture_output=True, text=True, check=True)
+    result['heavy_modules'] = json.loads(proc.stdout)
+    if result['heavy_modules']:
+        log(f'WARNING: `import main.main` imports {", ".join(result["heavy_modules"])}.')
+    if ffmpeg is None:
+        return result
+
+    from main.api import probe_ffmpeg
+
+    probe = probe_ffmpeg.__wrapped__  # bypasses the in-process memo
+    with tempfile.TemporaryDirectory(prefix=f'{SOFTWARE_NAME}-bench-', dir=TMP_DIR) as tmp_dir:
+        cache_pth = os.path.join(tmp_dir, 'ffmpeg_probe.json')
+        for state in ('cold', 'warm'):
+            t0 = time.perf_counter()
+            probe(ffmpeg, cache_pth)
+            result[f'probe_{state}_ms'] = round((time.perf_counter() - t0)*1000, 1)
+    log(f'INFO: ffmpeg probe: {result["probe_cold_ms"]} ms cold, {result["probe_warm_ms"]} ms cached')
+    return result
+
+
+def bench_peaks(
+    colors: Sequence[str] = ('white', 'pink', 'brown', 'blue', 'violet', 'velvet'),
+    nlayers: Sequence[int] = (2, 7, 20),
+    bands: Sequence[str] = ('20-432', '20-20000'),
+    seeds: int = 10,
+    duration: float = 60,
+    engine: str = 'numpy',
+    ffmpeg: str = 'ffmpeg',
+    log: Callable[[str], None] = printer,
+) -> List[dict]:
+    """
+    Checks the planned default volume (see `main.gain.plan_volume`) against the audio: renders every color, number of layers,
+    and band at the volume planned for `TARGET_PEAK`, with `seeds` seeds each, and measures the sample peaks of the mixes.
+
+    ---
+
+    ## Params
+        - `colors`, `nlayers`: the values to sweep
+        - `bands`: `<highpass>-<lowpass>` in Hz
+        - `seeds`: renders per case (seeds `0` to `seeds - 1`)
+        - `duration`: track length in seconds
+        - `engine`: rendering pipeline
+        - `ffmpeg`: the ffmpeg command
+        - `log`: receives the progress messages
+
+    ## Returns
+        - `List[dict]`: one result per case: its parameters, `volume` (planned), `peaks` (dBFS per seed), `max_peak`, and `clipped` (seeds at 0 dBFS or above)
+    """
+    import numpy as np
+
+    from main.api import NoiseSpec, generate_pcm
+
+    results = []
+    cases = list(itertools.product(colors, nlayers, bands))
+    for n, (color, nlayer, band) in enumerate(cases, 1):
+        highpass, lowpass = (int(freq) for freq in band.split('-'))
+        peaks = []
+        volume = None
+        for seed in range(seeds):
+            spec = NoiseSpec(
+                duration=duration, color=color, nlayer=nlayer, highpass=highpass, lowpass=lowpass, seed=seed, engine=engine, ffmpeg=ffmpeg
+            ).resolve()
+            volume = spec.volume
+            peak = float(np.abs(generate_pcm(spec, log=lambda msg: None)).max())
+            peaks.append(round(20*math.log10(max(peak, 1e-12)), 2))
+        result = {
+            'color': color, 'nlayer': nlayer, 'band': band, 'volume': volume,
+            'peaks': peaks, 'max_peak': max(peaks), 'clipped': sum(peak >= 0 for peak in peaks),
+        }
+        log(f'{"ERROR" if result["clipped"] else "INFO"}: ({n}/{len(cases)}) {color} {nlayer}-layer {band} Hz at {volume}x: peak up to {result["max_peak"]:+.2f} dBFS')
+        results.append(result)
+    return results
+
+
+def _percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (`q` in [0, 100])."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, -(-len(ordered)*q // 100) - 1))]
+
+
+def bench_serve(
+    njobs: int = 50,
+    concurrency: int = 8,
+    workers: int = 4,
+    duration: float = 2,
+    engine: str = 'graph',
+    ffmpeg: str = 'ffmpeg',
+    cold: bool = True,
+    log: Callable[[str], None] = printer,
+) -> dict:
+    """
+    Load-tests the `serve` daemon: starts one with `workers` on a temporary socket, submits `njobs` short jobs from
+    `concurrency` clients, each waiting for its job before submitting the next, and measures the latency from submission
+    to the finished render. With `cold`, the same jobs also run as one `python noise_gen` process each, for comparison.
+
+    ---
+
+    ## Returns
+        - `dict`: per mode (`serve`, and `cold`): `jobs_per_minute`, `p50_latency`, `p99_latency` (seconds), and `failed`
+    """
+    from main.serve import Client
+
+    spec = {'duration': duration, 'engine': engine, 'output_ext': '.flac'}
+    results = {}
+    with tempfile.TemporaryDirectory(prefix=f'{SOFTWARE_NAME}-bench-', dir=TMP_DIR) as tmp_dir:
+        sock_pth = os.path.join(tmp_dir, 'serve.sock')
+        daemon = sp.Popen(
+            [sys.executable, '.', 'serve', '-so', sock_pth, '-w', str(workers), '-od', tmp_dir, '-ff', ffmpeg],
+            cwd=SOFTWARE_DIR, stdout=sp.DEVNULL, stderr=sp.DEVNULL
+        )
+        try:
+            t_limit = time.perf_counter() + 60
+            while not os.path.exists(sock_pth):  # the socket appears once every worker is warm
+                if (daemon.poll() is not None) or (time.perf_counter() > t_limit):
+                    raise RuntimeError('The serve daemon failed to start.')
+                time.sleep(0.05)
+
+            def submit_and_wait(n: int) -> Tuple[float, bool]:
+                with Client(sock_pth) as client:
+                    t0 = time.perf_counter()
+                    job = client.call('submit', spec={**spec, 'id': f'bench-{n}'})
+                    job = client.call('wait', job_id=job['job_id'])
+                    return time.perf_counter() - t0, job['state'] == 'done'
+
+            def run_cold(n: int) -> Tuple[float, bool]:
+                t0 = time.perf_counter()
+                proc = sp.run([
+                    sys.executable, '.', '-d', str(duration), '-e', engine, '-oe', '.flac', '--no-print',
+                    '-od', tmp_dir, '-on', f'cold-{n}', '-ff', ffmpeg
+                ], cwd=SOFTWARE_DIR, stdout=sp.DEVNULL, stderr=sp.DEVNULL, stdin=sp.DEVNULL)
+                return time.perf_counter() - t0, proc.returncode == 0
+
+            for mode, fn in [('serve', submit_and_wait)] + ([('cold', run_cold)] if cold else []):
+                t0 = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    outcomes = list(executor.map(fn, range(njobs)))
+                wall_time = time.perf_counter() - t0
+                latencies = [latency for latency, _ in outcomes]
+                results[mode] = {
+                    'jobs_per_minute': round(njobs/wall_time*60, 1),
+                    'p50_latency': round(_percentile(latencies, 50), 4),
+                    'p99_latency': round(_percentile(latencies, 99), 4),
+                    'failed': sum(not ok for _, ok in outcomes),
+                }
+                log(
+                    f'INFO: {mode}: {results[mode]["jobs_per_minute"]} jobs/min, latency p50 {results[mode]["p50_latency"]} secs, '
+                    f'p99 {results[mode]["p99_latency"]} secs, {results[mode]["failed"]} failed'
+                )
+        finally:
+            try:
+                with Client(sock_pth, timeout=5) as client:
+                    client.call('shutdown')
+                daemon.wait(timeout=15)
+            except (OSError, sp.TimeoutExpired):
+                daemon.kill()
+                daemon.wait()
+    return results
+
+
+def compare(old: List[dict], new: List[dict]) -> List[Tuple[dict, Optional[float], Optional[float]]]:
+    """Matches the cases of two suite runs; returns `(case, old wall time, new wall time)` for every case of `new`."""
+    key = lambda result: tuple(result[axis] for axis in SUITE_AXES)
+    old_times = {key(r): r.get('wall_time') for r in old}
+    return [({axis: r[axis] for axis in SUITE_AXES}, old_times.get(key(r)), r.get('wall_time')) for r in new]
+
+
+## <parser>
+parser = argparse.ArgumentParser(prog=f'{SOFTWARE_NAME} bench', description='Performance measurements')
+subparsers = parser.add_subparsers(dest='bench', required=True)
+
+dyn_vol_parser = subparsers.add_parser('dyn_vol', help='Mix throughput against the number of dynamic-volume changes')
+dyn_vol_parser.add_argument('-n', '--nchanges', nargs='+', default=[10, 100, 1000, 10000], type=int, help='Numbers of changes to sweep (default: 10 100 1000 10000)')
+dyn_vol_parser.add_argument('-d', '--duration', default=60, type=float, help='Track length in seconds (default: 60)')
+dyn_vol_parser.add_argument('-l', '--nlayer', default=7, type=int, help='Number of layers (default: 7)')
+dyn_vol_parser.add_argument('-m', '--mechanisms', nargs='+', default=list(DYN_VOL_MECHANISMS), choices=DYN_VOL_MECHANISMS, help='Mechanisms to compare (default: all)')
+dyn_vol_parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+dyn_vol_parser.add_argument('-ff', '--ffmpeg', default='ffmpeg', help='FFmpeg binary file path or command (default: ffmpeg)')
+
+suite_parser = subparsers.add_parser('suite', help='Wall time, stage times, peak RSS, and scratch usage across a parameter sweep')
+suite_parser.add_argument('-d', '--durations', nargs='+', default=[10], type=float, help='Track lengths in seconds (default: 10)')
+suite_parser.add_argument('-n', '--nlayers', nargs='+', default=[7], type=int, help='Numbers of layers (default: 7)')
+suite_parser.add_argument('-c', '--colors', nargs='+', default=['brown'], help='Noise colors (default: brown)')
+suite_parser.add_argument('-ch', '--channels', nargs='+', default=['stereo', 'mono'], help='channel layouts or counts (default: stereo mono)')
+suite_parser.add_argument('-dv', '--dyn_vol', nargs='+', default=['off', 'on'], choices=('off', 'on'), help='Dynamic volume, one change per second (default: off on)')
+suite_parser.add_argument('-oe', '--codecs', nargs='+', default=['.m4a', '.flac'], help='Output extensions (default: .m4a .flac)')
+suite_parser.add_argument('-e', '--engines', nargs='+', default=['graph', 'files', 'numpy'], help='Rendering pipelines (default: graph files numpy)')
+suite_parser.add_argument(
+    '-o', '--output',
+    help=f'Where to write the results as JSON (default: a timestamped file in {repr(OUTPUT_DIR)})'
+)
+suite_parser.add_argument('-ff', '--ffmpeg', default='ffmpeg', help='FFmpeg binary file path or command (default: ffmpeg)')
+suite_parser.add_argument(
+    '--stub', action='store_true',
+    help='Use a stub ffmpeg that renders nothing, to measure the pipeline overhead without ffmpeg (POSIX)'
+)
+
+startup_parser = subparsers.add_parser('startup', help='Startup time of the command line and of the ffmpeg probe')
+startup_parser.add_argument('-r', '--repeat', default=10, type=int, help='Runs per command, the median is kept (default: 10)')
+startup_parser.add_argument(
+    '-mx', '--max_ms', default=STARTUP_BUDGET_MS, type=float,
+    help=f'Exit with status 1 if `import main.main` adds more than this to the interpreter startup (median), or if it imports a heavy module (default: {STARTUP_BUDGET_MS})'
+)
+startup_parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+startup_parser.add_argument('-ff', '--ffmpeg', default='ffmpeg', help='FFmpeg binary file path or command (default: ffmpeg)')
+
+serve_parser = subparsers.add_parser('serve', help='Jobs per minute and latency of the serve daemon against one process per job')
+serve_parser.add_argument('-n', '--njobs', default=50, type=int, help='Number of jobs (default: 50)')
+serve_parser.add_argument('-c', '--concurrency', default=8, type=int, help='Number of clients submitting jobs at once (default: 8)')
+serve_parser.add_argument('-w', '--workers', default=4, type=int, help='Number of daemon workers (default: 4)')
+serve_parser.add_argument('-d', '--duration', default=2, type=float, help='Track length of each job in seconds (default: 2)')
+serve_parser.add_argument('-e', '--engine', default='graph', help='Rendering pipeline of each job (default: graph)')
+serve_parser.add_argument('--no_cold', dest='cold', action='store_false', help='Skip the one-process-per-job comparison')
+serve_parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+serve_parser.add_argument('-ff', '--ffmpeg', default='ffmpeg', help='FFmpeg binary file path or command (default: ffmpeg)')
+serve_parser.add_argument('--stub', action='store_true', help='Use a stub ffmpeg that renders nothing, to measure the daemon overhead (POSIX)')
+
+peaks_parser = subparsers.add_parser('peaks', help='Sample peaks of mixes rendered at the planned default volume, which must stay below 0 dBFS')
+peaks_parser.add_argument('-c', '--colors', nargs='+', default=['white', 'pink', 'brown', 'blue', 'violet', 'velvet'], help='Noise colors (default: all)')
+peaks_parser.add_argument('-n', '--nlayers', nargs='+', default=[2, 7, 20], type=int, help='Numbers of layers (default: 2 7 20)')
+peaks_parser.add_argument('-b', '--bands', nargs='+', default=['20-432', '20-20000'], help='Bands as <highpass>-<lowpass> in Hz (default: 20-432 20-20000)')
+peaks_parser.add_argument('-s', '--seeds', default=10, type=int, help='Renders per case (default: 10)')
+peaks_parser.add_argument('-d', '--duration', default=60, type=float, help='Track length in seconds (default: 60)')
+peaks_parser.add_argument('-e', '--engine', default='numpy', help='Rendering pipeline (default: numpy)')
+peaks_parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+peaks_parser.add_argument('-ff', '--ffmpeg', default='ffmpeg', help='FFmpeg binary file path or command (default: ffmpeg)')
+
+compare_parser = subparsers.add_parser('compare', help='Compare the wall times of two suite results')
+compare_parser.add_argument('old', help='Results of the baseline version')
+compare_parser.add_argument('new', help='Results of the new version')
+
+## </parser>
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parser.parse_args(argv)
+
+    if args.bench == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        print(f'{old["software_version"]} -> {new["software_version"]}')
+        for case, t_old, t_new in compare(old['results'], new['results']):
+            ratio = f'{t_new/t_old:.2f}x' if (t_old and t_new) else 'n/a'
+            print(f'{ratio:>8}  {t_old} -> {t_new} secs  {case}')
+        return
+
+    regression = False
+    if args.bench == 'startup':
+        results = bench_startup(args.repeat, args.ffmpeg)
+        regression = (results['import_cost_ms'] > args.max_ms) or bool(results['heavy_modules'])
+        if results['import_cost_ms'] > args.max_ms:
+            printer(f'ERROR: Importing the command line took {results["import_cost_ms"]} ms, over the {args.max_ms:g} ms budget.')
+    elif args.bench == 'peaks':
+        results = bench_peaks(args.colors, args.nlayers, args.bands, args.seeds, args.duration, args.engine, args.ffmpeg)
+        regression = any(result['clipped'] for result in results)
+    elif args.bench == 'serve':
+        results = bench_serve(
+            args.njobs, args.concurrency, args.workers, args.duration, args.engine,
+            STUB_FFMPEG if args.stub else args.ffmpeg, args.cold
+        )
+    elif args.bench == 'dyn_vol':
+        results = bench_dyn_vol(args.nchanges, args.duration, args.nlayer, args.mechanisms, args.ffmpeg)
+    else:
+        ffmpeg = STUB_FFMPEG if args.stub else args.ffmpeg
+        results = bench_suite(
+            args.durations, args.nlayers, args.colors, args.channels, args.dyn_vol, args.codecs, args.engines, ffmpeg
+        )
+        if args.output is None:
+            args.output = os.path.join(OUTPUT_DIR, f'bench {SOFTWARE_VER} {datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'software_version': SOFTWARE_VER,
+                'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'ffmpeg': 'stub' if getattr(args, 'stub', False) else args.ffmpeg,
+                'bench': args.bench,
+                'results': results,
+            }, f, indent=2)
+        printer(f'INFO: Results written to: {args.output}')
+
+    if regression:
+        sys.exit(1)
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+from typing import List, Optional, Tuple
+
+
+class Cache:
+    """
+    Content-addressed on-disk cache of rendered audio (base noises and final mixes).
+    Entries are named after a hash of the parameters that produced them and evicted least-recently-used first
+    once the cache grows past `max_bytes`.
+
+    ---
+
+    ## Params
+        - `root`: the cache folder (created if missing)
+        - `max_bytes`: size budget of the cache folder
+
+    ## Demo
+        >>> cache = Cache('~/.cache/noise_gen', 10*1024**3)
+        >>> key = Cache.key(kind='layer', color='brown', seed=42, duration=60)
+        >>> pth = cache.get(key, '.wav')
+        >>> if pth is None:
+        ...     tmp = cache.reserve(key, '.wav')
+        ...     try:
+        ...         render_to(tmp)
+        ...     except BaseException:
+        ...         cache.discard(tmp)
+        ...         raise
+        ...     pth = cache.commit(tmp, key, '.wav')
+    """
+
+    def __init__(self, root: str, max_bytes: int) -> None:
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._used = set()  # entries touched by this process, never evicted under its feet
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key(**params) -> str:
+        """Hashes the generation parameters (any JSON-serializable values) into a cache key."""
+        blob = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _pth(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key[:2], key + ext)
+
+    def get(self, key: str, ext: str) -> Optional[str]:
+        """Returns the path of the entry and marks it as recently used, or `None` on a miss."""
+        pth = self._pth(key, ext)
+        if not os.path.isfile(pth):
+            return None
+        os.utime(pth)
+        with self._lock:
+            self._used.add(pth)
+        return pth
+
+    def reserve(self, key: str, ext: str) -> str:
+        """Returns a temporary path to render a new entry into, see `commit`."""
+        pth = self._pth(key, ext)
+        os.makedirs(os.path.dirname(pth), exist_ok=True)
+        return os.path.join(os.path.dirname(pth), f'.{key}.{os.getpid()}.{threading.get_ident()}.partial{ext}')
+
+    def commit(self, tmp_pth: str, key: str, ext: str) -> str:
+        """Atomically publishes a rendered entry, evicts old entries if needed, and returns the entry path."""
+        pth = self._pth(key, ext)
+        os.replace(tmp_pth, pth)
+        with self._lock:
+            self._used.add(pth)
+        self.evict()
+        return pth
+
+    def discard(self, tmp_pth: str) -> None:
+        """Removes an entry reserved by `reserve` and abandoned before its `commit`."""
+        if os.path.exists(tmp_pth):
+            os.remove(tmp_pth)
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for dirpth, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith('.'):  # partial renders
+                    continue
+                pth = os.path.join(dirpth, filename)
+                try:
+                    st = os.stat(pth)
+                except FileNotFoundError:  # evicted by a concurrent run
+                    continue
+                entries.append((st.st_mtime, st.st_size, pth))
+        return entries
+
+    def evict(self) -> List[str]:
+        """Removes least-recently-used entries until the cache fits `max_bytes`; returns the removed paths."""
+        with self._lock:
+            keep = set(self._used)
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, pth in entries:
+            if total <= self.max_bytes:
+                break
+            if pth in keep:
+                continue
+            try:
+                os.remove(pth)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed.append(pth)
+        return removed
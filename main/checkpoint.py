@@ -0,0 +1,185 @@
+import dataclasses
+import json
+import os
+import shutil
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional
+
+import numpy as np
+
+from main.constants import SOFTWARE_VER
+from main.instrument import Instrument
+from main.synth import BLOCK_FRAMES, Synth
+from main.utils import printer
+
+if TYPE_CHECKING:
+    from main.api import NoiseSpec
+
+
+CHECKPOINT_FORMAT = 1  # version of the journal layout
+CHECKPOINT_JOURNAL = 'journal.json'
+SYNTH_FIELDS = ('duration', 'color', 'nlayer', 'highpass', 'lowpass', 'volume', 'dyn_vol', 'engine')  # the spec fields the segments depend on
+
+
+def _fsync_replace(src: str, dst: str) -> None:
+    """Moves `src` to `dst` once its data is on disk, so a crash or a power loss leaves either the old or the new file."""
+    fd = os.open(src, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(src, dst)
+
+
+def segment_frames(segment: float, sample_rate: int) -> int:
+    """
+    The frames per segment: `segment` seconds rounded to whole `BLOCK_FRAMES` blocks, so the synthesizer
+    sees the same blocks as an uninterrupted render and a resumed track is bit-identical to it.
+    """
+    return max(1, round(segment*sample_rate/BLOCK_FRAMES))*BLOCK_FRAMES
+
+
+class Checkpoint:
+    """
+    The folder of a checkpointed render (`NoiseSpec.segment`): the synthesized audio in segments of raw float32
+    (before resampling, normalization, and encoding), and `journal.json`, which holds the resolved spec, the layer seeds,
+    and every finished segment with the synthesizer state at its end (see `main.synth.Synth.get_state`).
+    A segment is listed only once its file is on disk, so a failure loses at most the segment being synthesized.
+    A resumed render replays the finished segments into the encoder and synthesizes the rest from the last state,
+    so the output is the same as if it had never stopped.
+
+    ---
+
+    ## Params
+        - `root`: the checkpoint folder (see `NoiseSpec.checkpoint_dir`)
+
+    ## Demo
+        >>> generate(NoiseSpec(duration=8*3600, engine='numpy', segment=600, output_name='night'))  # interrupted
+        >>> generate(Checkpoint(checkpoint_dir).spec())  # continues after the last finished segment
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.journal = self._load()
+
+    def _load(self) -> Optional[dict]:
+        pth = os.path.join(self.root, CHECKPOINT_JOURNAL)
+        if not os.path.exists(pth):
+            return None
+        with open(pth) as f:
+            journal = json.load(f)
+        if journal.get('format') != CHECKPOINT_FORMAT:
+            raise ValueError(f'Unsupported checkpoint (format {journal.get("format")}): {self.root}')
+        return journal
+
+    def _save(self) -> None:
+        pth = os.path.join(self.root, CHECKPOINT_JOURNAL)
+        tmp_pth = f'{pth}.{os.getpid()}.tmp'
+        with open(tmp_pth, 'w') as f:
+            json.dump({**self.journal, 'software_version': SOFTWARE_VER}, f)
+        _fsync_replace(tmp_pth, pth)
+
+    def spec(self) -> 'NoiseSpec':
+        """The resolved spec of the checkpointed render, to continue it with `generate`."""
+        from main.api import NoiseSpec
+
+        if self.journal is None:
+            raise ValueError(f'No checkpoint journal in: {self.root}')
+        return NoiseSpec(**self.journal['spec'])
+
+    def open(self, spec: 'NoiseSpec', seeds: List[List[int]], sample_rate: int, bank: Optional[str] = None) -> int:
+        """
+        Starts the journal of a resolved spec, or checks that the existing one holds the same audio (raises `ValueError`
+        otherwise); the other fields, e.g. the output formats, may change. Finished segments whose file is missing
+        or truncated are dropped, with those after them.
+
+        ---
+
+        ## Params
+            - `spec`: the resolved spec being rendered
+            - `seeds`: its layer seeds
+            - `sample_rate`: the synthesis rate
+            - `bank`: for the `bank` engine, the digest of the banked noises (see `main.bank.NoiseBank.digest`)
+
+        ## Returns
+            - `int`: the number of finished segments
+        """
+        fields = json.loads(json.dumps(dataclasses.asdict(spec)))
+        header = {
+            'format': CHECKPOINT_FORMAT,
+            'synth': {name: fields[name] for name in SYNTH_FIELDS},
+            'seeds': seeds,
+            'bank': bank,
+            'sample_rate': sample_rate,
+            'nchannel': spec.nchannel,
+            'segment_frames': segment_frames(spec.segment, sample_rate),
+        }
+        if self.journal is None:
+            os.makedirs(self.root, exist_ok=True)
+            self.journal = {**header, 'spec': fields, 'segments': []}
+            self._save()
+            return 0
+
+        for key, value in header.items():
+            if self.journal.get(key) != value:
+                raise ValueError(
+                    f'The checkpoint in {self.root} belongs to another render ({key} differs); '
+                    'continue it with `--resume`, or delete it.'
+                )
+        frame_bytes = 4*self.journal['nchannel']
+        for k, entry in enumerate(self.journal['segments']):
+            pth = os.path.join(self.root, entry['file'])
+            if (not os.path.isfile(pth)) or (os.path.getsize(pth) != entry['frames']*frame_bytes):
+                del self.journal['segments'][k:]
+                break
+        self.journal['spec'] = fields
+        self._save()
+        return len(self.journal['segments'])
+
+    def blocks(
+        self,
+        synth: Synth,
+        nframes: int,
+        log: Callable[[str], None] = printer,
+        instrument: Optional[Instrument] = None,
+    ) -> Iterator[np.ndarray]:
+        """
+        The `nframes` frames of the track as blocks of interleaved float32, like `Synth.blocks`: first the finished segments,
+        read back from disk, then the others, synthesized by `synth` from the last saved state, each one written and journaled
+        as it's yielded. `synth` must be built like the checkpointed one, in its initial state.
+        """
+        seg_frames = self.journal['segment_frames']
+        nchannel = self.journal['nchannel']
+        nsegment = -(-nframes // seg_frames)
+        done = self.journal['segments']
+
+        for entry in done:
+            pth = os.path.join(self.root, entry['file'])
+            for start in range(0, entry['frames'], BLOCK_FRAMES):
+                count = min(BLOCK_FRAMES, entry['frames'] - start)
+                yield np.fromfile(pth, np.float32, count*nchannel, offset=start*nchannel*4).reshape(count, nchannel)
+        if done:
+            synth.set_state(done[-1]['state'])
+
+        for k in range(len(done), nsegment):
+            name = f'segment_{str(k).zfill(5)}.f32'
+            pth = os.path.join(self.root, name)
+            partial_pth = pth + '.partial'
+            frames = min(seg_frames, nframes - k*seg_frames)
+            try:
+                with open(partial_pth, 'wb') as f:
+                    for block in synth.blocks(frames):
+                        f.write(block.data)
+                        yield block
+                _fsync_replace(partial_pth, pth)
+            finally:
+                if os.path.exists(partial_pth):
+                    os.remove(partial_pth)
+            done.append({'file': name, 'frames': frames, 'state': synth.get_state()})
+            self._save()
+            log(f'INFO: Checkpointed ({k + 1}/{nsegment}): {pth}')
+            if instrument is not None:
+                instrument.count('segments', k + 1, nsegment)
+
+    def remove(self) -> None:
+        """Deletes the folder, once the render is complete."""
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -19,4 +19,19 @@ ALLOWED_EXTENSIONS = (
     '.aiff',
     '.alac',
     '.opus'
-)
\ No newline at end of file
+)
+SAMPLE_RATE = 48000  # `anoisesrc` default
+TARGET_PEAK = -1.0  # dBFS, the level the volume is planned for when neither a volume nor a target is given
+
+## where `probe_ffmpeg` keeps what it learned about each ffmpeg binary
+PROBE_CACHE_PTH = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), SOFTWARE_NAME, 'ffmpeg_probe.json')
+
+ENVELOPE_RATE = 1000  # Hz, control rate of the gain curves handed to ffmpeg, upsampled by `aresample`
+PATTERN_DEFAULTS = {  # the dynamic-volume pattern parameters, see `main.envelope.pattern`
+    'nchanges': 30,
+    'vol_min': 0.65,
+    'vol_max': 1.0,
+    'persistence': 0.65,
+    'octaves': 3,
+    'frequency': 5,
+}
@@ -1,19 +1,22 @@
 import math
-import numpy as np
 import random
 import sys
 import tkinter as tk
 
-from carbon.ffmpeg import gen_dyn_vol
 from carbon.graph.graph2d import graph2d
 from carbon.gui.button import Button
 from carbon.gui.label import Label
 from carbon.gui.slider import Slider
-from carbon.noise import perlin_noise_1d
+
+from main.envelope import PATTERN_DEFAULTS, envelope_points
+
+
+REDRAW_INTERVAL = 16  # ms, about one frame of a 60 Hz display; slider events in between are coalesced (computed and drawn once)
+MAX_DRAWN_POINTS = 400  # the graph is decimated beyond this, the picked pattern keeps every point
 
 
 def dyn_vol(DUR):
-    """`DUR`: the output duration"""
+    """`DUR`: the output duration; returns the picked pattern, see `main.envelope.pattern`"""
 
     root = tk.Tk()
     root.attributes('-fullscreen', True)
@@ -31,32 +34,32 @@ def dyn_vol(DUR):
 
     class Rt:  # runtime
         
-        nchanges = 30
-        vol_min = 0.65
-        vol_max = 1.0
+        nchanges = PATTERN_DEFAULTS['nchanges']
+        vol_min = PATTERN_DEFAULTS['vol_min']
+        vol_max = PATTERN_DEFAULTS['vol_max']
         
         ## perlin noise
-        persistence = 0.65
-        octaves = 3
-        frequency = 5
+        persistence = PATTERN_DEFAULTS['persistence']
+        octaves = PATTERN_DEFAULTS['octaves']
+        frequency = PATTERN_DEFAULTS['frequency']
         seed = random.randint(-10000000000, 10000000000)
 
         ts = None
-        filter = None  # the ffmpeg dynamic-volume filter
+        redraw_pending = False
+
+    def compute():
+        Rt.ts = envelope_points(
+            DUR, Rt.nchanges, Rt.vol_min, Rt.vol_max, Rt.persistence, Rt.octaves, Rt.frequency, Rt.seed
+        )  # saved for futher processing
 
     def redraw():
+        Rt.redraw_pending = False
+        compute()
         page.delete('graph2d')
 
-        raw = []
-        for x in np.linspace(0, DUR, Rt.nchanges):
-            raw.append((x, perlin_noise_1d(x, Rt.persistence, Rt.octaves, Rt.frequency, Rt.seed)))
-
-        ## adjusting the y interval
-        y_values = [y for (_, y) in raw]
-        ymin_current = min(y_values)
-        ymax_current = max(y_values)
-        scale_factor = (Rt.vol_max - Rt.vol_min) / (ymax_current - ymin_current)
-        scaled = [(x, Rt.vol_min + (y - ymin_current)*scale_factor) for (x, y) in raw]
+        scaled = Rt.ts
+        if len(scaled) > MAX_DRAWN_POINTS:
+            scaled = scaled[::math.ceil(len(scaled)/MAX_DRAWN_POINTS)] + [scaled[-1]]
 
         WIDTH = mon_width*0.6
         HEIGHT = mon_height*0.6
@@ -68,13 +71,16 @@ def dyn_vol(DUR):
             width=WIDTH,
             height=HEIGHT,
             title='Dynamic Volume',
-            show_points=True,
+            show_points=(len(scaled) <= 100),
             points_rad=5,
             x_axis_label='time',
             y_axis_label='vol',
         )
 
-        Rt.ts = scaled  # saved for futher processing
+    def request_redraw():
+        if not Rt.redraw_pending:
+            Rt.redraw_pending = True
+            root.after(REDRAW_INTERVAL, redraw)
 
     redraw()  # init
 
@@ -83,11 +89,11 @@ def dyn_vol(DUR):
     GAP = 60
     def fn(var):
         setattr(Rt, var, Slider.get_value_by_id(var))
-        redraw()
+        request_redraw()
     Slider(
         id='nchanges',
         min=3,
-        max=max(50, int(DUR/4)),  # If the `nchanges` is too big, the command won't work.
+        max=max(50, int(DUR)),  # up to one change per second; the headless options allow any number
         step=1,
         init=Rt.nchanges,
         x=X,
@@ -172,7 +178,7 @@ def dyn_vol(DUR):
     )
     def new_seed():
         Rt.seed = random.randint(-10000000000, 10000000000)
-        redraw()
+        request_redraw()
         Label.set_text_by_id('seed', f'Perlin noise seed: {Rt.seed}',)
     Button(
         id='new_seed',
@@ -182,8 +188,6 @@ def dyn_vol(DUR):
         fn=new_seed
     )
     def pick_the_pattern():
-        Rt.filter = gen_dyn_vol(Rt.ts)
-        
         ## To ensure a fresh page for the next GUI, it is necessary to destroy all current GUI widgets.
         ## These must be done before `root.destroy()`
         Button.destroy_all()
@@ -234,15 +238,14 @@ def dyn_vol(DUR):
 
     root.mainloop()
 
-    return (
-        f',{Rt.filter}',
-        {
-            'nchanges': Rt.nchanges,
-            'vol_min': Rt.vol_min,
-            'vol_max': Rt.vol_max,
-            'persistence': Rt.persistence,
-            'octaves': Rt.octaves,
-            'frequency': Rt.frequency,
-            'seed': Rt.seed,
-        }
-    )
\ No newline at end of file
+    compute()  # the last slider event may not have been redrawn yet when the pattern was picked
+    return {
+        'nchanges': Rt.nchanges,
+        'vol_min': Rt.vol_min,
+        'vol_max': Rt.vol_max,
+        'persistence': Rt.persistence,
+        'octaves': Rt.octaves,
+        'frequency': Rt.frequency,
+        'seed': Rt.seed,
+        'points': Rt.ts,  # the picked `(time, vol)` pairs
+    }
\ No newline at end of file
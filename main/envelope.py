@@ -0,0 +1,145 @@
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from main.constants import ENVELOPE_RATE, PATTERN_DEFAULTS
+from main.perlin import perlin_1d
+from main.seed import derive_seed
+
+
+def envelope_points(
+    duration: float,
+    nchanges: int,
+    vol_min: float,
+    vol_max: float,
+    persistence: float,
+    octaves: int,
+    frequency: float,
+    seed: int,
+) -> List[Tuple[float, float]]:
+    """
+    The dynamic-volume curve: `nchanges` Perlin noise points spread over the track, scaled to `[vol_min, vol_max]`.
+
+    ---
+
+    ## Params
+        - `duration`: track length in seconds
+        - `nchanges`: number of points, any number (e.g. one per second of a 10-hour track)
+        - `vol_min`, `vol_max`: the volume range
+        - `persistence`, `octaves`, `frequency`, `seed`: the Perlin noise parameters, see `main.perlin.perlin_1d`
+
+    ## Returns
+        - `List[Tuple[float, float]]`: the `(time, vol)` points
+    """
+    ## the track length is mapped to [0, 1], so `frequency` is in cycles per track
+    y = perlin_1d(np.linspace(0, 1, nchanges), persistence, octaves, frequency, seed)
+
+    ## adjusting the y interval
+    y_range = y.max() - y.min()
+    scale_factor = (vol_max - vol_min) / y_range if y_range > 0 else 0
+    y = vol_min + (y - y.min())*scale_factor
+
+    return list(zip(np.linspace(0, duration, nchanges).tolist(), y.tolist()))
+
+
+def pattern(duration: float, seed: int, **params) -> dict:
+    """
+    Builds a dynamic-volume pattern (the dict `main.dyn_vol.dyn_vol` returns) without the GUI.
+
+    ---
+
+    ## Params
+        - `duration`: track length in seconds
+        - `seed`: the Perlin noise seed
+        - `params`: any of `PATTERN_DEFAULTS` (`nchanges`, `vol_min`, `vol_max`, `persistence`, `octaves`, `frequency`)
+
+    ## Returns
+        - `dict`: the parameters, plus the `(time, vol)` `points`
+
+    ## Demo
+        >>> spec = NoiseSpec(duration=36000, dyn_vol=[pattern(36000, seed=1, nchanges=36000)]*2)
+    """
+    unknown = set(params) - set(PATTERN_DEFAULTS)
+    if unknown:
+        raise ValueError(f'Unknown dynamic volume parameters: {", ".join(sorted(unknown))}')
+    pat = {**PATTERN_DEFAULTS, **params, 'seed': seed}
+
+    if pat['nchanges'] < 2:
+        raise ValueError('Dynamic volume needs at least 2 changes.')
+    if not (0 <= pat['vol_min'] <= pat['vol_max']):
+        raise ValueError('Dynamic volume range must satisfy 0 <= min <= max.')
+    if pat['octaves'] < 1:
+        raise ValueError('Dynamic volume needs at least 1 Perlin noise octave.')
+
+    pat['points'] = envelope_points(duration, **pat)
+    return pat
+
+
+def resolve_patterns(duration: float, master_seed: int, patterns: Sequence[dict]) -> List[dict]:
+    """
+    Fills in the `points` of the patterns given by parameters only (e.g. from the command line or a batch manifest).
+    A missing seed is derived from the master seed and the channel; a dict passed for several channels
+    gives them the same pattern.
+    """
+    resolved = []
+    for ch, pat in enumerate(patterns):
+        shared = next((resolved[i] for i in range(ch) if patterns[i] is pat), None)
+        if shared is not None:
+            resolved.append(shared)
+        elif 'points' in pat:
+            resolved.append(pat)
+        else:
+            params = dict(pat)
+            seed = params.pop('seed', None)
+            resolved.append(pattern(duration, derive_seed(master_seed, 'dyn_vol', ch) if seed is None else seed, **params))
+    return resolved
+
+
+def gain_blocks(
+    points: Sequence[Tuple[float, float]],
+    nframes: int,
+    rate: int,
+    block_frames: int = 2**16,
+) -> Iterator[np.ndarray]:
+    """
+    Samples the piecewise-linear curve through `points` at `rate` Hz, block by block,
+    so the memory use doesn't depend on the track length.
+
+    ---
+
+    ## Params
+        - `points`: the `(time, vol)` points
+        - `nframes`: number of samples
+        - `rate`: sample rate
+        - `block_frames`: samples per block
+
+    ## Returns
+        - `Iterator[np.ndarray]`: float32 gains
+    """
+    t_pts = np.array([t for t, _ in points])
+    v_pts = np.array([v for _, v in points])
+    for start in range(0, nframes, block_frames):
+        t = np.arange(start, min(nframes, start + block_frames)) / rate
+        yield np.interp(t, t_pts, v_pts).astype(np.float32)
+
+
+def write_envelope(pth: str, points: Sequence[Tuple[float, float]], duration: float, rate: int = ENVELOPE_RATE) -> None:
+    """
+    Writes the gain curve as raw mono float32 at `rate` Hz, the input of `main.graph.envelope_chain`.
+    One extra sample past the end keeps the upsampled curve at least as long as the track.
+    """
+    with open(pth, 'wb') as f:
+        for block in gain_blocks(points, int(np.ceil(duration*rate)) + 1, rate):
+            f.write(block.data)
+
+
+def envelope_input(pth: str, rate: int = ENVELOPE_RATE) -> List[str]:
+    """ffmpeg input arguments reading a file written by `write_envelope`."""
+    return ['-f', 'f32le', '-ar', str(rate), '-ac', '1', '-i', pth]
+
+
+def dedup(patterns: Optional[Sequence[dict]]) -> List[int]:
+    """Maps each channel to the first channel with the same pattern, so shared curves are written once."""
+    if patterns is None:
+        return []
+    return [next(i for i in range(ch + 1) if patterns[i] is pat or patterns[i] == pat) for ch, pat in enumerate(patterns)]
@@ -0,0 +1,50 @@
+import math
+from typing import Tuple
+
+from main.constants import SAMPLE_RATE
+
+
+## `anoisesrc` color filters (libavfilter/asrc_anoisesrc.c), written as banks of one-pole sections:
+## y_i[n] = a_i*y_i[n-1] + c_i*w[n], out = gain*(sum_i y_i[n] + d0*w[n] + d1*w[n-1])
+_PINK_A = (0.99886, 0.99332, 0.96900, 0.86650, 0.55000, -0.7616)
+_PINK_C = (0.0555179, 0.0750759, 0.1538520, 0.3104856, 0.5329522, -0.0168980)
+COLOR_SECTIONS = {
+    'white': ((), (), 1.0, 0.0, 1.0),
+    'pink': (_PINK_A, _PINK_C, 0.5362, 0.115926, 0.11),
+    'blue': (tuple(-a for a in _PINK_A), _PINK_C, 0.5362, 0.115926, 0.11),
+    'brown': ((1/1.02,), (0.02/1.02,), 0.0, 0.0, 3.5),
+    'violet': ((-1/1.02,), (0.02/1.02,), 0.0, 0.0, 3.5),
+}
+VELVET_DENSITY = 0.05  # `anoisesrc` default impulse density
+MULTIRATE_MARGIN = 8  # a reduced synthesis rate is at least this many times the lowpass frequency
+
+
+def rbj_coefs(kind: str, freq: float, sample_rate: int, q: float = 0.707) -> Tuple[float, ...]:
+    """`(b0, b1, b2, a1, a2)` of ffmpeg's default 2-pole `highpass`/`lowpass` (RBJ cookbook, width_type=q)."""
+    w0 = 2*math.pi*freq/sample_rate
+    alpha = math.sin(w0)/(2*q)
+    cos = math.cos(w0)
+    a0 = 1 + alpha
+    if kind == 'lowpass':
+        b = ((1 - cos)/2, 1 - cos, (1 - cos)/2)
+    else:
+        b = ((1 + cos)/2, -(1 + cos), (1 + cos)/2)
+    return (b[0]/a0, b[1]/a0, b[2]/a0, -2*cos/a0, (1 - alpha)/a0)
+
+
+def multirate_sample_rate(color: str, lowpass: float) -> int:
+    """
+    The lowest sample rate, dividing `SAMPLE_RATE`, at which the band below `lowpass` can be synthesized:
+    its Nyquist frequency is `MULTIRATE_MARGIN/2` times the lowpass, where the 2-pole lowpass has already removed
+    all but a fraction of a percent of the power. Velvet noise is a train of single-sample impulses, so it stays at `SAMPLE_RATE`.
+
+    ## Demo
+        >>> multirate_sample_rate('brown', 432)  # 12 times fewer samples
+        4000
+    """
+    if color == 'velvet':
+        return SAMPLE_RATE
+    for k in range(max(1, int(SAMPLE_RATE / (MULTIRATE_MARGIN*lowpass))), 0, -1):
+        if SAMPLE_RATE % k == 0:
+            return SAMPLE_RATE // k
+    return SAMPLE_RATE
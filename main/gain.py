@@ -0,0 +1,253 @@
+import cmath
+import functools
+import math
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Tuple
+
+from main.constants import SAMPLE_RATE, TARGET_PEAK
+from main.filters import COLOR_SECTIONS, VELVET_DENSITY, rbj_coefs
+
+## pure Python on purpose: the volume is planned by `NoiseSpec.resolve`, before any render, so NumPy isn't imported for it
+if TYPE_CHECKING:
+    from main.api import NoiseSpec
+
+
+## ITU-R BS.1770 K-weighting at 48 kHz, as `(b0, b1, b2, a1, a2)`: the head's high shelf, then the RLB highpass
+K_WEIGHTING = (
+    (1.53512485958697, -2.69169618940638, 1.19839281085285, -1.69065929318241, 0.73248077421585),
+    (1.0, -2.0, 1.0, -1.99004745483398, 0.99007225036621),
+)
+LUFS_WEIGHTS = {'LFE': 0.0, 'BL': 1.41, 'BR': 1.41, 'SL': 1.41, 'SR': 1.41}  # BS.1770 channel weights, 1.0 for the others
+GRID_POINTS = 1000  # log-spaced frequencies, from 1 Hz to the Nyquist frequency, the spectra are integrated over
+PEAK_TAPS = (1024, 128)  # the peak model follows the largest of the leading impulse-response taps exactly, the rest as Gaussian
+PEAK_EXCEEDANCE = 1e-4  # the planned peak is the level a track exceeds with this (nominal) probability, not its typical peak
+PROBE_SKIP = 0.5  # seconds at the start of a probe render left out of the measurement, while the filters settle
+
+
+def _biquad_gain(coefs: Sequence[float], z1: complex) -> float:
+    """`|H|^2` of a biquad `(b0, b1, b2, a1, a2)` at `z1 = exp(-j*w)`."""
+    b0, b1, b2, a1, a2 = coefs
+    return abs((b0 + z1*(b1 + z1*b2))/(1 + z1*(a1 + z1*a2)))**2
+
+
+def _color_gain(color: str, z1: complex) -> float:
+    """`|H|^2` of the `anoisesrc` color filter at `z1 = exp(-j*w)`, from the same sections as `main.synth.Synth`."""
+    if color in ('white', 'velvet'):
+        return 1.0
+    a, c, d0, d1, gain = COLOR_SECTIONS[color]
+    h = d0 + d1*z1 + sum(ci/(1 - ai*z1) for ai, ci in zip(a, c))
+    return abs(gain*h)**2
+
+
+@functools.lru_cache(maxsize=None)
+def layer_stats(color: str, highpass: float, lowpass: float) -> Tuple[float, float, float]:
+    """
+    The statistics of one layer of `color` noise after the band filters, integrated over the frequency responses of
+    `anoisesrc`, `highpass`, and `lowpass` (at `SAMPLE_RATE`, whatever the engine): the layers are white noise, uniform in [-1, 1)
+    (velvet: +/-1 impulses at `VELVET_DENSITY`), colored by linear filters, so their spectrum is known exactly.
+    Raises `ValueError` for an unknown color or an empty band.
+
+    ---
+
+    ## Returns
+        - `Tuple[float, float, float]`: the power (mean square), the K-weighted power (see `K_WEIGHTING`),
+          and the rate of zero upcrossings in Hz (the square root of the spectrum's normalized second moment)
+    """
+    if (color not in COLOR_SECTIONS) and (color != 'velvet'):
+        raise ValueError(f'Unknown color: {color}')
+    nyquist = SAMPLE_RATE/2
+    if not (0 < highpass < lowpass < nyquist):
+        raise ValueError(f'Invalid band: {highpass}-{lowpass} Hz')
+    hp = rbj_coefs('highpass', highpass, SAMPLE_RATE)
+    lp = rbj_coefs('lowpass', lowpass, SAMPLE_RATE)
+
+    ## trapezoidal sums of the one-sided spectrum `S(f)` and of `f^2*S(f)`
+    ratio = nyquist**(1/(GRID_POINTS - 1))
+    m0 = mk = m2 = 0.0
+    prev = None
+    for i in range(GRID_POINTS):
+        f = ratio**i
+        z1 = cmath.exp(-2j*math.pi*f/SAMPLE_RATE)
+        s = _color_gain(color, z1)*_biquad_gain(hp, z1)*_biquad_gain(lp, z1)
+        sk = s*_biquad_gain(K_WEIGHTING[0], z1)*_biquad_gain(K_WEIGHTING[1], z1)
+        if prev is not None:
+            f0, s0, sk0 = prev
+            df = (f - f0)/2
+            m0 += (s + s0)*df
+            mk += (sk + sk0)*df
+            m2 += (f*f*s + f0*f0*s0)*df
+        prev = (f, s, sk)
+
+    density = (VELVET_DENSITY if color == 'velvet' else 1/3)*2/SAMPLE_RATE  # white noise variance, spread over [0, nyquist]
+    return m0*density, mk*density, math.sqrt(m2/m0)
+
+
+@functools.lru_cache(maxsize=None)
+def _impulse_taps(color: str, highpass: float, lowpass: float) -> Tuple[float, ...]:
+    """The `PEAK_TAPS[1]` largest of the first `PEAK_TAPS[0]` samples of the impulse response of the color and band filters."""
+    a, c, d0, d1, gain = ((), (), 1.0, 0.0, 1.0) if color == 'velvet' else COLOR_SECTIONS[color]
+    biquads = [(rbj_coefs(kind, freq, SAMPLE_RATE), [0.0, 0.0]) for kind, freq in (('highpass', highpass), ('lowpass', lowpass))]
+    y = [0.0]*len(a)
+    taps = []
+    for n in range(PEAK_TAPS[0]):
+        w = 1.0 if n == 0 else 0.0
+        x = d0*w + (d1 if n == 1 else 0.0)
+        for i in range(len(a)):
+            y[i] = a[i]*y[i] + c[i]*w
+            x += y[i]
+        x *= gain
+        for (b0, b1, b2, a1, a2), z in biquads:  # transposed direct form II
+            out = b0*x + z[0]
+            z[0] = b1*x - a1*out + z[1]
+            z[1] = b2*x - a2*out
+            x = out
+        taps.append(x)
+    return tuple(sorted(taps, key=abs, reverse=True)[:PEAK_TAPS[1]])
+
+
+def _white_cgf(color: str, t: float) -> Tuple[float, float]:
+    """The cumulant generating function of one white-noise sample (uniform in [-1, 1), or velvet's +/-1 impulses) and its derivative at `t`."""
+    x = abs(t)
+    if x < 1e-4:
+        var = VELVET_DENSITY if color == 'velvet' else 1/3
+        return var*t*t/2, var*t
+    e = math.exp(-x)
+    if color == 'velvet':  # log(1 - p + p*cosh(t)), written for large `t`
+        p = VELVET_DENSITY
+        rest = p/2*(1 + e*e) + (1 - p)*e
+        return x + math.log(rest), math.copysign(p/2*(1 - e*e)/rest, t)
+    return x - math.log(2*x) + math.log1p(-e*e), math.copysign((1 + e*e)/(1 - e*e) - 1/x, t)  # log(sinh(t)/t)
+
+
+@functools.lru_cache(maxsize=None)
+def peak_level(color: str, highpass: float, lowpass: float, nlayer: int, chances: int) -> float:
+    """
+    The level the mix of `nlayer` layers (at volume 1) exceeds with probability `PEAK_EXCEEDANCE` over `chances` independent tries:
+    the `u` whose large-deviation rate `sup_s(s*u - K(s))` is `log(chances/PEAK_EXCEEDANCE)`, from the cumulant generating function
+    `K` of the filtered white noise. For a Gaussian noise this is Rice's `sigma*sqrt(2*log(chances/PEAK_EXCEEDANCE))`; here the largest
+    impulse-response taps keep the distribution of the white samples, so mixes with light tails (e.g. few layers over a wide band)
+    or heavy ones (velvet impulses) get their own peak. Aiming this level rather than the typical peak (`log(chances)`, which half of
+    the tracks exceed) keeps every seed below the target; the peaks of narrow bands spread wider than the model's tail, so the
+    probability is set well below the clipping rate that is actually accepted (see `bench peaks`).
+    """
+    power = layer_stats(color, highpass, lowpass)[0]
+    var = VELVET_DENSITY if color == 'velvet' else 1/3
+    taps = _impulse_taps(color, highpass, lowpass)
+    rest = max(0.0, power/var - sum(h*h for h in taps))*var/nlayer  # variance of the other taps' part of the mix
+
+    def rate(s: float) -> Tuple[float, float]:
+        """The level `K'(s)` and its rate `s*K'(s) - K(s)`."""
+        k, dk = rest*s*s/2, rest*s
+        for h in taps:
+            ki, dki = _white_cgf(color, s*h/nlayer)
+            k += nlayer*ki
+            dk += h*dki
+        return dk, s*dk - k
+
+    target = math.log(max(chances, 1)/PEAK_EXCEEDANCE)
+    lo, hi = 0.0, 1.0
+    while rate(hi)[1] < target:
+        lo, hi = hi, hi*2
+    for _ in range(40):
+        mid = (lo + hi)/2
+        if rate(mid)[1] < target:
+            lo = mid
+        else:
+            hi = mid
+    return rate(hi)[0]
+
+
+def _envelope_stats(pattern: Optional[dict], duration: float) -> Tuple[float, float]:
+    """The mean square and the maximum of a dynamic-volume gain (1 without one), exact for the piecewise-linear `points`."""
+    if pattern is None:
+        return 1.0, 1.0
+    points = pattern.get('points')
+    if not points:  # parameters only (not resolved): assume the loudest
+        return pattern['vol_max']**2, pattern['vol_max']
+    total = 0.0
+    for (t0, v0), (t1, v1) in zip(points, points[1:]):
+        total += (t1 - t0)*(v0*v0 + v0*v1 + v1*v1)/3
+    span = points[-1][0] - points[0][0]
+    return (total/span if span > 0 else points[0][1]**2), max(v for _, v in points)
+
+
+@functools.lru_cache(maxsize=None)
+def _probe_power(
+    engine: str, color: str, nlayer: int, highpass: float, lowpass: float, layout: str, seed: Optional[int],
+    multirate: bool, bank_dir: Optional[str], tmp_dir: Optional[str], ffmpeg: str, seconds: float,
+) -> float:
+    """The power of one layer, measured on the first `seconds` of the track rendered by its engine at volume 1."""
+    from main.api import NoiseSpec, generate_pcm
+
+    probe = NoiseSpec(
+        duration=PROBE_SKIP + seconds, color=color, nlayer=nlayer, highpass=highpass, lowpass=lowpass, volume=1,
+        channels=layout, seed=seed, engine=engine, multirate=multirate, bank_dir=bank_dir, tmp_dir=tmp_dir, ffmpeg=ffmpeg,
+    )
+    pcm = generate_pcm(probe, log=lambda msg: None)[round(PROBE_SKIP*SAMPLE_RATE):]
+    return float((pcm.astype('float64')**2).mean())*nlayer  # `amix` divides the power of independent layers by their number
+
+
+def predict_levels(spec: 'NoiseSpec', volume: Optional[float] = None) -> Dict[str, float]:
+    """
+    The expected levels of a spec's mix before encoding, without rendering it (unless `spec.gain_probe` asks for a measurement).
+    `amix` averages independent layers, so the mix has `1/nlayer` of a layer's power (see `layer_stats`), times the volume and
+    the mean square of the dynamic volume. The loudness is BS.1770's, without the gating (the noise is stationary). The peak is
+    a level the mix rarely exceeds (see `peak_level`), with each channel at its loudest dynamic volume.
+    Raises `ValueError` if the spec can't be rendered.
+
+    ---
+
+    ## Params
+        - `spec`: what to render
+        - `volume`: the volume to assume (default: `spec.volume`)
+
+    ## Returns
+        - `Dict[str, float]`: `peak` (dBFS, sample peak) and `lufs` (integrated loudness)
+
+    ## Demo
+        >>> predict_levels(NoiseSpec(color='pink', volume=4))
+        {'peak': 0.53, 'lufs': -15.17}
+    """
+    volume = spec.volume if volume is None else volume
+    names = spec.channel_names
+    if (not names) or (spec.nlayer < 1) or (volume <= 0):
+        raise ValueError('Invalid channels, number of layers, or volume.')
+    color = spec.color.lower()
+    power, k_power, crossings = layer_stats(color, spec.highpass, spec.lowpass)
+    correction = 1.0  # the spectrum's shape is known; a probe corrects its level
+    if spec.gain_probe is not None:
+        correction = _probe_power(
+            spec.engine, color, spec.nlayer, spec.highpass, spec.lowpass, spec.layout, spec.seed,
+            spec.multirate, spec.bank_dir, spec.tmp_dir, spec.ffmpeg, spec.gain_probe
+        )/power
+
+    envelopes = [_envelope_stats(None if spec.dyn_vol is None else spec.dyn_vol[ch], spec.duration) for ch in range(len(names))]
+    loudness = sum(LUFS_WEIGHTS.get(name, 1.0)*mean_square for name, (mean_square, _) in zip(names, envelopes))
+    loudness *= volume**2*correction*k_power/spec.nlayer
+
+    ## each channel has about `2*crossings` chances per second to reach a new extreme (either sign)
+    peak = peak_level(color, spec.highpass, spec.lowpass, spec.nlayer, round(2*len(names)*crossings*spec.duration))
+    peak *= volume*max(vol_max for _, vol_max in envelopes)*math.sqrt(correction)
+
+    return {
+        'peak': round(20*math.log10(peak), 2),
+        'lufs': round(-0.691 + 10*math.log10(loudness), 2) if loudness > 0 else -math.inf,
+    }
+
+
+def plan_volume(spec: 'NoiseSpec') -> float:
+    """
+    The volume that brings a spec's mix to `spec.target_lufs`, or else to `spec.target_peak` (default: `TARGET_PEAK`)
+    (see `predict_levels`), with no extra pass over the audio. Raises `ValueError` if the spec can't be rendered.
+
+    ## Demo
+        >>> plan_volume(NoiseSpec(color='pink', nlayer=12, target_lufs=-23))
+        2.13
+    """
+    levels = predict_levels(spec, volume=1)
+    if spec.target_lufs is not None:
+        if levels['lufs'] == -math.inf:
+            raise ValueError('The loudness of a mix of weight-0 channels can\'t be planned.')
+        gain = spec.target_lufs - levels['lufs']
+    else:
+        gain = (TARGET_PEAK if spec.target_peak is None else spec.target_peak) - levels['peak']
+    return max(0.01, round(10**(gain/20), 2))
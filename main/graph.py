@@ -0,0 +1,103 @@
+from typing import List, Optional, Sequence
+
+from main.constants import SAMPLE_RATE
+
+
+def envelope_chain(src: str, env_input: int, out: str) -> str:
+    """
+    Filtergraph multiplying the stream labeled `src` by the gain curve read by ffmpeg input `env_input`
+    (see `main.envelope.write_envelope`), into `out`. The open `out` lets callers append filters.
+    The curve is smooth, so the shortest resampling filter is enough (within 1e-4 of the exact
+    per-sample interpolation) and costs less than the default one; see `main.bench`.
+
+    ## Demo
+        >>> envelope_chain('[c0m]', 2, '[c0]')
+        '[2:a]aresample=48000:filter_size=1:phase_shift=0[c0me];[c0m][c0me]amultiply[c0]'
+    """
+    env = src[:-1] + 'e]'
+    return f'[{env_input}:a]aresample={SAMPLE_RATE}:filter_size=1:phase_shift=0{env};{src}{env}amultiply{out}'
+
+
+def build_filter_complex(
+    dur: float,
+    color: str,
+    seeds: Sequence[Sequence[int]],
+    highpass: int,
+    lowpass: int,
+    volume: float,
+    envelope_inputs: Sequence[Optional[int]],
+    norm_filter: str,
+    layout: Optional[str] = None,
+    layer_inputs: Optional[Sequence[Sequence[int]]] = None,
+) -> str:
+    """
+    Builds a single `-filter_complex` graph that renders the whole track in one ffmpeg run:
+    every `anoisesrc` layer, the per-channel `amix`/band/volume chains side by side, and the final `amerge`
+    of the channels, which feeds the encoder directly.
+
+    ---
+
+    ## Params
+        - `dur`: track length in seconds
+        - `color`: the `anoisesrc` noise color
+        - `seeds`: one list of layer seeds per channel
+        - `highpass`, `lowpass`: the band edges in Hz
+        - `volume`: the volume amplification applied after mixing
+        - `envelope_inputs`: per channel, `None` or the index of the ffmpeg input holding its dynamic-volume gain curve
+        - `norm_filter`: `''` or `',dynaudnorm'`, applied to the final stream
+        - `layout`: the ffmpeg channel layout of the output (default: `stereo` for 2 channels, otherwise `<n>c`)
+        - `layer_inputs`: per channel and layer, the index of an ffmpeg input to use instead of rendering the layer with `anoisesrc`
+
+    ## Returns
+        - `str`: the filtergraph; its output pad is labeled `[out]`
+
+    ## Demo
+        >>> build_filter_complex(60, 'brown', [[1, 2]], 20, 432, 1, [None], '')
+        'anoisesrc=d=60:c=brown:s=1[c0l0];anoisesrc=d=60:c=brown:s=2[c0l1];[c0l0][c0l1]amix=inputs=2,highpass=f=20,lowpass=f=432,volume=1[out]'
+    """
+    nchannel = len(seeds)
+    chains: List[str] = []
+
+    for ch, layer_seeds in enumerate(seeds):
+        labels = ''
+        for i, seed in enumerate(layer_seeds):
+            if layer_inputs is not None:
+                labels += f'[{layer_inputs[ch][i]}:a]'
+                continue
+            chains.append(f'anoisesrc=d={dur}:c={color}:s={seed}[c{ch}l{i}]')
+            labels += f'[c{ch}l{i}]'
+
+        out_label = '[out]' if nchannel == 1 else f'[c{ch}]'
+        mix = f'{labels}amix=inputs={len(layer_seeds)},highpass=f={highpass},lowpass=f={lowpass},volume={volume}'
+        if envelope_inputs[ch] is not None:
+            chains.append(f'{mix}[c{ch}m]')
+            mix = envelope_chain(f'[c{ch}m]', envelope_inputs[ch], '')
+        chains.append(mix + (norm_filter if nchannel == 1 else '') + out_label)
+
+    if nchannel > 1:
+        labels = ''.join(f'[c{ch}]' for ch in range(nchannel))
+        layout = layout or ('stereo' if nchannel == 2 else f'{nchannel}c')
+        channel_map = '|'.join(str(ch) for ch in range(nchannel))
+        chains.append(f'{labels}amerge=inputs={nchannel},channelmap=map={channel_map}:channel_layout={layout}{norm_filter}[out]')
+
+    return ';'.join(chains)
+
+
+def loop_filter_complex(nchannel: int, layout: str, envelope_inputs: Sequence[Optional[int]], norm_filter: str) -> str:
+    """
+    Filtergraph applying the per-channel gain curves and `norm_filter` to the looped tile read by ffmpeg input 0
+    (see `main.tile.make_seamless`), into `[out]`. The curves are merged into one stream of `layout` at the control
+    rate, so a single `amultiply` covers every channel.
+
+    ## Demo
+        >>> loop_filter_complex(2, 'stereo', [1, 2], '')
+        '[1:a][2:a]amerge=inputs=2,channelmap=map=0|1:channel_layout=stereo,aresample=48000:filter_size=1:phase_shift=0[env];[0:a][env]amultiply[out]'
+    """
+    if envelope_inputs[0] is None:
+        return f'[0:a]{norm_filter[1:] or "anull"}[out]'
+
+    env = ''.join(f'[{i}:a]' for i in envelope_inputs)
+    if nchannel > 1:
+        channel_map = '|'.join(str(ch) for ch in range(nchannel))
+        env += f'amerge=inputs={nchannel},channelmap=map={channel_map}:channel_layout={layout},'
+    return f'{env}aresample={SAMPLE_RATE}:filter_size=1:phase_shift=0[env];[0:a][env]amultiply{norm_filter}[out]'
@@ -0,0 +1,175 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, IO, Iterable, List, Optional
+
+
+Sink = Callable[[dict], None]  # receives every event, see `Instrument`
+
+_PROGRESS_LINE = re.compile(r'^([a-z0-9_]+)=\s*(\S*)$')  # values may be padded, e.g. `bitrate= 250.1kbits/s`
+
+
+class JsonLinesSink:
+    """Appends every event to a file as one JSON object per line."""
+
+    def __init__(self, pth: str) -> None:
+        self.pth = pth
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict) -> None:
+        with self._lock:
+            with open(self.pth, 'a') as f:
+                f.write(json.dumps(event) + '\n')
+
+
+class PrometheusSink:
+    """
+    Keeps the latest value of each metric in a Prometheus text file (e.g. for node_exporter's textfile collector).
+    The file is rewritten atomically, at most every `interval` seconds, and on stage and end events.
+
+    ---
+
+    ## Params
+        - `pth`: the `.prom` file
+        - `labels`: added to every sample, e.g. `{'job_id': 'deep-brown'}`
+        - `interval`: minimum time between two progress-triggered rewrites
+    """
+
+    def __init__(self, pth: str, labels: Optional[Dict[str, str]] = None, interval: float = 1.0) -> None:
+        self.pth = pth
+        self.labels = labels or {}
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._samples: Dict[str, float] = {}  # sample (name and labels) -> value
+        self._written = 0.0
+
+    def _sample(self, name: str, event: dict, **labels: str) -> str:
+        labels = {**self.labels, **event.get('labels', {}), **labels}
+        if not labels:
+            return name
+        return name + '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+    def __call__(self, event: dict) -> None:
+        with self._lock:
+            if event['event'] == 'stage':
+                self._samples[self._sample('noise_gen_stage_seconds', event, stage=event['stage'])] = event['seconds']
+            elif event['event'] == 'progress':
+                for key in ('seconds', 'speed', 'ratio', 'done', 'total'):
+                    if event.get(key) is not None:
+                        self._samples[self._sample(f'noise_gen_progress_{key}', event, stage=event['stage'])] = event[key]
+            elif event['event'] == 'end':
+                self._samples[self._sample('noise_gen_wall_seconds', event)] = event['wall_time']
+                self._samples[self._sample('noise_gen_scratch_bytes', event)] = event['scratch_bytes']
+                self._samples[self._sample('noise_gen_success', event)] = 1 if event['ok'] else 0
+
+            if (event['event'] == 'progress') and (time.monotonic() - self._written < self.interval):
+                return
+            self._written = time.monotonic()
+            tmp_pth = f'{self.pth}.{os.getpid()}.tmp'
+            with open(tmp_pth, 'w') as f:
+                f.write(''.join(f'{sample} {value}\n' for sample, value in sorted(self._samples.items())))
+            os.replace(tmp_pth, self.pth)
+
+
+class Instrument:
+    """
+    Times the pipeline stages and reports progress as events to pluggable sinks (any callable taking a dict):
+    - `{'event': 'stage', 'stage': 'mix', 'seconds': 1.2}` when a stage ends
+    - `{'event': 'progress', 'stage': 'render', 'seconds': 30.0, 'speed': 41.5, 'ratio': 0.5}`, parsed from ffmpeg's `-progress` output,
+      or `{'event': 'progress', 'stage': 'layers', 'done': 3, 'total': 14}` for stages made of several processes
+    - `{'event': 'end', 'ok': True, 'wall_time': 2.4, 'stages': {...}, 'scratch_bytes': 0}`
+
+    Every event also carries `time` (Unix time) and `labels`.
+
+    ---
+
+    ## Params
+        - `sinks`: where the events go; without sinks only the timings are kept
+        - `labels`: added to every event, e.g. `{'job_id': 'deep-brown'}`
+
+    ## Demo
+        >>> inst = Instrument([JsonLinesSink('render.jsonl'), lambda e: print(e)])
+        >>> generate(spec, instrument=inst)
+        >>> inst.stages
+        {'render': 2.31, 'cleanup': 0.01}
+    """
+
+    def __init__(self, sinks: Iterable[Sink] = (), labels: Optional[Dict[str, str]] = None) -> None:
+        self.sinks: List[Sink] = list(sinks)
+        self.labels = labels or {}
+        self.duration: Optional[float] = None  # the track length, for the progress ratio
+        self.stages: Dict[str, float] = {}  # seconds per stage
+        self.scratch_bytes = 0
+        self._t0 = time.perf_counter()
+        self._t = self._t0
+
+    @property
+    def wants_progress(self) -> bool:
+        """Whether ffmpeg's progress is worth parsing (otherwise ffmpeg prints its usual stats line)."""
+        return len(self.sinks) > 0
+
+    def emit(self, event: dict) -> None:
+        event = {**event, 'labels': self.labels, 'time': time.time()}
+        for sink in self.sinks:
+            sink(event)
+
+    def start(self, duration: float) -> None:
+        """Starts the clock of the first stage."""
+        self.duration = duration
+        self._t0 = self._t = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        """Ends `stage`: the time since the previous lap (or `start`) is added to it."""
+        t = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0) + (t - self._t)
+        self._t = t
+        self.emit({'event': 'stage', 'stage': stage, 'seconds': round(self.stages[stage], 4)})
+
+    def skip(self) -> None:
+        """Restarts the clock without attributing the elapsed time to any stage."""
+        self._t = time.perf_counter()
+
+    def count(self, stage: str, done: int, total: int) -> None:
+        self.emit({'event': 'progress', 'stage': stage, 'done': done, 'total': total})
+
+    def end(self, ok: bool) -> None:
+        self.emit({
+            'event': 'end',
+            'ok': ok,
+            'wall_time': round(time.perf_counter() - self._t0, 4),
+            'stages': {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+            'scratch_bytes': self.scratch_bytes,
+        })
+
+    def read_progress(self, stage: str, stream: IO[bytes], other: Callable[[str], None]) -> None:
+        """
+        Parses ffmpeg's `-progress` output (blocks of `key=value` lines ending with `progress=...`) from `stream`
+        until it closes, emitting one progress event per block. Other lines (error messages) go to `other`.
+        """
+        block = {}
+        for raw in stream:
+            line = raw.decode(errors='replace').strip()
+            m = _PROGRESS_LINE.match(line)
+            if m is None:
+                if line:
+                    other(line)
+                continue
+            block[m[1]] = m[2]
+            if m[1] != 'progress':
+                continue
+
+            event = {'event': 'progress', 'stage': stage, 'seconds': None, 'speed': None, 'ratio': None}
+            try:
+                event['seconds'] = int(block['out_time_us'])/1e6
+            except (KeyError, ValueError):  # `N/A` before the first frame
+                pass
+            try:
+                event['speed'] = float(block['speed'].rstrip('x'))
+            except (KeyError, ValueError):
+                pass
+            if (event['seconds'] is not None) and self.duration:
+                event['ratio'] = round(min(1.0, event['seconds']/self.duration), 4)
+            self.emit(event)
+            block = {}
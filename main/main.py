@@ -1,25 +1,15 @@
 import argparse
-import datetime
+import dataclasses
 import os
-import subprocess as sp
+import signal
 import sys
-import time
-from typing import NoReturn
+from typing import List, NoReturn, Optional
 
-from main.constants import SOFTWARE_VER, SOFTWARE_NAME, TMP_DIR, OUTPUT_DIR, ALLOWED_EXTENSIONS
-from main.dyn_vol import dyn_vol
-from main.utils import validate_filename
-
-
-## To ensure the cleanliness of the "tmp" folder,
-## which is used to store intermediate files during the generation of the final output,
-## and prevent unintended deletions.
-if not (
-    (len(os.listdir(TMP_DIR)) == 1)
-    and
-    (os.listdir(TMP_DIR)[0] == '.gitkeep')
-):
-    raise AssertionError(f'Directory {repr(TMP_DIR)} is not clean.')
+from main.api import ENGINES, NoiseSpec, RenderError, generate, metadata, probe_ffmpeg
+from main.constants import SOFTWARE_VER, SOFTWARE_NAME, OUTPUT_DIR, TMP_DIR, PATTERN_DEFAULTS, TARGET_PEAK
+from main.instrument import Instrument, JsonLinesSink, PrometheusSink
+from main.seed import derive_seed
+from main.utils import eprinter, parse_size, printer
 
 
 ## <parser>
@@ -32,26 +22,90 @@ parser.add_argument('-c', '--color', default='brown', help='Noise color options:
 parser.add_argument('-n', '--nlayer', default=7, type=int, help='Number of layers (default: 7)')
 parser.add_argument('-hp', '--highpass', default=20, type=int, help='Highpass frequency value (default: 20 Hz)')
 parser.add_argument('-lp', '--lowpass', default=432, type=int, help='Lowpass frequency value (default: 432 Hz)')
+level = parser.add_mutually_exclusive_group()
+level.add_argument(
+    '-v', '--volume', type=float,
+    help=f'Volume amplification: to set the output loudness and address clipping issues (default: planned for a {TARGET_PEAK} dBFS peak)'
+)
+level.add_argument(
+    '-pk', '--target_peak', type=float,
+    help=f'Plan the volume so the sample peak stays below this, in dBFS, from the statistics of the noise, without an extra pass (default: {TARGET_PEAK})'
+)
+level.add_argument(
+    '-lu', '--target_lufs', type=float,
+    help='Plan the volume for this integrated loudness in LUFS (EBU R 128 / BS.1770) instead of a peak, e.g. -23'
+)
 parser.add_argument(
-    '-v', '--volume', type=int,
-    help='Volume amplification: to set the output loudness and address clipping issues (default: half of the number of layers)'
+    '-gp', '--gain_probe', type=float,
+    help='Refine the planned volume by measuring the first seconds (this many, e.g. 10) of the noise rendered by the engine (default: none)'
 )
 parser.add_argument(
     '-s', '--stereo', action=argparse.BooleanOptionalAction, default=True,
     help='Enable stereo mode (True) for stereo output, or disable it (False) for mono output.'
 )
+parser.add_argument(
+    '-ch', '--channels',
+    help='Channel layout (mono, stereo, 2.1, quad, 5.0, 5.1, 7.1) or number of channels, each with its own layers; overrides `-s`'
+)
 parser.add_argument(
     '-dv', '--dyn_vol', action=argparse.BooleanOptionalAction, default=False,
     help='Enable dynamic noise volume by launching a GUI that allows you to adjust the dynamicness parameters'
 )
 parser.add_argument(
     '-dvd', '--dyn_vol_dual', action=argparse.BooleanOptionalAction, default=True,
-    help='Use this option with `-dv` and `-s` to select two volume patterns. If set to `False`, both channels will share the same pattern.'
+    help='Use this option with `-dv` and `-s` (or `-ch`) to select a volume pattern per channel. If set to `False`, all channels will share the same pattern.'
+)
+parser.add_argument(
+    '-dvh', '--dyn_vol_headless', action=argparse.BooleanOptionalAction, default=False,
+    help='Enable dynamic noise volume without the GUI, using the `-dv...` parameters below (works with `-dvd`)'
+)
+parser.add_argument(
+    '-dvn', '--dyn_vol_nchanges', default=PATTERN_DEFAULTS['nchanges'], type=int,
+    help=f'Headless dynamic volume: number of volume changes over the track, no upper limit (default: {PATTERN_DEFAULTS["nchanges"]})'
+)
+parser.add_argument(
+    '-dvmin', '--dyn_vol_min', default=PATTERN_DEFAULTS['vol_min'], type=float,
+    help=f'Headless dynamic volume: lowest volume (default: {PATTERN_DEFAULTS["vol_min"]})'
+)
+parser.add_argument(
+    '-dvmax', '--dyn_vol_max', default=PATTERN_DEFAULTS['vol_max'], type=float,
+    help=f'Headless dynamic volume: highest volume (default: {PATTERN_DEFAULTS["vol_max"]})'
+)
+parser.add_argument(
+    '-dvp', '--dyn_vol_persistence', default=PATTERN_DEFAULTS['persistence'], type=float,
+    help=f'Headless dynamic volume: Perlin noise persistence (default: {PATTERN_DEFAULTS["persistence"]})'
+)
+parser.add_argument(
+    '-dvo', '--dyn_vol_octaves', default=PATTERN_DEFAULTS['octaves'], type=int,
+    help=f'Headless dynamic volume: Perlin noise octaves (default: {PATTERN_DEFAULTS["octaves"]})'
+)
+parser.add_argument(
+    '-dvf', '--dyn_vol_frequency', default=PATTERN_DEFAULTS['frequency'], type=float,
+    help=f'Headless dynamic volume: Perlin noise frequency, in cycles per track (default: {PATTERN_DEFAULTS["frequency"]})'
+)
+parser.add_argument(
+    '-dvsd', '--dyn_vol_seed', type=int,
+    help='Headless dynamic volume: Perlin noise seed (default: derived from the master seed)'
 )
 parser.add_argument(
     '-norm', '--normalize', action=argparse.BooleanOptionalAction, default=False,
     help='Apply the `dynaudnorm` filter to normalize the output audio, ensuring optimal amplitude and preventing clipping.'
 )
+parser.add_argument(
+    '-sd', '--seed', type=int,
+    help='Master seed from which every base noise seed is derived, to recreate a render exactly (default: random)'
+)
+parser.add_argument(
+    '-tl', '--tile', type=float,
+    help='Render only a seamless loop this many seconds long (e.g. 600) and repeat it up to the duration; the dynamic volume still spans the whole track (default: none)'
+)
+parser.add_argument(
+    '-sg', '--segment', type=float,
+    help=(
+        'With the `numpy` or `bank` engine: keep the synthesized audio in a checkpoint folder, segment by segment (e.g. 600 seconds), '
+        'so an interrupted render can continue with `--resume` and loses at most one segment (default: none)'
+    )
+)
 parser.add_argument(
     '-b', '--bitrate', default=256, type=int,
     help=f'Audio bitrate in kilobits per second (default: 256)'
@@ -64,284 +118,276 @@ parser.add_argument(
     help='Specify a custom output filename. If not specified, the default format will be used.'
 )
 parser.add_argument(
-    '-oe', '--output_ext', default='.m4a',
-    help='Specify the output extension (default: .m4a)'
+    '-oe', '--output_ext', nargs='+', default=['.m4a'],
+    help=(
+        'Specify the output extension; several extensions encode the same audio into each format, '
+        'each with an optional bitrate, e.g. `.m4a .mp3:192 .opus:128 .flac` (default: .m4a)'
+    )
+)
+parser.add_argument(
+    '-rs', '--resume', metavar='CHECKPOINT',
+    help='Continue an interrupted `-sg` render from its checkpoint folder (printed when it started); every other option is taken from the checkpoint'
+)
+parser.add_argument(
+    '-st', '--stream', metavar='TARGET',
+    help=(
+        'Synthesize endlessly in real time into TARGET instead of a file: `-` (stdout), a file or named pipe, '
+        'or an ffmpeg URL such as `tcp://0.0.0.0:9000?listen` or `http://0.0.0.0:8000`. Uses the `numpy` engine '
+        'and the first `-oe` format; the dynamic volume keeps evolving, with `-d` as the span of its pattern'
+    )
 )
 
 ## Misc
+parser.add_argument(
+    '-e', '--engine', default='graph', choices=ENGINES,
+    help=(
+        'Rendering pipeline: `graph` renders everything in a single ffmpeg run without intermediate files, '
+        '`files` renders each base noise in its own ffmpeg process, streamed into the mix as raw PCM, '
+        '`numpy` synthesizes the noise in-process and uses ffmpeg only to encode, '
+        '`bank` mixes segments of pre-rendered noises from a noise bank (`-bk`) (default: graph)'
+    )
+)
+parser.add_argument(
+    '-mr', '--multirate', action=argparse.BooleanOptionalAction, default=False,
+    help=(
+        'With the `numpy` engine (and `-st`): synthesize only the band below the lowpass, at the lowest adequate sample rate, '
+        'and resample once when encoding; e.g. 12x fewer samples with the default band'
+    )
+)
+parser.add_argument(
+    '-bk', '--bank_dir',
+    help='With the `bank` engine: the noise bank folder, filled by `python noise_gen bank build <folder>`'
+)
 parser.add_argument(
     '-p', '--print', action=argparse.BooleanOptionalAction, default=True,
     help='Print audio metadata'
 )
+parser.add_argument(
+    '-j', '--jobs', type=int,
+    help='Most ffmpeg layer processes run concurrently by the `files` engine; its layers are streamed straight into the mix only when all of them fit, otherwise they go through scratch files (default: number of CPUs)'
+)
+parser.add_argument(
+    '-td', '--tmp_dir',
+    help=f'Folder in which each run creates its private scratch folder, e.g. a tmpfs mount (default: {repr(TMP_DIR)})'
+)
+parser.add_argument(
+    '-cd', '--cache_dir',
+    help='Cache rendered base noises and mixes in this folder, so re-rendering the same noise with another extension or bitrate skips synthesis'
+)
+parser.add_argument(
+    '-cm', '--cache_max_bytes', default='10G', type=parse_size,
+    help='Size budget of the cache folder; least-recently-used entries are evicted beyond it, e.g. 500M, 20G (default: 10G)'
+)
+parser.add_argument(
+    '-bt', '--batch',
+    help='Render every job of a manifest (.jsonl, .csv, or .toml) whose keys are option names; the other options are the defaults of every job'
+)
+parser.add_argument(
+    '-bj', '--batch_jobs', default=os.cpu_count() or 1, type=int,
+    help='Number of manifest jobs rendered concurrently (default: number of CPUs)'
+)
+parser.add_argument(
+    '-br', '--batch_results',
+    help='Where to write the results (one JSON line per job, with its output path and timings) (default: next to the manifest)'
+)
+parser.add_argument(
+    '-pj', '--progress_jsonl',
+    help='Append the stage timings and the rendering progress (seconds rendered, speed) to this file as JSON lines'
+)
+parser.add_argument(
+    '-pm', '--progress_prom',
+    help='Keep the stage timings and the rendering progress in this Prometheus text file, e.g. for the node_exporter textfile collector'
+)
 parser.add_argument('-ff', '--ffmpeg', default='ffmpeg', help='FFmpeg binary file path or command (default: ffmpeg)')
 
-args = parser.parse_args()
 ## </parser>
 
 
-## <utils>
-def printer(__msg: str, /) -> None:
-    print(f'[{datetime.datetime.now().strftime("%H:%M:%S")}] {__msg}')
-
 def error(__msg: str, /) -> NoReturn:
     parser.exit(1, f'{parser.prog}: ERROR: {__msg}\n')
-## </utils>
-
-
-## <validations and preprocessing>
-
-n_warnings = 0
-
-DUR = args.duration
-if DUR <= 0:
-    error('Duration should be greater than 0.')
-elif DUR > 3600:
-    printer('WARNING: Duration longer than 1 hour may increase processing time and require significant storage space.')
-    n_warnings += 1
-
-COLOR = args.color.lower()
-if COLOR not in {'white', 'pink', 'brown', 'blue', 'violet', 'velvet'}:
-    error(f'Invalid color "{COLOR}". Available options are: white, pink, brown, blue, violet, velvet.')
-
-NLAYER = args.nlayer
-if NLAYER < 2:
-    error('Number of layers must be at least 2.')
-elif NLAYER > 20:
-    printer('WARNING: The specified number of layers is quite large and may result in longer processing time.')
-    n_warnings += 1
-
-HIGHPASS = args.highpass
-LOWPASS = args.lowpass
-if HIGHPASS < 20:
-    error('Highpass frequency must be greater than or equal to 20 Hz.')
-if LOWPASS > 20000:
-    error('Lowpass frequency must be less than or equal to 20,000 Hz.')
-if HIGHPASS >= LOWPASS:
-    error('Highpass frequency must be less than lowpass frequency.')
-
-VOLUME = args.volume
-if VOLUME is None:
-    VOLUME = max(1, round(NLAYER/2))
-else:
-    if VOLUME < 1:
-        error('Volume must be at least 1.')
-    elif VOLUME > 2*NLAYER:
-        printer('WARNING: The specified volume may cause clipping.')
-        n_warnings += 1
-
-BITRATE = args.bitrate
-if BITRATE < 32:
-    error('Bitrate is too low.')
-elif BITRATE > 320:
-    printer('WARNING: Bitrate is too high.')
-    n_warnings += 1
-
-## <constructing output filename>
-if args.output_dir is None:
-    output_dir = OUTPUT_DIR
-else:
-    if not os.path.isdir(args.output_dir):
-        error(f'The specified directory path is not valid: {args.output_dir}')
-    output_dir = args.output_dir
-
-output_ext = args.output_ext.lower()
-if output_ext not in ALLOWED_EXTENSIONS:
-    error(f'Invalid output extension: {repr(output_ext)}')
-
-if args.output_name is None:
-    output_filename = (
-        f'noise-{COLOR} ({NLAYER}-layer {HIGHPASS}-{LOWPASS}hz {VOLUME}x) '
-        + datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        + output_ext
+
+
+def dyn_vol_params(args: argparse.Namespace, nchannel: int) -> Optional[List[dict]]:
+    """The headless dynamic-volume patterns, as parameters only (`NoiseSpec.resolve` computes the curves)."""
+    if not args.dyn_vol_headless:
+        return None
+    params = {
+        'nchanges': args.dyn_vol_nchanges,
+        'vol_min': args.dyn_vol_min,
+        'vol_max': args.dyn_vol_max,
+        'persistence': args.dyn_vol_persistence,
+        'octaves': args.dyn_vol_octaves,
+        'frequency': args.dyn_vol_frequency,
+    }
+    if args.dyn_vol_seed is not None:
+        params['seed'] = args.dyn_vol_seed
+    if not args.dyn_vol_dual:
+        return [params] * nchannel
+    patterns = [params]
+    for ch in range(1, nchannel):
+        pattern = dict(params)  # without a seed, each channel derives its own
+        if args.dyn_vol_seed is not None:
+            pattern['seed'] = derive_seed(args.dyn_vol_seed, 'dyn_vol', ch)
+        patterns.append(pattern)
+    return patterns
+
+
+def spec_from_args(args: argparse.Namespace) -> NoiseSpec:
+    spec = NoiseSpec(
+        duration=args.duration,
+        color=args.color,
+        nlayer=args.nlayer,
+        highpass=args.highpass,
+        lowpass=args.lowpass,
+        volume=args.volume,
+        target_peak=args.target_peak,
+        target_lufs=args.target_lufs,
+        gain_probe=args.gain_probe,
+        stereo=args.stereo,
+        channels=args.channels,
+        normalize=args.normalize,
+        seed=args.seed,
+        tile=args.tile,
+        segment=args.segment,
+        bitrate=args.bitrate,
+        output_dir=args.output_dir,
+        output_name=args.output_name,
+        output_ext=args.output_ext,
+        engine=args.engine,
+        multirate=args.multirate,
+        bank_dir=args.bank_dir,
+        jobs=args.jobs,
+        tmp_dir=args.tmp_dir,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_max_bytes,
+        ffmpeg=args.ffmpeg,
     )
-else:
-    output_filename = validate_filename(args.output_name) + output_ext
-
-OUTPUT_FILE_PTH = os.path.join(output_dir, output_filename)
-if os.path.exists(OUTPUT_FILE_PTH):
-    error(f'Output file conflict. Please try a different filename or file extension: {repr(OUTPUT_FILE_PTH)}')
-## </constructing output filename>
-
-FFMPEG = args.ffmpeg
-if FFMPEG != 'ffmpeg':
-    if not (os.path.isfile(FFMPEG) and os.path.splitext(FFMPEG.lower())[1] == '.exe'):
-        error('FFMPEG path is invalid or does not point to an ffmpeg executable.')
-try:
-    sp.run([FFMPEG, '-version'], stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-    printer(f'INFO: ffmpeg valid and usable.')
-except FileNotFoundError:
-    error(f'ffmpeg not found or not a recognized command ({FFMPEG})')
+    return dataclasses.replace(spec, dyn_vol=dyn_vol_params(args, spec.nchannel))
 
-## </validations and preprocessing>
 
+def sinks_from_args(args: argparse.Namespace) -> list:
+    sinks = []
+    if args.progress_jsonl is not None:
+        sinks.append(JsonLinesSink(args.progress_jsonl))
+    if args.progress_prom is not None:
+        sinks.append(PrometheusSink(args.progress_prom))
+    return sinks
 
-def main() -> None:
 
-    if n_warnings > 0:
-        usr = input(f'\nThere were {n_warnings} warnings. Type y to continue: ')
+def batch(args: argparse.Namespace) -> NoReturn:
+    from main.batch import load_manifest, run_batch
+
+    if args.batch_jobs < 1:
+        error('Number of batch jobs must be at least 1.')
+    try:
+        jobs = load_manifest(args.batch)
+        probe_ffmpeg(args.ffmpeg)  # shared by every job
+    except (OSError, ValueError) as e:
+        error(str(e))
+
+    results_pth = args.batch_results or (os.path.splitext(args.batch)[0] + '.results.jsonl')
+    results = run_batch(
+        dataclasses.replace(spec_from_args(args), dyn_vol=None), jobs, args.batch_jobs, results_pth, sinks=sinks_from_args(args),
+        dyn_vol=lambda nchannel: dyn_vol_params(args, nchannel)  # the jobs may have other channels than the options
+    )
+
+    nfailed = sum(result['status'] != 'ok' for result in results)
+    printer(f'INFO: {len(results) - nfailed}/{len(results)} jobs succeeded, results written to: {results_pth}')
+    sys.exit(1 if nfailed > 0 else 0)
+
+
+def live(args: argparse.Namespace) -> NoReturn:
+    from main.stream import stream
+
+    log = eprinter if args.stream == '-' else printer  # stdout carries the audio
+    try:
+        stream(spec_from_args(args), args.stream, log=log, instrument=Instrument(sinks_from_args(args)))
+    except (ValueError, FileNotFoundError, RenderError) as e:
+        error(str(e))
+    sys.exit(0)
+
+
+def _terminate(signum, frame) -> NoReturn:
+    ## turning the signal into an exception runs the `finally` blocks, which stop the ffmpeg children
+    ## and remove the scratch folder and partial files
+    raise SystemExit(128 + signum)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+
+    args = parser.parse_args(argv)
+
+    for sig in ('SIGTERM', 'SIGHUP'):  # SIGINT already raises `KeyboardInterrupt`
+        if hasattr(signal, sig):
+            signal.signal(getattr(signal, sig), _terminate)
+
+    if args.batch is not None:
+        batch(args)
+    if args.stream is not None:
+        live(args)
+
+    if args.resume is not None:
+        from main.checkpoint import Checkpoint
+
+        try:
+            spec = Checkpoint(args.resume).spec()
+        except (OSError, ValueError) as e:
+            error(str(e))
+        for pth in spec.output_pths:  # left behind by the interrupted run
+            if os.path.exists(pth):
+                printer(f'INFO: Deleting the incomplete output {repr(pth)}...')
+                os.remove(pth)
+    else:
+        try:
+            spec = spec_from_args(args).resolve()  # may render a `-gp` probe
+        except (ValueError, FileNotFoundError, RenderError) as e:
+            error(str(e))
+
+    ## validations
+    try:
+        warnings = spec.validate()
+        probe_ffmpeg(spec.ffmpeg)
+    except (ValueError, FileNotFoundError) as e:
+        error(str(e))
+    printer(f'INFO: ffmpeg valid and usable.')
+    for msg in warnings:
+        printer(f'WARNING: {msg}')
+
+    if len(warnings) > 0:
+        usr = input(f'\nThere were {len(warnings)} warnings. Type y to continue: ')
         if usr != 'y':
             printer('INFO: Exiting...')
             sys.exit(1)
 
     ## dynamic volume
-    dyn_vol_filter = ''
-    dyn_vol_filter_right_channel = ''
-    if args.dyn_vol:
+    if args.dyn_vol and (args.resume is None):
+        from main.dyn_vol import dyn_vol
+
+        names = spec.channel_names
         printer('INFO: opening the GUI..')
-        dyn_vol_filter, dyn_vol_md = dyn_vol(DUR)
-        printer('INFO: dyn_vol_filter generated.')
+        pattern = dyn_vol(spec.duration)
+        printer('INFO: Volume pattern picked.' if len(names) == 1 else f'INFO: {names[0]} channel volume pattern picked.')
+        patterns = [pattern]
 
-        if args.stereo:
+        if len(names) > 1:
             if args.dyn_vol_dual:
-                printer('INFO: opening the GUI again..')
-                dyn_vol_filter_right_channel, dyn_vol_md_rc = dyn_vol(DUR)
-                printer('INFO: dyn_vol_filter_right_channel generated.')
+                for name in names[1:]:
+                    printer('INFO: opening the GUI again..')
+                    patterns.append(dyn_vol(spec.duration))
+                    printer(f'INFO: {name} channel volume pattern picked.')
             else:
-                printer('INFO: Both channels have the same volume pattern.')
-                dyn_vol_filter_right_channel, dyn_vol_md_rc = dyn_vol_filter, dyn_vol_md
-    dyn_vol_filter_pack = {
-        'left': dyn_vol_filter,
-        'right': dyn_vol_filter_right_channel,
-    }
-    
-    ## normalization
-    norm_filter = ''
-    if args.normalize:
-        norm_filter = ',dynaudnorm'
-
-    ## <core>
-    intermediate_file_pths = []
-
-    if args.stereo:
-
-        mono_pths = []
-        for side in ['left', 'right']:
-
-            printer(f'INFO: Creating {NLAYER} base noises for the {side} channel.')
-            base_pths = []
-            for i in range(NLAYER):
-                time.sleep(0.1)
-                pth = os.path.join(TMP_DIR, f'stereo_base_{side}_{str(i).zfill(3)}.wav')
-                sp.call([
-                    FFMPEG, '-v', 'error', '-stats',
-                    '-f', 'lavfi', '-i', f'anoisesrc=d={DUR}:c={COLOR}:s={time.time()}',
-                    '-b:a', f'{BITRATE}k',
-                    pth
-                ])
-                intermediate_file_pths.append(pth)
-                base_pths.append(pth)
-                printer(f'INFO: Created ({i+1}/{NLAYER}): {pth}')
-
-            printer(f'INFO: Generating the {side} channel.')
-            mono_pth = os.path.join(TMP_DIR, f'stereo_{side}_channel.wav')
-            input_cmd = []
-            for pth in base_pths:
-                input_cmd += ['-i', pth]
-            sp.call([
-                FFMPEG, '-v', 'error', '-stats',
-                *input_cmd,
-                '-filter_complex', f'amix=inputs={NLAYER},highpass=f={HIGHPASS},lowpass=f={LOWPASS},volume={VOLUME}{dyn_vol_filter_pack[side]}',
-                '-b:a', f'{BITRATE}k',
-                mono_pth
-            ])
-            intermediate_file_pths.append(mono_pth)
-            mono_pths.append(mono_pth)
-
-        printer('INFO: Mixing into stereo...')
-        sp.call([
-            FFMPEG, '-v', 'error', '-stats',
-            '-i', mono_pths[0],
-            '-i', mono_pths[1],
-            '-filter_complex', f'[0:a][1:a]amerge=inputs=2{norm_filter}[a]',
-            '-map', '[a]',
-            '-b:a', f'{BITRATE}k',
-            OUTPUT_FILE_PTH
-        ])
-    
-    else:  # mono
-
-        printer(f'INFO: Creating {NLAYER} base noises..')
-        for i in range(NLAYER):
-            time.sleep(0.1)
-            pth = os.path.join(TMP_DIR, f'mono_base_{str(i).zfill(3)}.wav')
-            sp.call([
-                FFMPEG, '-v', 'error', '-stats',
-                '-f', 'lavfi', '-i', f'anoisesrc=d={DUR}:c={COLOR}:s={time.time()}',
-                '-b:a', f'{BITRATE}k',
-                pth
-            ])
-            intermediate_file_pths.append(pth)
-            printer(f'INFO: Created ({i+1}/{NLAYER}): {pth}')
-
-        input_cmd = []
-        for pth in intermediate_file_pths:
-            input_cmd += ['-i', pth]
-
-        printer('INFO: Generating the output...')
-        sp.call([
-            FFMPEG, '-v', 'error', '-stats',
-            *input_cmd,
-            '-filter_complex', f'amix=inputs={NLAYER},highpass=f={HIGHPASS},lowpass=f={LOWPASS},volume={VOLUME}{dyn_vol_filter}{norm_filter}',
-            '-b:a', f'{BITRATE}k',
-            OUTPUT_FILE_PTH
-        ])
-    ## </core>
-
-    ## deleting the intermediate files (base noises)
-    for pth in intermediate_file_pths:
-        printer(f'INFO: Deleting {repr(pth)}...')
-        os.remove(pth)
-
-    printer(f'INFO: The output successfully created at: {OUTPUT_FILE_PTH}')
+                printer('INFO: All channels have the same volume pattern.')
+                patterns += [pattern] * (len(names) - 1)
+        spec = dataclasses.replace(spec, dyn_vol=patterns)
+        if args.volume is None:  # planned again for the picked patterns
+            spec = dataclasses.replace(spec, volume=None, output_name=args.output_name).resolve()
+
+    instrument = Instrument(sinks_from_args(args))
+    try:
+        generate(spec, instrument=instrument)
+    except (ValueError, RenderError) as e:  # e.g. a checkpoint of another render in the way
+        error(str(e))
 
     ## printing metadata
     if args.print:
-        md = (
-            '\n'
-            '===================================================='
-            '\n'
-            'Audio metadata:\n'
-            f'- Software version: {SOFTWARE_VER}\n'
-            f'- Created on: {datetime.datetime.now().strftime("%b %#d, %Y (%#I:%M %p)")}\n'
-            f'- Duration: {DUR} secs\n'
-            f'- Color: {COLOR}\n'
-            f'- Number of layers: {NLAYER}\n'
-            f'- Highpass: {HIGHPASS} hz\n'
-            f'- Lowpass: {LOWPASS} hz\n'
-            f'- Volume: {VOLUME}x\n'
-            f'- Channels: {"stereo" if args.stereo else "mono"}\n'
-            f'- Normalized: {args.normalize}\n'
-            f'- Bitrate: {BITRATE} kbps\n'
-            f'- Using dynamic volume: {args.dyn_vol}' + ((' (dual)' if args.dyn_vol_dual else ' (single)') if args.dyn_vol else '')
-        )
-        if args.dyn_vol:
-            md += (
-                '\n' + ('  *left channel*\n' if args.dyn_vol_dual else '') +
-                f'  - Number of changes: {dyn_vol_md["nchanges"]} transitions\n'
-                f'  - Min volume: {dyn_vol_md["vol_min"]}x\n'
-                f'  - Max volume: {dyn_vol_md["vol_max"]}x\n'
-                f'  - Perlin noise persistence: {dyn_vol_md["persistence"]}\n'
-                f'  - Perlin noise octaves: {dyn_vol_md["octaves"]}\n'
-                f'  - Perlin noise frequency: {dyn_vol_md["frequency"]}\n'
-                f'  - Perlin noise seed: {dyn_vol_md["seed"]}'
-            )
-            if args.dyn_vol_dual:
-                md += (
-                    '\n'
-                    '  *right channel*\n'
-                    f'  - Number of changes: {dyn_vol_md_rc["nchanges"]} transitions\n'
-                    f'  - Min volume: {dyn_vol_md_rc["vol_min"]}x\n'
-                    f'  - Max volume: {dyn_vol_md_rc["vol_max"]}x\n'
-                    f'  - Perlin noise persistence: {dyn_vol_md_rc["persistence"]}\n'
-                    f'  - Perlin noise octaves: {dyn_vol_md_rc["octaves"]}\n'
-                    f'  - Perlin noise frequency: {dyn_vol_md_rc["frequency"]}\n'
-                    f'  - Perlin noise seed: {dyn_vol_md_rc["seed"]}'
-                )
-        md += (
-            '\n\n'
-            'Software source code:\n'
-            'https://github.com/nvfp/Multilayered-Noise-Generator'
-            '\n'
-            '===================================================='
-        )
-        print(md)
\ No newline at end of file
+        print(metadata(spec, instrument.stages))
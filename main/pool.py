@@ -0,0 +1,82 @@
+import os
+import subprocess as sp
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Sequence, Set
+
+
+class RenderError(Exception):
+    """Raised by a pool job whose ffmpeg child exited with a non-zero status."""
+
+
+class ProcessPool:
+    """
+    Runs ffmpeg commands on a bounded number of worker threads, each one babysitting a single child process.
+    If any child fails, every other running child is terminated and the pending jobs are dropped.
+
+    ---
+
+    ## Demo
+        >>> with ProcessPool(4) as pool:
+        ...     futs = [pool.submit(['ffmpeg', ...], 'layer 1'), pool.submit(['ffmpeg', ...], 'layer 2')]
+        ...     for fut in futs:
+        ...         fut.result()  # raises `RenderError` if a child failed
+    """
+
+    def __init__(self, jobs: int) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._lock = threading.Lock()
+        self._procs: Set[sp.Popen] = set()
+        self._cancelled = threading.Event()
+
+        self.errors: List[str] = []  # one entry per failed child, in completion order
+
+    def _run(self, cmd: Sequence[str], label: str, stdout: Optional[int]) -> str:
+        try:
+            if self._cancelled.is_set():
+                raise RenderError(f'{label}: cancelled')
+            proc = sp.Popen(cmd, stdout=(sp.DEVNULL if stdout is None else stdout), stderr=sp.PIPE)
+        finally:
+            if stdout is not None:  # the child has its own copy; the reader sees EOF once the child exits
+                os.close(stdout)
+        with self._lock:
+            self._procs.add(proc)
+        if self._cancelled.is_set():  # `cancel` may have run before the child was registered
+            proc.terminate()
+
+        _, stderr = proc.communicate()
+        with self._lock:
+            self._procs.discard(proc)
+
+        if proc.returncode != 0:
+            if self._cancelled.is_set():
+                raise RenderError(f'{label}: cancelled')
+            msg = stderr.decode(errors='replace').strip() or f'exit status {proc.returncode}'
+            with self._lock:
+                self.errors.append(f'{label}: {msg}')
+            self.cancel()
+            raise RenderError(f'{label}: {msg}')
+        return label
+
+    def submit(self, cmd: Sequence[str], label: str, stdout: Optional[int] = None) -> 'Future[str]':
+        """
+        Schedules `cmd`; the future resolves to `label` once the child exits successfully.
+        `stdout` is a file descriptor (e.g. the write end of an `os.pipe`) for the child's output, closed in this process
+        once the child has started; a reader of that pipe needs a pool large enough to run every writer at once.
+        """
+        return self._executor.submit(self._run, cmd, label, stdout)
+
+    def cancel(self) -> None:
+        """Terminates every running child and makes the queued jobs fail fast."""
+        self._cancelled.set()
+        with self._lock:
+            for proc in self._procs:
+                proc.terminate()
+
+    def __enter__(self) -> 'ProcessPool':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:  # including KeyboardInterrupt
+            self.cancel()
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,64 @@
+import hashlib
+import random
+from typing import List
+
+
+SEED_RANGE = 2**32  # `anoisesrc` accepts uint32 seeds
+
+
+def new_master_seed() -> int:
+    """Picks a random master seed, used when `--seed` is not given."""
+    return random.randrange(SEED_RANGE)
+
+
+def derive_seed(master: int, *path: object) -> int:
+    """
+    Derives a sub-seed from the master seed and a path of labels.
+    The result only depends on its arguments, so a render can be recreated from its master seed.
+
+    ---
+
+    ## Params
+        - `master`: the master seed
+        - `path`: labels identifying the consumer, e.g. `('layer', 0, 3)`
+
+    ## Returns
+        - `int`: a seed in `[0, 2**32)`
+
+    ## Demo
+        >>> derive_seed(42, 'layer', 0, 3) == derive_seed(42, 'layer', 0, 3)
+        True
+    """
+    key = '/'.join(str(p) for p in (master, *path)).encode()
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % SEED_RANGE
+
+
+def layer_seeds(master: int, nchannel: int, nlayer: int) -> List[List[int]]:
+    """
+    Derives one seed per base noise, `nlayer` per channel, all distinct from each other.
+
+    ---
+
+    ## Params
+        - `master`: the master seed
+        - `nchannel`: number of channels (1 for mono, 2 for stereo)
+        - `nlayer`: number of layers per channel
+
+    ## Returns
+        - `List[List[int]]`: `seeds[channel][layer]`
+    """
+    seen = set()
+    seeds = []
+    for ch in range(nchannel):
+        row = []
+        for i in range(nlayer):
+            salt = 0
+            seed = derive_seed(master, 'layer', ch, i)
+            while seed in seen:  # a 32-bit collision is unlikely, but two identical layers would double up
+                salt += 1
+                seed = derive_seed(master, 'layer', ch, i, salt)
+            seen.add(seed)
+            row.append(seed)
+        seeds.append(row)
+    return seeds
@@ -0,0 +1,538 @@
+import argparse
+import asyncio
+import inspect
+import ipaddress
+import itertools
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from main.constants import SOFTWARE_DIR, SOFTWARE_NAME, SOFTWARE_VER
+from main.utils import printer
+
+
+MAX_FINISHED = 10000  # finished jobs kept for `status`, oldest forgotten first
+MAX_LOG_LINES = 50  # latest log messages kept per job
+WORKER_STOP_TIMEOUT = 5  # seconds a worker gets to clean up after a cancellation before it's killed
+WORKER_RETRY_DELAY = (1, 60)  # seconds between attempts to replace a worker that fails to start, doubling up to the maximum
+STREAM_LIMIT = 2**20  # longest JSON line read from a client or a worker
+JOB_FIELDS = (  # the `NoiseSpec` fields a client may set; the executables and the folders come from the daemon's options only
+    'duration', 'color', 'nlayer', 'highpass', 'lowpass', 'volume', 'target_peak', 'target_lufs', 'gain_probe',
+    'stereo', 'channels', 'dyn_vol', 'normalize', 'seed', 'tile', 'segment', 'bitrate',
+    'output_name', 'output_ext', 'engine', 'multirate', 'jobs',
+)
+
+## JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+
+
+class ServeError(Exception):
+    """An error response of the `serve` daemon, raised by `Client.call`."""
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(f'{message} ({code})')
+        self.code = code
+        self.message = message
+
+
+def worker(base: dict) -> None:
+    """
+    Entry point of a warm worker process of `Server`: imports and probes once, then renders the jobs read from stdin
+    (one JSON line each, see `main.batch.parse_job`) one at a time, reporting `log`, `event` (see `Instrument`),
+    and `result` messages on stdout as JSON lines.
+    """
+    out = os.fdopen(os.dup(1), 'w', buffering=1)
+    os.dup2(2, 1)  # anything else printing to stdout (e.g. an ffmpeg child) can't corrupt the messages
+    def terminate(signum, frame):
+        signal.signal(signum, signal.SIG_IGN)  # once: the cleanup itself must not be interrupted
+        sys.exit(128 + signum)
+
+    if hasattr(signal, 'SIGTERM'):  # a cancellation: the `finally` blocks stop the ffmpeg children and remove the scratch files
+        signal.signal(signal.SIGTERM, terminate)
+
+    from main.api import NoiseSpec, probe_ffmpeg
+    from main.batch import run_job
+
+    base_spec = NoiseSpec(**base)
+    try:
+        probe_ffmpeg(base_spec.ffmpeg)
+    except (ValueError, FileNotFoundError):
+        pass  # reported by each job
+    lock = threading.Lock()  # events also come from ffmpeg progress readers
+
+    def send(msg: dict) -> None:
+        with lock:
+            out.write(json.dumps(msg) + '\n')
+
+    send({'type': 'ready'})
+    for line in sys.stdin:
+        job = json.loads(line)
+        result = run_job(
+            base_spec, job,
+            log=lambda msg: send({'type': 'log', 'message': msg}),
+            sinks=[lambda event: send({'type': 'event', 'event': event})]
+        )
+        send({'type': 'result', 'result': result})
+
+
+class WorkerExited(Exception):
+    """The worker process ended before reporting a result, e.g. after a cancellation."""
+
+
+class Job:
+    """A job of `Server`: its fields, scheduling, and what the worker reported."""
+
+    def __init__(self, job: dict, priority: int) -> None:
+        self.job = job
+        self.id = job['id']
+        self.priority = priority
+        self.state = 'queued'  # then `running`, and `done`, `failed`, or `cancelled`
+        self.progress: Optional[dict] = None  # the latest progress event
+        self.logs: List[str] = []
+        self.result: Optional[dict] = None
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.worker: Optional['_Worker'] = None
+        self.done = asyncio.Event()
+
+    def summary(self) -> dict:
+        return {
+            'job_id': self.id, 'state': self.state, 'priority': self.priority, 'progress': self.progress,
+            'logs': self.logs, 'result': self.result,
+            'submitted': self.submitted, 'started': self.started, 'finished': self.finished,
+        }
+
+
+class _Worker:
+    """A warm worker process (see `worker`), in its own process group so a cancellation also stops its ffmpeg children."""
+
+    def __init__(self, base: dict) -> None:
+        self.base = base
+        self.proc: Optional[asyncio.subprocess.Process] = None
+
+    async def start(self) -> None:
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, '-c', 'import json, sys; from main.serve import worker; worker(json.loads(sys.argv[1]))',
+            json.dumps(self.base),
+            cwd=SOFTWARE_DIR, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            start_new_session=(os.name == 'posix'), limit=STREAM_LIMIT,
+        )
+        await self._read()  # `ready`
+
+    async def _read(self) -> dict:
+        line = await self.proc.stdout.readline()
+        if not line:
+            raise WorkerExited()
+        return json.loads(line)
+
+    async def run(self, job: Job) -> dict:
+        self.proc.stdin.write((json.dumps(job.job) + '\n').encode())
+        await self.proc.stdin.drain()
+        while True:
+            msg = await self._read()
+            if msg['type'] == 'result':
+                return msg['result']
+            elif msg['type'] == 'log':
+                job.logs = (job.logs + [msg['message']])[-MAX_LOG_LINES:]
+            elif msg['event']['event'] == 'progress':
+                job.progress = {k: v for k, v in msg['event'].items() if k not in ('event', 'labels')}
+
+    def signal(self, sig: int) -> None:
+        try:
+            if os.name == 'posix':
+                os.killpg(self.proc.pid, sig)
+            else:
+                self.proc.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
+    async def _wait(self) -> None:
+        """Waits for a signaled (or crashed) process to clean up and exit, then kills whatever is left of its group."""
+        try:
+            await asyncio.wait_for(self.proc.wait(), WORKER_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.signal(signal.SIGKILL if hasattr(signal, 'SIGKILL') else signal.SIGTERM)
+            await self.proc.wait()
+
+    async def restart(self) -> None:
+        """Replaces a worker that has been signaled or has exited by a fresh one."""
+        await self._wait()
+        await self.start()
+
+    async def stop(self) -> None:
+        if (self.proc is not None) and (self.proc.returncode is None):
+            self.signal(signal.SIGTERM)
+            await self._wait()
+
+
+class Server:
+    """
+    A long-running render daemon: jobs are submitted as JSON-RPC 2.0 requests (one JSON object per line)
+    over a Unix socket or a local TCP port, queued by priority, and rendered by a bounded pool of warm worker processes,
+    which keep the imports and the ffmpeg probe between jobs.
+
+    Methods (params by name):
+        - `submit(spec, priority=0)`: queues a job; `spec` holds `NoiseSpec` fields (like a batch manifest entry, with an optional `id`),
+          higher priorities run first. Returns the job's status. Only the `JOB_FIELDS` can be set, so a client can't choose
+          the ffmpeg binary or write outside the daemon's folders.
+        - `status(job_id)`: `state` (`queued`, `running`, `done`, `failed`, or `cancelled`), the latest `progress`,
+          the latest `logs`, and the `result` (as in a batch results file) once finished
+        - `wait(job_id, timeout=None)`: the status once the job has finished, or after `timeout` seconds
+        - `cancel(job_id)`: drops a queued job, or stops a running one (its worker is replaced)
+        - `list(state=None)`, `stats()`, `shutdown()`
+
+    ---
+
+    ## Params
+        - `base`: `NoiseSpec` fields shared by every job, e.g. `ffmpeg`, `output_dir`, and `bank_dir`
+        - `workers`: number of jobs rendered concurrently
+        - `log`: receives the warnings about workers that fail to restart
+
+    ## Demo
+        $ python noise_gen serve --socket /tmp/noise.sock
+        $ echo '{"jsonrpc": "2.0", "id": 1, "method": "submit", "params": {"spec": {"duration": 10}}}' | nc -U /tmp/noise.sock
+    """
+
+    def __init__(self, base: dict, workers: int, log: Callable[[str], None] = printer) -> None:
+        self.base = base
+        self.log = log
+        self.jobs: Dict[str, Job] = {}
+        self._workers = [_Worker(base) for _ in range(workers)]
+        self._queue: 'asyncio.PriorityQueue' = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._restarting = 0  # workers waiting for a retry, so `stats` shows the missing capacity
+        self._t0 = time.time()
+        self.stopped = asyncio.Event()
+
+    async def start(self) -> None:
+        await asyncio.gather(*(w.start() for w in self._workers))
+        self._tasks = [asyncio.create_task(self._work(w)) for w in self._workers]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*(w.stop() for w in self._workers))
+
+    async def _work(self, worker: _Worker) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            if job.state != 'queued':  # cancelled while queued
+                continue
+            job.state = 'running'
+            job.started = time.time()
+            job.worker = worker
+            try:
+                job.result = await worker.run(job)
+            except WorkerExited:
+                if job.state != 'cancelled':
+                    job.state = 'failed'
+                    job.result = {'id': job.id, 'status': 'error', 'error': 'The worker process exited unexpectedly.'}
+                restart = True
+            else:
+                restart = (job.state == 'cancelled')  # finished before the signal landed; the worker is on its way out
+                if not restart:
+                    job.state = 'done' if job.result['status'] == 'ok' else 'failed'
+            job.worker = None
+            job.finished = time.time()
+            job.done.set()
+            self._forget()
+            if restart:
+                await self._restart(worker)
+
+    async def _restart(self, worker: _Worker) -> None:
+        """Replaces a worker, retrying with a growing delay until a fresh one is ready, so the pool never shrinks for good."""
+        delay, max_delay = WORKER_RETRY_DELAY
+        failures = 0
+        while True:
+            try:
+                await worker.restart()
+                break
+            except Exception as err:  # e.g. `OSError` from the spawn, or `WorkerExited` before it was ready
+                if not failures:
+                    self._restarting += 1
+                failures += 1
+                self.log(
+                    f'WARNING: A worker failed to restart ({type(err).__name__}: {err}), retrying in {delay} s; '
+                    f'{len(self._workers) - self._restarting} of {len(self._workers)} workers are running'
+                )
+                await worker.stop()
+                await asyncio.sleep(delay)
+                delay = min(2*delay, max_delay)
+        if failures:
+            self._restarting -= 1
+            self.log(f'INFO: A worker restarted after {failures + 1} attempts')
+
+    def _forget(self) -> None:
+        finished = [job for job in self.jobs.values() if job.done.is_set()]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del self.jobs[job.id]
+
+    def _job(self, job_id: str) -> Job:
+        if job_id not in self.jobs:
+            raise ValueError(f'Unknown job: {job_id}')
+        return self.jobs[job_id]
+
+    ## RPC methods
+
+    async def rpc_submit(self, spec: dict, priority: int = 0) -> dict:
+        from main.batch import parse_job
+
+        if not isinstance(spec, dict):
+            raise ValueError('The spec must be an object.')
+        for name in spec:
+            if (name != 'id') and (name not in JOB_FIELDS):
+                raise ValueError(f'Field {repr(name)} can\'t be set by a job; it\'s one of the daemon\'s options.')
+        seq = next(self._seq)
+        job = parse_job(spec, f'job-{seq}')
+        for name in ('id', 'output_name'):
+            if (name in job) and any(sep in str(job[name]) for sep in ('/', '\\')):
+                raise ValueError(f'The {name} must not contain a path separator: {repr(job[name])}')
+        if job['id'] in self.jobs:
+            raise ValueError(f'Job id already in use: {job["id"]}')
+        if not isinstance(priority, int):
+            raise ValueError('The priority must be an integer.')
+        self.jobs[job['id']] = Job(job, priority)
+        self._queue.put_nowait((-priority, seq, self.jobs[job['id']]))
+        return self.jobs[job['id']].summary()
+
+    async def rpc_status(self, job_id: str) -> dict:
+        return self._job(job_id).summary()
+
+    async def rpc_wait(self, job_id: str, timeout: Optional[float] = None) -> dict:
+        job = self._job(job_id)
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job.summary()
+
+    async def rpc_cancel(self, job_id: str) -> dict:
+        job = self._job(job_id)
+        if job.state == 'queued':
+            job.state = 'cancelled'
+            job.finished = time.time()
+            job.done.set()
+        elif job.state == 'running':
+            job.state = 'cancelled'
+            job.worker.signal(signal.SIGTERM)
+        return job.summary()
+
+    async def rpc_list(self, state: Optional[str] = None) -> List[dict]:
+        return [
+            {'job_id': job.id, 'state': job.state, 'priority': job.priority}
+            for job in self.jobs.values() if (state is None) or (job.state == state)
+        ]
+
+    async def rpc_stats(self) -> dict:
+        states = [job.state for job in self.jobs.values()]
+        return {
+            'software_version': SOFTWARE_VER,
+            'uptime': round(time.time() - self._t0, 3),
+            'workers': len(self._workers),
+            'restarting': self._restarting,
+            **{state: states.count(state) for state in ('queued', 'running', 'done', 'failed', 'cancelled')},
+        }
+
+    async def rpc_shutdown(self) -> dict:
+        self.stopped.set()
+        return {'stopping': True}
+
+    ## transport
+
+    async def _dispatch(self, line: bytes, respond: Callable[[dict], Any]) -> None:
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('expected an object')
+        except ValueError as e:
+            await respond({'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': f'Parse error: {e}'}})
+            return
+
+        rid = request.get('id')
+        params = request.get('params') or {}
+        method = request.get('method')
+        handler = getattr(self, f'rpc_{method}', None) if isinstance(method, str) else None
+        try:
+            if handler is None:
+                raise ServeError(METHOD_NOT_FOUND, f'Method not found: {method}')
+            try:
+                args = inspect.signature(handler).bind(**params) if isinstance(params, dict) else inspect.signature(handler).bind(*params)
+            except TypeError as e:
+                raise ServeError(INVALID_PARAMS, f'Invalid params: {e}')
+            try:
+                response = {'result': await handler(*args.args, **args.kwargs)}
+            except ValueError as e:
+                raise ServeError(INVALID_PARAMS, str(e))
+        except ServeError as e:
+            response = {'error': {'code': e.code, 'message': e.message}}
+        if rid is not None:
+            await respond({'jsonrpc': '2.0', 'id': rid, **response})
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(msg: dict) -> None:
+            async with lock:
+                writer.write((json.dumps(msg) + '\n').encode())
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    ## each request runs on its own, so a `wait` doesn't hold up the connection's other requests
+                    task = asyncio.create_task(self._dispatch(line, respond))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError):  # ValueError: a line over `STREAM_LIMIT`
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+
+class Client:
+    """
+    A minimal blocking client of `Server`, one request at a time.
+
+    ## Demo
+        >>> client = Client('/tmp/noise.sock')  # or 'localhost:8765'
+        >>> job = client.call('submit', spec={'duration': 10, 'color': 'pink'}, priority=1)
+        >>> client.call('wait', job_id=job['job_id'])['result']['output']
+    """
+
+    def __init__(self, address: str, timeout: Optional[float] = None) -> None:
+        host, _, port = address.rpartition(':')
+        if port.isdigit() and not os.path.exists(address):
+            self._sock = socket.create_connection((host or 'localhost', int(port)), timeout=timeout)
+        else:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(address)
+        self._file = self._sock.makefile('rwb')
+        self._ids = itertools.count(1)
+
+    def call(self, method: str, **params) -> Any:
+        """Calls `method`; raises `ServeError` for an error response."""
+        rid = next(self._ids)
+        self._file.write((json.dumps({'jsonrpc': '2.0', 'id': rid, 'method': method, 'params': params}) + '\n').encode())
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError('The daemon closed the connection.')
+        response = json.loads(line)
+        if 'error' in response:
+            raise ServeError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+async def serve(
+    base: dict,
+    workers: int,
+    socket_pth: Optional[str] = None,
+    port: Optional[int] = None,
+    host: str = '127.0.0.1',
+    log: Callable[[str], None] = printer,
+) -> None:
+    """
+    Runs a `Server` on a Unix socket (`socket_pth`, readable by this user only) or a loopback TCP port until `shutdown` or SIGTERM/SIGINT.
+    The protocol has no authentication, so `host` must be a loopback address; raises `ValueError` otherwise.
+    """
+    if socket_pth is None:
+        try:
+            loopback = (host == 'localhost') or ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = False
+        if not loopback:
+            raise ValueError(f'The daemon has no authentication, so it only listens on a loopback address, got: {host}')
+    server = Server(base, workers, log)
+    await server.start()
+    if socket_pth is not None:
+        if os.path.exists(socket_pth):  # left behind by a daemon that didn't stop cleanly
+            os.remove(socket_pth)
+        ## created under a private umask, so no other user can connect in the moment before the `chmod`
+        umask = os.umask(0o077)
+        try:
+            listener = await asyncio.start_unix_server(server._handle, path=socket_pth, limit=STREAM_LIMIT)
+        finally:
+            os.umask(umask)
+        os.chmod(socket_pth, 0o600)
+        address = socket_pth
+    else:
+        listener = await asyncio.start_server(server._handle, host, port, limit=STREAM_LIMIT)
+        address = f'{host}:{port}'
+
+    loop = asyncio.get_running_loop()
+    for sig in ('SIGTERM', 'SIGINT'):
+        if hasattr(signal, sig):
+            try:
+                loop.add_signal_handler(getattr(signal, sig), server.stopped.set)
+            except NotImplementedError:  # Windows
+                pass
+    log(f'INFO: Serving on {address} with {workers} workers')
+    try:
+        await server.stopped.wait()
+    finally:
+        log('INFO: Stopping...')
+        listener.close()
+        await server.stop()
+        if (socket_pth is not None) and os.path.exists(socket_pth):
+            os.remove(socket_pth)
+
+
+## <parser>
+parser = argparse.ArgumentParser(
+    prog=f'{SOFTWARE_NAME} serve',
+    description='Render daemon: JSON-RPC 2.0 over a Unix socket or a local TCP port, one JSON object per line'
+)
+address_group = parser.add_mutually_exclusive_group(required=True)
+address_group.add_argument('-so', '--socket', help='Listen on this Unix socket, e.g. /run/noise.sock')
+address_group.add_argument('-pt', '--port', type=int, help='Listen on this TCP port (on --host)')
+parser.add_argument('-ho', '--host', default='127.0.0.1', help='Loopback address to listen on with --port (default: 127.0.0.1)')
+parser.add_argument('-w', '--workers', default=os.cpu_count() or 1, type=int, help='Number of jobs rendered concurrently (default: number of CPUs)')
+parser.add_argument('-od', '--output_dir', help='Default output folder of the jobs')
+parser.add_argument('-td', '--tmp_dir', help='Default scratch folder of the jobs')
+parser.add_argument('-cd', '--cache_dir', help='Default cache folder of the jobs')
+parser.add_argument('-bk', '--bank_dir', help='Noise bank folder of the `bank` engine jobs')
+parser.add_argument('-ff', '--ffmpeg', default='ffmpeg', help='FFmpeg binary file path or command (default: ffmpeg)')
+
+## </parser>
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        printer('ERROR: Number of workers must be at least 1.')
+        sys.exit(1)
+    base = {'ffmpeg': args.ffmpeg}
+    for name in ('output_dir', 'tmp_dir', 'cache_dir', 'bank_dir'):
+        if getattr(args, name) is not None:
+            base[name] = getattr(args, name)
+    try:
+        asyncio.run(serve(base, args.workers, args.socket, args.port, args.host))
+    except (OSError, ValueError) as e:
+        printer(f'ERROR: {e}')
+        sys.exit(1)
@@ -0,0 +1,245 @@
+import dataclasses
+import os
+import subprocess as sp
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from main.api import NoiseSpec, RenderError, probe_ffmpeg
+from main.constants import SAMPLE_RATE
+from main.filters import multirate_sample_rate
+from main.instrument import Instrument
+from main.seed import layer_seeds
+from main.utils import printer
+
+## NumPy (and the synthesizer) is imported once ffmpeg is starting, so the two overlap before the first audio
+if TYPE_CHECKING:
+    import numpy as np
+
+
+STREAM_FORMATS = {  # extension -> ffmpeg muxer and encoder arguments that work without seeking back
+    '.mp3': ('mp3', []),
+    '.aac': ('adts', ['-c:a', 'aac']),
+    '.m4a': ('adts', ['-c:a', 'aac']),  # MP4 needs its index written at the end, so AAC goes out as ADTS
+    '.ogg': ('ogg', ['-c:a', 'libopus']),
+    '.opus': ('ogg', ['-c:a', 'libopus']),
+    '.flac': ('flac', []),
+    '.wav': ('wav', []),
+}
+STREAM_BLOCK = 0.02  # seconds of audio synthesized and written at a time
+STREAM_LEAD = 0.1  # at most this many seconds are synthesized ahead of real time, bounding the buffering
+FIRST_AUDIO_TARGET = 0.2  # seconds from the process start to the first encoded audio
+CALIBRATION_SPANS = 16  # the volume range of an endless pattern is measured over its first spans
+
+
+class EndlessEnvelope:
+    """
+    A dynamic-volume pattern (see `main.envelope.pattern`) that keeps evolving past the track length:
+    the Perlin curve is sampled `nchanges` times per `span` seconds, forever, instead of being fitted to one track.
+    Since the curve's extremes aren't known in advance, its range is measured over the first `CALIBRATION_SPANS`
+    spans and the rest is clipped to `[vol_min, vol_max]`.
+
+    ---
+
+    ## Params
+        - `pattern`: the pattern parameters, including its `seed`
+        - `span`: the seconds covered by `nchanges` points and by `frequency` cycles, i.e. the track length of a file render
+
+    ## Demo
+        >>> env = EndlessEnvelope(pattern(60, seed=1), span=60)
+        >>> env(np.array([0.0, 3600.0]))  # the gains after 0 seconds and after 1 hour
+    """
+
+    def __init__(self, pattern: dict, span: float) -> None:
+        self.pattern = pattern
+        self.step = span / (pattern['nchanges'] - 1)  # seconds between two points
+        self.span = span
+        import numpy as np
+
+        x = np.linspace(0, CALIBRATION_SPANS, 4096*CALIBRATION_SPANS + 1)
+        y = self._curve(x)
+        self._y_min = y.min()
+        self._y_range = y.max() - y.min()
+
+    def _curve(self, x: 'np.ndarray') -> 'np.ndarray':
+        from main.perlin import perlin_1d
+
+        p = self.pattern
+        return perlin_1d(x, p['persistence'], p['octaves'], p['frequency'], p['seed'])
+
+    def __call__(self, t: 'np.ndarray') -> 'np.ndarray':
+        """The gains at the times `t` (seconds, increasing), linearly interpolated between the points like in a file render."""
+        import numpy as np
+
+        k = np.arange(int(t[0] // self.step), int(t[-1] // self.step) + 2)
+        y = self._curve(k*self.step/self.span)
+        p = self.pattern
+        scale = (p['vol_max'] - p['vol_min'])/self._y_range if self._y_range > 0 else 0
+        vol = np.clip(p['vol_min'] + (y - self._y_min)*scale, p['vol_min'], p['vol_max'])
+        return np.interp(t, k*self.step, vol)
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since this process started (Linux only), so the interpreter and import time count too."""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return uptime - start_ticks/os.sysconf('SC_CLK_TCK')
+
+
+def stream_cmd(spec: NoiseSpec, target: str, rate: int = SAMPLE_RATE) -> List[str]:
+    """
+    The ffmpeg command encoding raw float32 from stdin into `target` (`-` for stdout, a path, or an ffmpeg URL),
+    resampled to `SAMPLE_RATE` if it comes at another `rate`.
+    """
+    ext, bitrate = spec.outputs[0]
+    if ext not in STREAM_FORMATS:
+        raise ValueError(f'{ext} can\'t be streamed. Available options are: {", ".join(STREAM_FORMATS)}.')
+    muxer, codec_args = STREAM_FORMATS[ext]
+    out = ['-listen', '1', target] if target.startswith('http://') else ['pipe:1' if target == '-' else target]
+    filters = ([f'aresample={SAMPLE_RATE}'] if rate != SAMPLE_RATE else []) + (['dynaudnorm'] if spec.normalize else [])
+    return [
+        spec.ffmpeg, '-y', '-v', 'error', '-nostats', '-progress', 'pipe:2', '-stats_period', '0.02',
+        '-analyzeduration', '0', '-probesize', '32',  # otherwise ffmpeg buffers seconds of input to analyze it
+        '-f', 'f32le', '-ar', str(rate), '-ch_layout', spec.layout, '-i', 'pipe:0',
+        *(['-af', ','.join(filters)] if filters else []),
+        *codec_args, '-b:a', f'{bitrate}k', '-flush_packets', '1', '-f', muxer, *out
+    ]
+
+
+def stream(
+    spec: NoiseSpec,
+    target: str,
+    log: Callable[[str], None] = printer,
+    instrument: Optional[Instrument] = None,
+    seconds: Optional[float] = None,
+) -> Dict[str, Optional[float]]:
+    """
+    Synthesizes `spec` in real time, without end, into `target` (always with the `numpy` engine).
+    Audio is written at real-time pace, at most `STREAM_LEAD` seconds ahead, so a live listener hears
+    changes quickly and the buffering stays bounded. The dynamic volume keeps evolving (see `EndlessEnvelope`),
+    with `spec.duration` as the span of its pattern. Ends when the reader goes away or on `KeyboardInterrupt`.
+
+    ---
+
+    ## Params
+        - `spec`: what to render; `duration` is the span of the dynamic-volume pattern, the first `output_ext` picks the format
+        - `target`: `-` (stdout), a file or a named pipe, or an ffmpeg URL, e.g. `tcp://0.0.0.0:9000?listen` or `http://0.0.0.0:8000`
+        - `log`: receives the progress messages (use stderr when streaming to stdout)
+        - `instrument`: receives a `latency` event and the `end` event
+        - `seconds`: stop after this much audio, e.g. for a test (default: never)
+
+    ## Returns
+        - `Dict[str, Optional[float]]`: the measured latencies in seconds: `startup` (process start to streaming, Linux only),
+          `first_audio` (streaming to the first encoded audio), and `total`
+
+    ## Demo
+        >>> stream(NoiseSpec(color='pink', output_ext='.mp3'), 'tcp://0.0.0.0:9000?listen')
+    """
+    startup = _process_age()
+    t_start = time.perf_counter()
+
+    ## ffmpeg is the slowest to start, and its command doesn't depend on the planned volume, so it starts first;
+    ## resolving the spec (which plans the volume), importing NumPy, and setting up the synthesizer happen meanwhile
+    probe_ffmpeg(spec.ffmpeg)
+    rate = multirate_sample_rate(spec.color.lower(), spec.lowpass) if spec.multirate else SAMPLE_RATE
+    proc = sp.Popen(stream_cmd(spec, target, rate), stdin=sp.PIPE, stderr=sp.PIPE, bufsize=0)
+    try:
+        spec = dataclasses.replace(spec.resolve(), engine='numpy')
+        spec.validate(output=False)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    from main.synth import Synth
+
+    envelopes = None
+    if spec.dyn_vol is not None:
+        shared = {}  # a pattern object shared by several channels gets one curve
+        for pattern in spec.dyn_vol:
+            if id(pattern) not in shared:
+                shared[id(pattern)] = EndlessEnvelope(pattern, spec.duration)
+        envelopes = [shared[id(pattern)] for pattern in spec.dyn_vol]
+    synth = Synth(
+        spec.color, layer_seeds(spec.seed, spec.nchannel, spec.nlayer), spec.highpass, spec.lowpass, spec.volume, envelopes,
+        sample_rate=rate
+    )
+
+    instrument = instrument or Instrument()
+    latency = {'startup': startup, 'first_audio': None, 'total': None}
+    first_audio = threading.Event()
+    errors = []
+
+    def read_progress(stream):
+        for raw in stream:
+            line = raw.decode(errors='replace').strip()
+            if line.startswith('out_time_us='):
+                if (not first_audio.is_set()) and line[12:].isdigit() and int(line[12:]) > 0:
+                    latency['first_audio'] = time.perf_counter() - t_start
+                    first_audio.set()
+            elif line and ('=' not in line):  # error messages
+                errors.append(line)
+
+    reader = threading.Thread(target=read_progress, args=(proc.stderr,), daemon=True)
+    reader.start()
+    log(f'INFO: Streaming {spec.nchannel}x{spec.nlayer} {spec.color} noise to {target} (seed {spec.seed})...')
+
+    block = round(STREAM_BLOCK*rate)
+    total = None if seconds is None else round(seconds*rate)
+    sent = 0
+    reader_gone = False
+    t0 = time.perf_counter()
+    try:
+        while (total is None) or (sent < total):
+            n = block if total is None else min(block, total - sent)
+            proc.stdin.write(synth.render(n).data)
+            sent += n
+
+            if first_audio.is_set() and latency['total'] is None:
+                latency['total'] = None if startup is None else startup + latency['first_audio']
+                log(
+                    f'INFO: First audio after {latency["first_audio"]*1000:.0f} ms'
+                    + ('' if startup is None else f' ({startup*1000:.0f} ms of startup before that)')
+                )
+                if (latency['total'] or latency['first_audio']) > FIRST_AUDIO_TARGET:
+                    log(f'WARNING: The first audio took longer than the {FIRST_AUDIO_TARGET*1000:.0f} ms target.')
+                instrument.emit({'event': 'latency', **{k: (None if v is None else round(v, 4)) for k, v in latency.items()}})
+
+            ## real-time pace; after a stall (e.g. a slow network reader) the clock is reset instead of catching up in a burst
+            ahead = sent/rate - (time.perf_counter() - t0)
+            if ahead > STREAM_LEAD:
+                time.sleep(ahead - STREAM_LEAD)
+            elif ahead < -STREAM_LEAD:
+                t0 = time.perf_counter() - sent/rate
+    except BrokenPipeError:  # ffmpeg exited: the reader went away, or ffmpeg failed (checked below)
+        reader.join(timeout=1)
+        reader_gone = any(('Broken pipe' in line) or ('Connection reset' in line) for line in errors)
+    except KeyboardInterrupt:
+        log('INFO: Stopping the stream...')
+    except BaseException:
+        instrument.end(ok=False)
+        raise
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            proc.wait(timeout=5)
+        except sp.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        reader.join(timeout=1)
+
+    if reader_gone:
+        log('INFO: The reader closed the stream.')
+    elif proc.returncode != 0:
+        instrument.end(ok=False)
+        raise RenderError('\n'.join(errors) or f'ffmpeg exit status {proc.returncode}')
+    instrument.end(ok=True)
+    log(f'INFO: Streamed {sent/rate:.1f} seconds.')
+    return latency
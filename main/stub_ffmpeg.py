@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+A stand-in for ffmpeg that renders nothing: it drains piped input and writes empty outputs.
+It lets `python noise_gen bench suite --stub` measure the pipeline's own overhead (process spawning,
+scheduling, scratch handling, NumPy synthesis) on machines without ffmpeg.
+"""
+import os
+import shutil
+import sys
+
+
+## options that don't take a value; every other option is assumed to take one
+_FLAGS = {'-y', '-n', '-stats', '-nostats', '-nostdin', '-hide_banner', '-shortest'}
+
+
+def main(argv) -> int:
+    if argv[:1] == ['-version']:
+        print('ffmpeg version stub')
+        return 0
+    if argv[-1:] == ['-filters']:
+        for name in ('anoisesrc', 'amix', 'amerge', 'channelmap', 'highpass', 'lowpass', 'volume', 'dynaudnorm'):
+            print(f' ... {name:<16} N->A       stub')
+        return 0
+
+    inputs = []
+    outputs = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == '-i':
+            inputs.append(argv[i + 1])
+            i += 2
+        elif arg.startswith('-') and (arg != '-') and (arg not in _FLAGS):
+            i += 2
+        elif arg in _FLAGS:
+            i += 1
+        else:
+            outputs.append(arg)
+            i += 1
+
+    if 'pipe:0' in inputs or '-' in inputs:
+        with open(os.devnull, 'wb') as f:
+            shutil.copyfileobj(sys.stdin.buffer, f)
+    for pth in outputs:
+        if pth not in ('-', 'pipe:1'):
+            open(pth, 'wb').close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
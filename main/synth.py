@@ -0,0 +1,245 @@
+import math
+from typing import Callable, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from main.constants import SAMPLE_RATE
+from main.filters import COLOR_SECTIONS, VELVET_DENSITY, multirate_sample_rate, rbj_coefs  # `multirate_sample_rate` is re-exported
+
+
+BLOCK_FRAMES = 2**16  # frames synthesized per `Synth.render` iteration
+
+
+def _onepole(u: np.ndarray, a: complex, zi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized first-order recurrence `y[n] = a*y[n-1] + u[n]` along the last axis.
+
+    Rows of `L` samples are solved at once as `a**k * cumsum(u * a**-k)`, with `L` small enough
+    for `a**-L` to stay finite; the state carried between rows is the same recurrence with `a**L`,
+    which is solved recursively and becomes negligible after one or two levels.
+
+    ---
+
+    ## Params
+        - `u`: input, any leading shape
+        - `a`: the pole (`abs(a) < 1`), real or complex
+        - `zi`: `y[-1]`, shaped like `u` without its last axis
+
+    ## Returns
+        - `Tuple[np.ndarray, np.ndarray]`: `y`, and its last sample to be passed as the next `zi`
+    """
+    n = u.shape[-1]
+    if abs(a) < 1e-20:  # no memory
+        y = u + 0*zi[..., None]
+        return y, y[..., -1]
+
+    L = max(2, min(4096, math.ceil(46 / -math.log(abs(a)))))  # `abs(a)**L` ~ 1e-20
+    nrow = -(-n // L)
+    k = np.arange(L if nrow > 1 else n)
+    p = np.power(a, k)
+
+    U = u if nrow == 1 else np.pad(u, [(0, 0)]*(u.ndim - 1) + [(0, nrow*L - n)]).reshape(*u.shape[:-1], nrow, L)
+    Y = p * np.cumsum(U / p, axis=-1)  # zero initial state per row
+    if nrow == 1:
+        Y += (a*p) * zi[..., None]
+        return Y, Y[..., -1]
+
+    A = a**L
+    if abs(A) < 1e-20:  # rows don't reach past their successor
+        c = Y[..., :, -1].copy()
+        c[..., 0] += A*zi
+    else:
+        c, _ = _onepole(Y[..., :, -1], A, zi)
+    Y += (a*p) * np.concatenate([zi[..., None], c[..., :-1]], axis=-1)[..., None]
+    y = Y.reshape(*u.shape[:-1], nrow*L)[..., :n]
+    return y, y[..., -1]
+
+
+def _resample_sections(sections: tuple, ratio: float) -> tuple:
+    """
+    The color filter `sections` (defined per sample at `SAMPLE_RATE`) for a rate `ratio` times lower, keeping their spectrum in Hz
+    below the new Nyquist frequency: each pole keeps its corner frequency (`a**ratio`) and its DC gain, and the parts acting
+    only near the original Nyquist frequency (negative poles, the one-sample delay) are reduced to their DC gain.
+    """
+    a, c, d0, d1, gain = sections
+    new_a = tuple(ai**ratio if ai > 0 else 0.0 for ai in a)
+    new_c = tuple(ci*(1 - new_ai)/(1 - ai) for ai, ci, new_ai in zip(a, c, new_a))
+    return (new_a, new_c, d0 + d1, 0.0, gain)
+
+
+class _Biquad:
+    """A biquad split into a direct term and two one-pole sections, so it can run on `_onepole`."""
+
+    def __init__(self, coefs: Sequence[float], shape: Tuple[int, ...]) -> None:
+        b0, b1, b2, a1, a2 = coefs
+        p1, p2 = np.roots([1, a1, a2]).astype(complex)
+        self.k = b2/a2
+        n0 = b0 - self.k
+        n1 = b1 - self.k*a1
+        r1 = (n0*p1 + n1)/(p1 - p2)
+        self.poles = (p1, p2)
+        self.residues = (r1, n0 - r1)
+        self.conjugate = bool(np.isclose(p1, np.conj(p2)) and p1.imag != 0)
+        self.zi = [np.zeros(shape, complex), np.zeros(shape, complex)]
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        if self.conjugate:  # the second section is the complex conjugate of the first
+            y1, self.zi[0] = _onepole(x, self.poles[0], self.zi[0])
+            return self.k*x + 2*(self.residues[0]*y1).real
+        y = self.k*x
+        for i in range(2):
+            yi, self.zi[i] = _onepole(x, self.poles[i], self.zi[i])
+            y = y + (self.residues[i]*yi).real
+        return y
+
+
+class Synth:
+    """
+    In-process replacement for the `anoisesrc` -> `amix` -> `highpass` -> `lowpass` -> `volume` chain.
+    Audio is produced block by block; all filter states carry over between blocks.
+
+    ---
+
+    ## Params
+        - `color`: one of white, pink, brown, blue, violet, velvet
+        - `seeds`: one list of layer seeds per channel
+        - `highpass`, `lowpass`: the band edges in Hz
+        - `volume`: the volume amplification applied after mixing
+        - `envelopes`: optional dynamic volume per channel: points `[(t, vol), ...]`, or a function of the time in seconds
+          (e.g. `main.stream.EndlessEnvelope`)
+        - `sample_rate`: the rate to synthesize at; below `SAMPLE_RATE`, the noise keeps the spectrum it has at `SAMPLE_RATE`
+          up to the new Nyquist frequency, and must be resampled to `SAMPLE_RATE` afterwards (see `multirate_sample_rate`)
+
+    ## Demo
+        >>> synth = Synth('brown', [[1, 2, 3], [4, 5, 6]], 20, 432, 2)
+        >>> block = synth.render(48000)  # 1 second, float32, shape (48000, 2)
+        >>> for block in synth.blocks(48000*3600):  # the next hour, without holding it in memory
+        ...     encoder.stdin.write(block.data)
+    """
+
+    def __init__(
+        self,
+        color: str,
+        seeds: Sequence[Sequence[int]],
+        highpass: float,
+        lowpass: float,
+        volume: float,
+        envelopes: Optional[Sequence[Union[None, Sequence[Tuple[float, float]], Callable[[np.ndarray], np.ndarray]]]] = None,
+        sample_rate: int = SAMPLE_RATE,
+    ) -> None:
+        self.color = color
+        self.nchannel = len(seeds)
+        self.nlayer = len(seeds[0])
+        self.volume = volume
+        self.sample_rate = sample_rate
+        self.pos = 0  # frames rendered so far
+
+        self._rngs = [[np.random.default_rng(seed) for seed in row] for row in seeds]
+
+        if color == 'velvet':
+            self._sections = ((), (), 1.0, 0.0, 1.0)
+            self._w_prev = None
+        else:
+            self._sections = COLOR_SECTIONS[color]
+            self._w_prev = np.zeros(self.nchannel)
+        self._white_gain = 1.0
+        if sample_rate != SAMPLE_RATE:
+            ## the same power per Hz as at `SAMPLE_RATE`, in a narrower band
+            self._white_gain = math.sqrt(sample_rate/SAMPLE_RATE)
+            if color != 'velvet':
+                self._sections = _resample_sections(self._sections, SAMPLE_RATE/sample_rate)
+        self._zi = [np.zeros(self.nchannel) for _ in self._sections[0]]
+
+        shape = (self.nchannel,)
+        self._highpass = _Biquad(rbj_coefs('highpass', highpass, sample_rate), shape)
+        self._lowpass = _Biquad(rbj_coefs('lowpass', lowpass, sample_rate), shape)
+
+        self._envelopes = None
+        if envelopes is not None and any(env for env in envelopes):
+            self._envelopes = [
+                (None if not env else env if callable(env) else (np.array([t for t, _ in env]), np.array([v for _, v in env])))
+                for env in envelopes
+            ]
+
+    def _white(self, n: int) -> np.ndarray:
+        """Uniform white noise in [-1, 1), shape `(nchannel, nlayer, n)`."""
+        white = np.empty((self.nchannel, self.nlayer, n))
+        for ch, row in enumerate(self._rngs):
+            for i, rng in enumerate(row):
+                rng.random(out=white[ch, i])
+        white *= 2
+        white -= 1
+        return white
+
+    def _mix(self, n: int) -> np.ndarray:
+        """The colored layers mixed like `amix` (mean of the layers), shape `(nchannel, n)`."""
+        white = self._white(n)
+
+        if self.color == 'velvet':
+            ## each layer is a sparse train of +/-1 impulses, so it can't be mixed before coloring
+            return np.where(np.abs(white) < VELVET_DENSITY, np.sign(white), 0.0).mean(axis=1)
+
+        ## the color filters are linear, so the layers are mixed first and colored once per channel
+        w = white.mean(axis=1)
+        if self._white_gain != 1:
+            w *= self._white_gain
+        a, c, d0, d1, gain = self._sections
+        y = d0*w
+        if d1:
+            y[:, 0] += d1*self._w_prev
+            y[:, 1:] += d1*w[:, :-1]
+            self._w_prev = w[:, -1].copy()
+        for i in range(len(a)):
+            yi, self._zi[i] = _onepole(c[i]*w, a[i], self._zi[i])
+            y += yi
+        return gain*y
+
+    def render(self, nframes: int) -> np.ndarray:
+        """Renders the next `nframes` frames as interleaved float32, shape `(nframes, nchannel)`."""
+        out = np.empty((nframes, self.nchannel), np.float32)
+        for start in range(0, nframes, BLOCK_FRAMES):
+            n = min(BLOCK_FRAMES, nframes - start)
+            y = self._lowpass(self._highpass(self._mix(n)))*self.volume
+            if self._envelopes is not None:
+                t = (self.pos + np.arange(n))/self.sample_rate
+                for ch, env in enumerate(self._envelopes):
+                    if callable(env):
+                        y[ch] *= env(t)
+                    elif env is not None:
+                        y[ch] *= np.interp(t, *env)
+            out[start:start + n] = y.T
+            self.pos += n
+        return out
+
+    def get_state(self) -> dict:
+        """
+        Everything carried over between blocks (position, random generators, and filter states) as plain JSON values,
+        so a render can stop and later continue exactly where it was (see `set_state` and `main.checkpoint`).
+        """
+        return {
+            'pos': self.pos,
+            'rngs': [[rng.bit_generator.state for rng in row] for row in self._rngs],
+            'w_prev': None if self._w_prev is None else self._w_prev.tolist(),
+            'zi': [zi.tolist() for zi in self._zi],
+            'biquads': [[[zi.real.tolist(), zi.imag.tolist()] for zi in biquad.zi] for biquad in (self._highpass, self._lowpass)],
+        }
+
+    def set_state(self, state: dict) -> None:
+        """Restores a state returned by `get_state` of a `Synth` built with the same arguments; the next block continues bit-exactly."""
+        self.pos = state['pos']
+        for row, row_states in zip(self._rngs, state['rngs']):
+            for rng, rng_state in zip(row, row_states):
+                rng.bit_generator.state = rng_state
+        if state['w_prev'] is not None:
+            self._w_prev = np.array(state['w_prev'])
+        self._zi = [np.array(zi) for zi in state['zi']]
+        for biquad, zis in zip((self._highpass, self._lowpass), state['biquads']):
+            biquad.zi = [np.array(real) + 1j*np.array(imag) for real, imag in zis]
+
+    def blocks(self, nframes: int) -> Iterator[np.ndarray]:
+        """
+        Renders the next `nframes` frames as a stream of `BLOCK_FRAMES`-long blocks (the last one may be shorter),
+        so memory use doesn't depend on the track length.
+        """
+        for start in range(0, nframes, BLOCK_FRAMES):
+            yield self.render(min(BLOCK_FRAMES, nframes - start))
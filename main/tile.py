@@ -0,0 +1,41 @@
+import numpy as np
+
+
+TILE_CROSSFADE = 5  # seconds of the loop seam blended together, at most a quarter of the tile
+
+
+def crossfade_duration(tile: float) -> float:
+    """The extra seconds rendered past the end of a `tile`-second loop, blended into its start by `make_seamless`."""
+    return min(TILE_CROSSFADE, tile/4)
+
+
+def make_seamless(pth: str, nchannel: int, nframes: int, block_frames: int = 2**16) -> None:
+    """
+    Turns a raw float32 render longer than `nframes` into a loop of exactly `nframes` frames, in place:
+    the frames past the end are crossfaded into the start, so the last frame runs into the first one
+    as if the render had simply continued, and the file is truncated.
+    The layers are uncorrelated noise, so equal-power curves keep the loudness flat across the seam.
+
+    ---
+
+    ## Params
+        - `pth`: the interleaved float32 file, e.g. written by ffmpeg with `-f f32le`
+        - `nchannel`: number of interleaved channels
+        - `nframes`: the loop length in frames
+        - `block_frames`: frames blended at a time, so the memory use doesn't depend on the crossfade length
+    """
+    data = np.memmap(pth, dtype=np.float32, mode='r+')
+    data = data.reshape(-1, nchannel)
+    nfade = len(data) - nframes
+    if nfade <= 0:
+        raise ValueError(f'The tile render is too short to loop ({len(data)} frames, expected more than {nframes}).')
+
+    for start in range(0, nfade, block_frames):
+        stop = min(nfade, start + block_frames)
+        phase = ((np.arange(start, stop) + 0.5) / nfade * (np.pi/2))[:, None]
+        data[start:stop] = data[start:stop]*np.sin(phase) + data[nframes + start:nframes + stop]*np.cos(phase)
+    data.flush()
+    del data
+
+    with open(pth, 'r+b') as f:
+        f.truncate(nframes * nchannel * 4)
@@ -1,4 +1,15 @@
+import datetime
 import string
+import sys
+
+
+def printer(__msg: str, /) -> None:
+    print(f'[{datetime.datetime.now().strftime("%H:%M:%S")}] {__msg}\n', end='')  # a single write, so lines from concurrent jobs don't interleave
+
+
+def eprinter(__msg: str, /) -> None:
+    """`printer` to stderr, for when stdout carries data (e.g. a stream)."""
+    print(f'[{datetime.datetime.now().strftime("%H:%M:%S")}] {__msg}\n', end='', file=sys.stderr)
 
 
 def validate_filename(filename: str) -> str:
@@ -22,3 +33,26 @@ def validate_filename(filename: str) -> str:
     valid_chars = f"-_.() {string.ascii_letters}{string.digits}"
     filename = ''.join(c for c in filename if c in valid_chars)
     return filename
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses a human-readable byte size, with an optional binary suffix (K, M, G, T).
+
+    ---
+
+    ## Params
+        - `size`: e.g. `'1073741824'`, `'512M'`, `'10G'`
+
+    ## Returns
+        - `int`: the size in bytes
+
+    ## Demo
+        >>> parse_size('10G')
+        10737418240
+    """
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+    size = size.strip().upper().removesuffix('B')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
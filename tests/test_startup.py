@@ -0,0 +1,29 @@
+"""
+Startup regression check, the same as `python noise_gen bench startup` without the ffmpeg probe.
+
+## Demo
+    $ python -m unittest discover -s tests
+"""
+import unittest
+
+from main.bench import STARTUP_BUDGET_MS, bench_startup
+
+
+class TestStartup(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.result = bench_startup(repeat=5, ffmpeg=None, log=lambda msg: None)
+
+    def test_import_cost(self) -> None:
+        self.assertLessEqual(
+            self.result['import_cost_ms'], STARTUP_BUDGET_MS,
+            f'`import main.main` adds {self.result["import_cost_ms"]} ms to the interpreter startup'
+        )
+
+    def test_no_heavy_modules(self) -> None:
+        self.assertEqual(self.result['heavy_modules'], [], '`import main.main` pulls in modules only some commands need')
+
+
+if __name__ == '__main__':
+    unittest.main()